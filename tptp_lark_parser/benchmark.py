@@ -0,0 +1,417 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Benchmark
+==========
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from tptp_lark_parser.grammar import Clause, Literal
+from tptp_lark_parser.problem_header import scan_header
+from tptp_lark_parser.synthetic_tptp import (
+    SyntheticSettings,
+    write_synthetic_problem,
+)
+from tptp_lark_parser.term_index import LiteralIndex, unifiable
+from tptp_lark_parser.tptp_parser import TPTPParser
+
+# problem shapes stressing different parts of the parser
+SCENARIOS: Dict[str, SyntheticSettings] = {
+    "plain": SyntheticSettings(),
+    "long_clauses": SyntheticSettings(clauses=10, literals=50),
+    "deep_terms": SyntheticSettings(clauses=50, term_depth=30, arity=1),
+    "wide_terms": SyntheticSettings(clauses=50, term_depth=1, arity=10),
+    "annotated": SyntheticSettings(annotation_size=20),
+    "includes": SyntheticSettings(clauses=10, includes=10),
+}
+# timed phases (in seconds)
+PHASES = (
+    "parse",
+    "lark",
+    "transform",
+    "pretty_print",
+    "index_insert",
+    "index_unifiable",
+    "scan_unifiable",
+)
+# measurements compared to a baseline (the lower, the better)
+COMPARED = PHASES + ("peak_memory",)
+Results = Dict[str, Dict[str, float]]
+
+
+def _best_time(function: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _peak_memory(function: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _build_index(literals: Sequence[Literal]) -> LiteralIndex[int]:
+    index: LiteralIndex[int] = LiteralIndex()
+    for position, literal in enumerate(literals):
+        index.insert(literal, position)
+    return index
+
+
+def _partners(
+    index: LiteralIndex[int],
+    literals: Sequence[Literal],
+    queries: Sequence[Literal],
+) -> List[List[int]]:
+    return [
+        [
+            position
+            for position in index.unifiable(query)
+            if unifiable(query, literals[position])
+        ]
+        for query in queries
+    ]
+
+
+def benchmark_term_index(
+    clauses: Sequence[Clause], repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Measure finding resolution partners with a literal index and without.
+
+    All literals of the clauses are put in a ``LiteralIndex``
+    (``index_insert``). Then, for each literal, we find the literals of the
+    opposite sign unifiable with it: by checking the candidates retrieved
+    from the index (``index_unifiable``), and by checking all the literals
+    (``scan_unifiable``). Times are the best of ``repeat`` runs.
+
+    >>> from tptp_lark_parser.synthetic_tptp import synthetic_clauses
+    >>> clauses = TPTPParser(extendable=True).parse(synthetic_clauses(
+    ...     SyntheticSettings(clauses=30, term_depth=1, symbols=3)
+    ... ))
+    >>> results = benchmark_term_index(clauses, repeat=1)
+    >>> results["literals"], results["candidates"], results["partners"]
+    (90, 36, 22)
+    >>> literals = [
+    ...     literal for clause in clauses for literal in clause.literals
+    ... ]
+    >>> results["partners"] == sum(
+    ...     unifiable(Literal(not first.negated, first.atom), second)
+    ...     for first in literals
+    ...     for second in literals
+    ... )
+    True
+
+    :param clauses: clauses to index
+    :param repeat: how many times to run each phase
+    :returns: the numbers of literals, candidates retrieved, and partners
+        found, and times of the phases
+    """
+    literals = [literal for clause in clauses for literal in clause.literals]
+    queries = [
+        Literal(not literal.negated, literal.atom) for literal in literals
+    ]
+    index = _build_index(literals)
+    return {
+        "literals": len(literals),
+        "candidates": sum(len(index.unifiable(query)) for query in queries),
+        "partners": sum(map(len, _partners(index, literals, queries))),
+        "index_insert": _best_time(lambda: _build_index(literals), repeat),
+        "index_unifiable": _best_time(
+            lambda: _partners(index, literals, queries), repeat
+        ),
+        "scan_unifiable": _best_time(
+            lambda: [
+                [
+                    position
+                    for position, literal in enumerate(literals)
+                    if unifiable(query, literal)
+                ]
+                for query in queries
+            ],
+            repeat,
+        ),
+    }
+
+
+def _phase_times(
+    tptp_parser: TPTPParser,
+    texts: Sequence[str],
+    clauses: Sequence[Clause],
+    repeat: int,
+) -> Dict[str, float]:
+    formulae = [
+        formula
+        for text in texts
+        for formula in tptp_parser.parser.parse(text).find_data(
+            "cnf_annotated"
+        )
+    ]
+    return {
+        "parse": _best_time(lambda: tptp_parser.parse(texts[0]), repeat),
+        "lark": _best_time(
+            lambda: [tptp_parser.parser.parse(text) for text in texts], repeat
+        ),
+        "transform": _best_time(
+            lambda: [
+                tptp_parser.cnf_parser.transform(formula)
+                for formula in formulae
+            ],
+            repeat,
+        ),
+        "pretty_print": _best_time(
+            lambda: [
+                tptp_parser.cnf_parser.pretty_print(clause)
+                for clause in clauses
+            ],
+            repeat,
+        ),
+        **benchmark_term_index(clauses, repeat),
+    }
+
+
+def benchmark_problem(
+    tptp_folder: str, problem: str, repeat: int = 3
+) -> Dict[str, float]:
+    """
+    Measure parsing of a problem.
+
+    ``parse`` is the time of ``TPTPParser.parse`` (with included files).
+    ``lark``, ``transform`` and ``pretty_print`` are the times of its
+    phases: building parse trees of the problem and the included files,
+    transforming them to clauses by ``CNFParser.transform`` and printing
+    the clauses back. ``index_insert``, ``index_unifiable`` and
+    ``scan_unifiable`` measure finding resolution partners among the
+    clauses (see ``benchmark_term_index``). Times are the best of ``repeat``
+    runs, and the peak
+    memory is the maximal size of memory blocks allocated during parsing
+    (as traced by ``tracemalloc``).
+
+    >>> temp_folder = str(getfixture("tmp_path"))  # noqa: F821
+    >>> problem = write_synthetic_problem(
+    ...     temp_folder, SyntheticSettings(clauses=5, includes=1)
+    ... )[0]
+    >>> results = benchmark_problem(temp_folder, problem, repeat=1)
+    >>> results["clauses"], results["bytes"]
+    (10, 1944)
+    >>> all(results[measurement] > 0 for measurement in COMPARED)
+    True
+    >>> results["clauses_per_second"] == 10 / results["parse"]
+    True
+
+    :param tptp_folder: a TPTP folder (or an archive)
+    :param problem: a problem file name relative to the root
+    :param repeat: how many times to run each phase
+    :returns: the numbers of clauses and bytes, times of the phases,
+        throughput and peak memory
+    """
+    with TPTPParser(
+        tptp_folder, True, None, include_cache_size=0
+    ) as tptp_parser:
+        problem_text = tptp_parser.file_source.read_text(problem)
+        texts = [problem_text] + [
+            tptp_parser.file_source.read_text(include)
+            for include in scan_header(problem_text.splitlines()).includes
+        ]
+        clauses = tptp_parser.parse(problem_text)
+        results: Dict[str, float] = {
+            "clauses": len(clauses),
+            "bytes": sum(len(text.encode("utf-8")) for text in texts),
+            "peak_memory": _peak_memory(
+                lambda: tptp_parser.parse(problem_text)
+            ),
+        }
+        results.update(_phase_times(tptp_parser, texts, clauses, repeat))
+    results["clauses_per_second"] = results["clauses"] / results["parse"]
+    results["bytes_per_second"] = results["bytes"] / results["parse"]
+    return results
+
+
+def run_benchmarks(
+    folder: str,
+    scenarios: Optional[Dict[str, SyntheticSettings]] = None,
+    repeat: int = 3,
+    scale: float = 1.0,
+) -> Results:
+    """
+    Generate synthetic problems and measure parsing of them.
+
+    :param folder: where to write the problems
+    :param scenarios: problem shapes by names (``SCENARIOS`` by default)
+    :param repeat: how many times to run each phase
+    :param scale: a multiplier of the numbers of clauses
+    :returns: measurements by scenario names
+    """
+    results: Results = {}
+    for index, (name, settings) in enumerate((scenarios or SCENARIOS).items()):
+        problem = write_synthetic_problem(
+            folder,
+            replace(settings, clauses=max(1, round(settings.clauses * scale))),
+            f"BEN{index:03}-1",
+        )[0]
+        results[name] = benchmark_problem(folder, problem, repeat)
+    return results
+
+
+def compare(
+    results: Results, baseline: Results, tolerance: float = 0.2
+) -> List[str]:
+    """
+    Find regressions.
+
+    >>> baseline = {"plain": {"parse": 1.0, "peak_memory": 100}}
+    >>> compare({"plain": {"parse": 1.1, "peak_memory": 200}}, baseline)
+    ['plain peak_memory: 100 -> 200']
+    >>> compare({"new": {"parse": 1.0}}, baseline)
+    []
+
+    :param results: new measurements
+    :param baseline: old measurements
+    :param tolerance: a relative growth of time or memory to ignore
+    :returns: descriptions of the measurements grown more than tolerated
+        (those missing from the baseline are not compared)
+    """
+    return [
+        f"{name} {measurement}: {old:.3g} -> {new:.3g}"
+        for name, measurements in results.items()
+        for measurement, new in measurements.items()
+        if measurement in COMPARED
+        for old in (baseline.get(name, {}).get(measurement),)
+        if old is not None and new > old * (1 + tolerance)
+    ]
+
+
+def format_results(results: Results) -> str:
+    """
+    Format measurements as a table.
+
+    >>> print(format_results({"plain": {
+    ...     "clauses_per_second": 2000, "bytes_per_second": 200000,
+    ...     "parse": 0.05, "lark": 0.03, "transform": 0.01,
+    ...     "pretty_print": 0.001, "index_insert": 0.002,
+    ...     "index_unifiable": 0.003, "scan_unifiable": 0.3,
+    ...     "peak_memory": 2 ** 20
+    ... }}))
+    scenario       clauses/s   KiB/s  parse,ms   lark,ms  transform,ms...
+    plain               2000     195     50.00     30.00         10.00...
+
+    :param results: measurements by scenario names
+    :returns: a table with a row per scenario
+    """
+    lines = [
+        f"{'scenario':12} {'clauses/s':>12} {'KiB/s':>7}"
+        + "".join(f" {phase + ',ms':>{len(phase) + 4}}" for phase in PHASES)
+        + f" {'peak,KiB':>9}"
+    ]
+    for name, measurements in results.items():
+        lines.append(
+            f"{name:12} {measurements['clauses_per_second']:12.0f}"
+            f" {measurements['bytes_per_second'] / 1024:7.0f}"
+            + "".join(
+                f" {measurements[phase] * 1000:{len(phase) + 4}.2f}"
+                for phase in PHASES
+            )
+            + f" {measurements['peak_memory'] / 1024:9.0f}"
+        )
+    return "\n".join(lines)
+
+
+def _parse_arguments(args: Optional[Sequence[str]]) -> argparse.Namespace:
+    argument_parser = argparse.ArgumentParser(
+        description="Measure parsing of synthetic TPTP problems"
+    )
+    argument_parser.add_argument("--repeat", type=int, default=3)
+    argument_parser.add_argument(
+        "--scale", type=float, default=1.0, help="a multiplier of clauses"
+    )
+    argument_parser.add_argument("--save", help="a file to save results to")
+    argument_parser.add_argument(
+        "--compare", help="a file with baseline results"
+    )
+    argument_parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="a relative growth of time or memory to ignore",
+    )
+    return argument_parser.parse_args(args)
+
+
+def _report_regressions(
+    results: Results, baseline_filename: str, tolerance: float
+) -> int:
+    with open(baseline_filename, "r", encoding="utf-8") as baseline_file:
+        regressions = compare(results, json.load(baseline_file), tolerance)
+    if regressions:
+        print("Regressions:", *regressions, sep="\n")
+    return int(bool(regressions))
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    """
+    Run the benchmarks, print the results and compare them to a baseline.
+
+    It's the entry point of ``python -m tptp_lark_parser.benchmark`` (run it
+    with ``--help`` to see the options).
+
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> baseline = str(temp_folder / "baseline.json")
+    >>> main(["--scale", "0.05", "--repeat", "1", "--save", baseline])
+    scenario ...
+    plain ...
+    includes ...
+    0
+    >>> main([
+    ...     "--scale", "0.05", "--repeat", "1", "--compare", baseline,
+    ...     "--tolerance", "-1"
+    ... ])
+    scenario ...
+    Regressions:
+    ...
+    1
+
+    :param args: command line arguments (``sys.argv`` by default)
+    :returns: ``1`` if there are regressions, ``0`` otherwise
+    """
+    arguments = _parse_arguments(args)
+    with tempfile.TemporaryDirectory() as folder:
+        results = run_benchmarks(
+            folder, repeat=arguments.repeat, scale=arguments.scale
+        )
+    print(format_results(results))
+    if arguments.save:
+        with open(arguments.save, "w", encoding="utf-8") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if not arguments.compare:
+        return 0
+    return _report_regressions(results, arguments.compare, arguments.tolerance)
+
+
+if __name__ == "__main__":
+    sys.exit(main())  # pragma: no cover
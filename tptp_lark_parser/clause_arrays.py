@@ -0,0 +1,243 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Clause Arrays
+==============
+"""
+from array import array
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from tptp_lark_parser.grammar import (
+    Clause,
+    Function,
+    Literal,
+    Predicate,
+    Variable,
+)
+
+# kinds of nodes
+VARIABLE, FUNCTION, PREDICATE = range(3)
+_KINDS = {Variable: VARIABLE, Function: FUNCTION, Predicate: PREDICATE}
+# names of integer columns
+COLUMNS = (
+    "kinds",
+    "symbols",
+    "arities",
+    "subtree_sizes",
+    "negated",
+    "literal_offsets",
+    "clause_offsets",
+)
+
+
+def _pre_order(atom: Predicate) -> List[Any]:
+    nodes: List[Any] = []
+    stack: List[Any] = [atom]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(reversed(getattr(node, "arguments", ())))
+    return nodes
+
+
+def _subtree_sizes(arities: Sequence[int]) -> List[int]:
+    # going backwards, the subtrees of a node's arguments are already seen
+    sizes: List[int] = []
+    stack: List[int] = []
+    for arity in reversed(arities):
+        size = 1 + sum(stack[len(stack) - arity :])
+        del stack[len(stack) - arity :]
+        stack.append(size)
+        sizes.append(size)
+    sizes.reverse()
+    return sizes
+
+
+def _node(kind: int, symbol: int, arguments: Tuple[Any, ...]) -> Any:
+    if kind == VARIABLE:
+        return Variable(symbol)
+    if kind == FUNCTION:
+        return Function(symbol, arguments)
+    return Predicate(symbol, arguments)
+
+
+def _int_array() -> "array[int]":
+    return array("i")
+
+
+def _offsets() -> "array[int]":
+    return array("i", (0,))
+
+
+@dataclass
+class ClauseArrays:  # pylint: disable=too-many-instance-attributes
+    """
+    A batch of clauses as flat integer arrays.
+
+    .. _clause-arrays:
+
+    Nodes (predicates, functions and variables) of all literals are listed
+    in pre-order. Every node has a kind (``PREDICATE``, ``FUNCTION`` or
+    ``VARIABLE``), a symbol ID (or a variable's index), an arity, and a
+    size of its subtree (so the node's next sibling is
+    ``i + subtree_sizes[i]``). Literal ``j`` is negated if ``negated[j]``
+    and spans the nodes from ``literal_offsets[j]`` to
+    ``literal_offsets[j + 1]``. Clause ``k`` spans the literals from
+    ``clause_offsets[k]`` to ``clause_offsets[k + 1]``. Labels, roles and
+    inference records are kept in ``headers`` (clauses without literals).
+
+    >>> clauses = [
+    ...     Clause(
+    ...         (
+    ...             Literal(False, Predicate(1, (
+    ...                 Function(0, (Variable(0),)), Variable(1)
+    ...             ))),
+    ...             Literal(True, Predicate(2, ())),
+    ...         ),
+    ...         "a",
+    ...     ),
+    ...     Clause((), "empty", inference_rule="r", inference_parents=("a",)),
+    ... ]
+    >>> clause_arrays = ClauseArrays.from_clauses(clauses)
+    >>> len(clause_arrays)
+    2
+    >>> for name in COLUMNS:
+    ...     print(name, getattr(clause_arrays, name).tolist())
+    kinds [2, 1, 0, 0, 2]
+    symbols [1, 0, 0, 1, 2]
+    arities [2, 1, 0, 0, 0]
+    subtree_sizes [4, 2, 1, 1, 1]
+    negated [0, 1]
+    literal_offsets [0, 4, 5]
+    clause_offsets [0, 2, 2]
+    >>> clause_arrays.to_clauses() == clauses
+    True
+
+    Columns can be read by NumPy without copying
+
+    >>> columns = clause_arrays.to_numpy()
+    >>> columns["symbols"][columns["kinds"] == FUNCTION]
+    array([0], dtype=int32)
+
+    Deep terms don't hit the recursion limit
+
+    >>> term = Variable(0)
+    >>> for _ in range(5000):
+    ...     term = Function(0, (term,))
+    >>> deep_clause = Clause((Literal(False, Predicate(0, (term,))),), "d")
+    >>> deep_arrays = ClauseArrays.from_clauses([deep_clause])
+    >>> deep_arrays.subtree_sizes[:3].tolist()
+    [5002, 5001, 5000]
+    >>> ClauseArrays.from_clauses(deep_arrays.to_clauses()) == deep_arrays
+    True
+    """
+
+    kinds: "array[int]" = field(default_factory=lambda: array("b"))
+    symbols: "array[int]" = field(default_factory=_int_array)
+    arities: "array[int]" = field(default_factory=_int_array)
+    subtree_sizes: "array[int]" = field(default_factory=_int_array)
+    negated: "array[int]" = field(default_factory=lambda: array("b"))
+    literal_offsets: "array[int]" = field(default_factory=_offsets)
+    clause_offsets: "array[int]" = field(default_factory=_offsets)
+    headers: List[Clause] = field(default_factory=list)
+
+    @classmethod
+    def from_clauses(cls, clauses: Iterable[Clause]) -> "ClauseArrays":
+        """
+        Encode clauses.
+
+        :param clauses: clauses to encode
+        :returns: a new batch
+        """
+        clause_arrays = cls()
+        clause_arrays.extend(clauses)
+        return clause_arrays
+
+    def __len__(self) -> int:
+        """
+        Count clauses.
+
+        :returns: the number of clauses in the batch
+        """
+        return len(self.headers)
+
+    def _append_literal(self, literal: Literal) -> None:
+        nodes = _pre_order(literal.atom)
+        arities = [len(getattr(node, "arguments", ())) for node in nodes]
+        self.kinds.extend(_KINDS[type(node)] for node in nodes)
+        self.symbols.extend(node.index for node in nodes)
+        self.arities.extend(arities)
+        self.subtree_sizes.extend(_subtree_sizes(arities))
+        self.negated.append(literal.negated)
+        self.literal_offsets.append(len(self.kinds))
+
+    def extend(self, clauses: Iterable[Clause]) -> None:
+        """
+        Append clauses to the batch.
+
+        Arrays can't grow while they are shared (e.g. by NumPy views), so
+        in this case ``BufferError`` is raised.
+
+        :param clauses: clauses to append
+        """
+        for clause in clauses:
+            for literal in clause.literals:
+                self._append_literal(literal)
+            self.clause_offsets.append(len(self.negated))
+            self.headers.append(replace(clause, literals=()))
+
+    def _literal(self, index: int) -> Literal:
+        stack: List[Any] = []
+        for node in reversed(
+            range(self.literal_offsets[index], self.literal_offsets[index + 1])
+        ):
+            # the first argument is on the top of the stack
+            arguments = tuple(
+                reversed(stack[len(stack) - self.arities[node] :])
+            )
+            del stack[len(stack) - self.arities[node] :]
+            stack.append(
+                _node(self.kinds[node], self.symbols[node], arguments)
+            )
+        return Literal(bool(self.negated[index]), stack[0])
+
+    def to_clauses(self) -> List[Clause]:
+        """
+        Decode clauses.
+
+        :returns: clauses equal to the encoded ones
+        """
+        literals = [self._literal(index) for index in range(len(self.negated))]
+        offsets = self.clause_offsets
+        return [
+            replace(header, literals=tuple(literals[start:stop]))
+            for header, start, stop in zip(self.headers, offsets, offsets[1:])
+        ]
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """
+        Get the columns as NumPy arrays sharing memory with the batch.
+
+        NumPy is an optional dependency, it's installed by
+        ``pip install tptp-lark-parser[numpy]``.
+
+        :returns: one-dimensional arrays by names from ``COLUMNS``
+        """
+        # pylint: disable=import-outside-toplevel
+        import numpy
+
+        return {name: numpy.asarray(getattr(self, name)) for name in COLUMNS}
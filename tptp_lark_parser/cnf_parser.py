@@ -18,10 +18,13 @@ CNF Parser
 ===========
 """
 import dataclasses
-import json
-from typing import Any, Dict, List, Optional, Tuple
+import sys
+import weakref
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from lark import Transformer
+from lark import Transformer, Tree
+from lark.exceptions import VisitError
 
 from tptp_lark_parser.grammar import (
     EQUALITY_SYMBOL,
@@ -32,26 +35,97 @@ from tptp_lark_parser.grammar import (
     INEQUALITY_SYMBOL_ID,
     Clause,
     Function,
+    InternTable,
     Literal,
     Predicate,
     Term,
     Variable,
 )
+from tptp_lark_parser.symbol_table import SymbolTable
+
+
+def _initial_symbol_table(tokens_filename: Optional[str]) -> SymbolTable:
+    if tokens_filename is None:
+        return SymbolTable(
+            {
+                "functions": ["f"],
+                "predicates": [
+                    FALSEHOOD_SYMBOL,
+                    EQUALITY_SYMBOL,
+                    INEQUALITY_SYMBOL,
+                ],
+                "variables": [f"X{i}" for i in range(1000)],
+            }
+        )
+    return SymbolTable.load(tokens_filename)
+
+
+class VariableNames:
+    """
+    Original variable names of clauses with normalized variables.
+
+    .. _variable-names:
+
+    Names are kept by clause identity (not by label, which can be the same
+    for different clauses) only while the clause exists, so the table
+    doesn't grow beyond the clauses in use.
+
+    >>> from tptp_lark_parser.grammar import Literal, Predicate
+    >>> first = Clause((Literal(False, Predicate(0, (Variable(0),))),), "a")
+    >>> second = Clause((Literal(False, Predicate(0, (Variable(0),))),), "a")
+    >>> variable_names = VariableNames()
+    >>> variable_names[first] = ("X",)
+    >>> variable_names[second] = ("Y",)
+    >>> variable_names.get(first), variable_names.get(second)
+    (('X',), ('Y',))
+    >>> len(variable_names)
+    2
+    >>> del first
+    >>> len(variable_names), variable_names.get(Clause((), "a"))
+    (1, None)
+    """
 
+    def __init__(self) -> None:
+        """Create an empty table."""
+        self._names: Dict[
+            int, Tuple["weakref.ref[Clause]", Tuple[str, ...]]
+        ] = {}
 
-def _load_token_lists(
-    tokens_filename: str,
-) -> Dict[str, Dict[str, int]]:
-    with open(tokens_filename, "r", encoding="utf-8") as tokens_file:
-        tokens = json.load(tokens_file)
-    return {
-        "variables": {v: k for k, v in enumerate(tokens["variables"])},
-        "functions": {v: k for k, v in enumerate(tokens["functions"])},
-        "predicates": {v: k for k, v in enumerate(tokens["predicates"])},
-    }
+    def __setitem__(self, clause: Clause, names: Tuple[str, ...]) -> None:
+        """
+        Remember variable names of a clause.
 
+        :param clause: a clause
+        :param names: names of its variables in the order of their IDs
+        """
+        key = id(clause)
+        self._names[key] = (
+            weakref.ref(clause, lambda _: self._names.pop(key, None)),
+            names,
+        )
 
-class CNFParser(Transformer):
+    def get(self, clause: Clause) -> Optional[Tuple[str, ...]]:
+        """
+        Get variable names of a clause.
+
+        :param clause: a clause
+        :returns: names of its variables or ``None`` if they are not known
+        """
+        entry = self._names.get(id(clause))
+        if entry is None or entry[0]() is not clause:
+            return None
+        return entry[1]
+
+    def __len__(self) -> int:
+        """
+        Count clauses with known variable names.
+
+        :returns: the number of clauses
+        """
+        return len(self._names)
+
+
+class CNFParser(Transformer):  # pylint: disable=too-many-public-methods
     """
     A parser for ``<cnf_formula>`` from Lark parser tree.
 
@@ -76,8 +150,8 @@ class CNFParser(Transformer):
     ...    inference(resolution, [], [this, that, third])).
     ... ''')
     >>> cnf_parser = CNFParser()
-    >>> cnf_parser.token_map["functions"]
-    {'f': 0}
+    >>> cnf_parser.symbol_table.to_dict()["functions"]
+    ['f']
     >>> cnf_parser.transform(lark_parsed_tree)
     Traceback (most recent call last):
     ...
@@ -90,10 +164,64 @@ class CNFParser(Transformer):
     cnf(test, axiom, f(X,g(Y),h(Z,c1)) = f(X,Y,c2) | ~better(f(X), g(Y)) | $false() | this_is_a_test_case(), inference(resolution, [], [this, that, third])).
     >>> cnf_parser.token_map
     {'functions': {'f': 0, 'g': 1, 'c1': 2, 'h': 3, 'c2': 4, 'better': 5, 'this_is_a_test_case': 6}, 'predicates': {'$false': 0, '=': 1, '!=': 2, 'better': 3, 'this_is_a_test_case': 4}, 'variables': {'X0': 0, 'X1': 1, ..., 'X999': 999, 'X': 1000, 'Y': 1001, 'Z': 1002}}
+    >>> cnf_parser.token_lists["variables"][-3:]
+    ['X', 'Y', 'Z']
+    >>> CNFParser(
+    ...     symbol_table=cnf_parser.symbol_table
+    ... ).symbol_table is cnf_parser.symbol_table
+    True
+
+    Nested inference records are kept among the parents
+
+    >>> cnf_parser.transform(lark_parser.parse(
+    ...     "cnf(a, axiom, p(X), inference(r, [status(thm)],"
+    ...     " [b, c:[x], inference(s, [], [d])]))."
+    ... )).inference_parents
+    ('b', 'c', {'inference_record': ('s', ('d',))})
+
+    Variables can be numbered in each clause separately
+
+    >>> local_parser = CNFParser(extendable=True, normalize_variables=True)
+    >>> clause = local_parser.transform(lark_parsed_tree)
+    >>> print(local_parser.pretty_print(clause))
+    cnf(test, axiom, f(X0,g(X1),h(X2,c1)) = f(X0,X1,c2) | ~better(f(X0), g(X1)) | $false() | this_is_a_test_case(), inference(resolution, [], [this, that, third])).
+    >>> local_parser.symbol_table.counts()["variables"]
+    1000
+    >>> local_parser = CNFParser(
+    ...     extendable=True,
+    ...     normalize_variables=True,
+    ...     variable_names=VariableNames(),
+    ... )
+    >>> clause = local_parser.transform(lark_parsed_tree)
+    >>> local_parser.variable_names.get(clause)
+    ('X', 'Y', 'Z')
+    >>> print(local_parser.pretty_print(clause))
+    cnf(test, axiom, f(X,g(Y),h(Z,c1)) = f(X,Y,c2) | ~better(f(X), g(Y)) | $false() | this_is_a_test_case(), inference(resolution, [], [this, that, third])).
+
+    Clauses with the same label keep their own names
+
+    >>> first, second = [
+    ...     local_parser.transform(tree)
+    ...     for tree in lark_parser.parse(
+    ...         "cnf(a, axiom, p(A, B, C)). cnf(a, axiom, p(D))."
+    ...     ).find_data("cnf_annotated")
+    ... ]
+    >>> print(local_parser.pretty_print(first))
+    cnf(a, axiom, p(A, B, C)).
+    >>> print(local_parser.pretty_print(second))
+    cnf(a, axiom, p(D)).
     """
 
+    # pylint: disable=too-many-arguments
     def __init__(
-        self, tokens_filename: Optional[str] = None, extendable: bool = False
+        self,
+        tokens_filename: Optional[str] = None,
+        extendable: bool = False,
+        symbol_table: Optional[SymbolTable] = None,
+        normalize_variables: bool = False,
+        variable_names: Optional[VariableNames] = None,
+        *,
+        intern_table: Optional[InternTable] = None,
     ):
         """
         Initialise functional and predicate symbols lists.
@@ -101,24 +229,51 @@ class CNFParser(Transformer):
         :param tokens_filename: a filename of known tokens storage
         :param extendable: when set to ``False``, the parser fails
             when encounters new symbols
+        :param symbol_table: known symbols (if given, ``tokens_filename`` is
+            ignored)
+        :param normalize_variables: when set to ``True``, variables of each
+            clause get IDs ``0, 1, ...`` in the order of their first
+            occurrence, and the symbol table doesn't get new variables
+        :param variable_names: if given (with ``normalize_variables``), the
+            original variable names of clauses are saved there
+        :param intern_table: if given, equal variables, terms, predicates
+            and literals are shared through this table
         """
         super().__init__()
-        if tokens_filename is None:
-            self.token_map = {
-                "functions": {"f": 0},
-                "predicates": {
-                    FALSEHOOD_SYMBOL: FALSEHOOD_SYMBOL_ID,
-                    EQUALITY_SYMBOL: EQUALITY_SYMBOL_ID,
-                    INEQUALITY_SYMBOL: INEQUALITY_SYMBOL_ID,
-                },
-                "variables": {f"X{i}": i for i in range(1000)},
-            }
-        else:
-            self.token_map = _load_token_lists(tokens_filename)
-        self.token_lists: Dict[str, List[str]] = {
-            key: list(value.keys()) for key, value in self.token_map.items()
-        }
+        self.symbol_table = (
+            _initial_symbol_table(tokens_filename)
+            if symbol_table is None
+            else symbol_table
+        )
         self.extendable = extendable
+        self.normalize_variables = normalize_variables
+        self.variable_names = variable_names
+        self._clause_variables: Dict[str, int] = {}
+        self.intern_table = intern_table
+
+    @property
+    def token_map(self) -> Dict[str, Dict[str, int]]:
+        """
+        Symbol IDs by symbol type and name.
+
+        Kept for backward compatibility, use ``symbol_table`` instead.
+
+        :returns: a dictionary of dictionaries (not to be changed)
+        """
+        # pylint: disable=protected-access
+        return self.symbol_table._ids
+
+    @property
+    def token_lists(self) -> Dict[str, List[str]]:
+        """
+        Symbols by symbol type in the order of their IDs.
+
+        Kept for backward compatibility, use ``symbol_table`` instead.
+
+        :returns: a dictionary of lists (not to be changed)
+        """
+        # pylint: disable=protected-access
+        return self.symbol_table._symbols
 
     def __default_token__(self, token):
         """All the tokens we return as is."""
@@ -134,13 +289,19 @@ class CNFParser(Transformer):
             return children[0]
         return children
 
+    def _intern(self, item: Any) -> Any:
+        """Share equal structures if there is an intern table."""
+        if self.intern_table is None:
+            return item
+        return self.intern_table.intern(item)
+
     def _function(self, children: List[Any]):
         """Functional symbol with arguments."""
         function_name = children[0]
         function_id = self._get_symbol_id(function_name, "functions")
         if len(children) > 1:
-            return Function(function_id, tuple(children[1]))
-        return Function(function_id, ())
+            return self._intern(Function(function_id, tuple(children[1])))
+        return self._intern(Function(function_id, ()))
 
     def _get_symbol_id(self, symbol: str, symbol_type: str) -> int:
         """
@@ -153,15 +314,12 @@ class CNFParser(Transformer):
         :raises ValueError: if a symbol is not in a map and maps were defined
             as not extendable
         """
-        symbol_map = self.token_map[symbol_type]
-        symbol_list = self.token_lists[symbol_type]
-        if symbol not in symbol_map:
+        symbol_id = self.symbol_table.get_id(symbol_type, symbol)
+        if symbol_id is None:
             if self.extendable or symbol_type == "variables":
-                symbol_map.update({symbol: 1 + max(symbol_map.values())})
-                symbol_list.append(symbol)
-            else:
-                raise ValueError(f"unknown symbol: {symbol}")
-        return symbol_map[symbol]
+                return self.symbol_table.add(symbol_type, symbol)
+            raise ValueError(f"unknown symbol: {symbol}")
+        return symbol_id
 
     def fof_defined_plain_formula(self, children: List[Any]):
         """
@@ -200,27 +358,30 @@ class CNFParser(Transformer):
 
         :param children: parsed tree node's children
         """
-        return Variable(self._get_symbol_id(children[0], "variables"))
+        if self.normalize_variables:
+            return self._intern(
+                Variable(
+                    self._clause_variables.setdefault(
+                        children[0], len(self._clause_variables)
+                    )
+                )
+            )
+        return self._intern(
+            Variable(self._get_symbol_id(children[0], "variables"))
+        )
 
     @staticmethod
     def fof_arguments(children: List[Any]):
         """
-        List of arguments, organised in pairs.
+        List of arguments (collected by one rule).
 
         <fof_arguments>        ::= <fof_term> | <fof_term>,<fof_arguments>
 
         :param children: parsed tree node's children
         """
-        result: Tuple[Any, ...] = ()
-        for item in children:
-            if not isinstance(item, (Variable, Function)):
-                result = result + tuple(item)
-            else:
-                result = result + (item,)
-        return result
+        return tuple(children)
 
-    @staticmethod
-    def literal(children: List[Any]):
+    def literal(self, children: List[Any]):
         """
         Literal is a possible negated predicate.
 
@@ -229,24 +390,28 @@ class CNFParser(Transformer):
         :param children: parsed tree node's children
         """
         if children[0] == "~":
-            return Literal(True, children[1])
+            return self._intern(Literal(True, children[1]))
         if isinstance(children[0], Predicate):
             if children[0].index == INEQUALITY_SYMBOL_ID:
-                return Literal(
-                    negated=True,
-                    atom=Predicate(
-                        index=EQUALITY_SYMBOL_ID,
-                        arguments=children[0].arguments,
-                    ),
+                return self._intern(
+                    Literal(
+                        negated=True,
+                        atom=self._intern(
+                            Predicate(
+                                index=EQUALITY_SYMBOL_ID,
+                                arguments=children[0].arguments,
+                            )
+                        ),
+                    )
                 )
-        return Literal(False, children[0])
+        return self._intern(Literal(False, children[0]))
 
     def _predicate(self, children: List[Any]):
         """Predicates are atomic formulae."""
         predicate_id = self._get_symbol_id(children[0], "predicates")
         if len(children) > 1:
-            return Predicate(predicate_id, tuple(children[1]))
-        return Predicate(predicate_id, ())
+            return self._intern(Predicate(predicate_id, tuple(children[1])))
+        return self._intern(Predicate(predicate_id, ()))
 
     def fof_plain_atomic_formula(self, children: List[Any]):
         """
@@ -258,7 +423,7 @@ class CNFParser(Transformer):
         """
         return self._predicate(
             [
-                self.token_lists["functions"][children[0].index],
+                self.symbol_table.get_symbol("functions", children[0].index),
                 children[0].arguments,
             ]
         )
@@ -272,7 +437,9 @@ class CNFParser(Transformer):
         :param children: parsed tree node's children
         """
         predicate_id = self._get_symbol_id(children[1], "predicates")
-        return Predicate(predicate_id, (children[0], children[2]))
+        return self._intern(
+            Predicate(predicate_id, (children[0], children[2]))
+        )
 
     def fof_infix_unary(self, children: List[Any]):
         """
@@ -283,34 +450,93 @@ class CNFParser(Transformer):
         :param children: parsed tree node's children
         """
         predicate_id = self._get_symbol_id(children[1], "predicates")
-        return Predicate(predicate_id, (children[0], children[2]))
+        return self._intern(
+            Predicate(predicate_id, (children[0], children[2]))
+        )
 
     @staticmethod
     def disjunction(children: List[Any]):
         """
-        Clause structure.
+        Clause structure (all the literals are collected by one rule).
 
         <disjunction>          ::= <literal> | <disjunction> <vline> <literal>
 
-        :param children: parsed tree node's children
+        :param children: parsed tree node's children (literals separated by
+            vertical lines)
         """
-        if len(children) == 1:
-            if (
-                children[0].atom.index == FALSEHOOD_SYMBOL_ID
-                and not children[0].negated
-            ):
-                return Clause(tuple())
-            return Clause(tuple(children))
-        literals: Tuple[Any, ...] = ()
-        for item in (children[0], children[2]):
-            if isinstance(item, Clause):
-                literals = literals + item.literals
+        if (
+            len(children) == 1
+            and children[0].atom.index == FALSEHOOD_SYMBOL_ID
+            and not children[0].negated
+        ):
+            return Clause(tuple())
+        return Clause(tuple(children[::2]))
+
+    def transform(self, tree: Tree):
+        """
+        Transform a parsed tree of an annotated formula.
+
+        Unlike the ``Transformer`` from Lark, it uses an explicit stack, so
+        the depth of terms is not limited by the recursion limit.
+
+        :param tree: a parsed tree
+        :returns: a clause (or whatever the tree stands for)
+        """
+        self.reset_variables()
+        results: List[Any] = []
+        stack: List[Tuple[Any, bool]] = [(tree, False)]
+        while stack:
+            node, children_transformed = stack.pop()
+            if children_transformed:
+                self._reduce(node, results)
             else:
-                literals = literals + (item,)
-        return Clause(literals)
+                self._expand(node, stack, results)
+        return results[0]
+
+    def reset_variables(self) -> None:
+        """Forget variable names of a clause (before reading another one)."""
+        self._clause_variables = {}
+
+    def _expand(
+        self, node: Any, stack: List[Tuple[Any, bool]], results: List[Any]
+    ) -> None:
+        """Put children of a tree on a stack or transform a token."""
+        if isinstance(node, Tree):
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
+        else:
+            results.append(self.__default_token__(node))
+
+    def _reduce(self, tree: Tree, results: List[Any]) -> None:
+        """Replace transformed children of a tree by the tree's result."""
+        first_child = len(results) - len(tree.children)
+        children = results[first_child:]
+        del results[first_child:]
+        callback = getattr(self, tree.data, None)
+        try:
+            results.append(
+                self.__default__(tree.data, children, tree.meta)
+                if callback is None
+                else callback(children)
+            )
+        except Exception as error:
+            raise VisitError(tree.data, tree, error) from error
 
-    @staticmethod
-    def cnf_annotated(children: List[Any]):
+    def fof_annotated(self, children: List[Any]):
+        """
+        Annotated FOF formula (we don't support FOF yet).
+
+        <fof_annotated>        ::= fof(<name>,<formula_role>,<fof_formula> <annotations>).
+
+        >>> CNFParser().fof_annotated(["a", "axiom"])
+        ['a', 'axiom']
+
+        :param children: parsed tree node's children
+        """
+        self.reset_variables()
+        return children
+
+    def cnf_annotated(self, children: List[Any]):
         """
         Annotated CNF formula (clause).
 
@@ -318,22 +544,39 @@ class CNFParser(Transformer):
 
         :param children: parsed tree node's children
         """
-        clause = children[2]
-        inference_rule = None
-        inference_parents = None
-        if isinstance(children[3], list):
-            for annotation in children[3]:
+        variables = tuple(self._clause_variables)
+        self.reset_variables()
+        inference_rule, inference_parents = self._inference_record(children[3])
+        clause = dataclasses.replace(
+            children[2],
+            label=sys.intern(children[0]),
+            role=sys.intern(children[1]),
+            inference_rule=(
+                None if inference_rule is None else sys.intern(inference_rule)
+            ),
+            inference_parents=(
+                None
+                if inference_parents is None
+                else tuple(
+                    sys.intern(parent) if isinstance(parent, str) else parent
+                    for parent in inference_parents
+                )
+            ),
+        )
+        if self.normalize_variables and self.variable_names is not None:
+            self.variable_names[clause] = variables
+        return clause
+
+    @staticmethod
+    def _inference_record(
+        annotations: Any,
+    ) -> Tuple[Optional[str], Optional[Tuple[str, ...]]]:
+        if isinstance(annotations, list):
+            for annotation in annotations:
                 if isinstance(annotation, dict):
                     if "inference_record" in annotation:
-                        inference_rule = annotation["inference_record"][0]
-                        inference_parents = annotation["inference_record"][1]
-        return dataclasses.replace(
-            clause,
-            label=children[0],
-            role=children[1],
-            inference_rule=inference_rule,
-            inference_parents=inference_parents,
-        )
+                        return annotation["inference_record"]
+        return None, None
 
     @staticmethod
     def inference_record(children: List[Any]):
@@ -375,39 +618,67 @@ class CNFParser(Transformer):
     @staticmethod
     def parent_list(children: List[Any]):
         """
-        Inference parents list.
+        Inference parents list (collected by one rule).
 
         <parent_list>          :== <parent_info> | <parent_info>,<parent_list>
 
         :param children: parsed tree node's children
         """
-        if len(children) == 2:
-            return (children[0],) + tuple(children[1])
-        return children
-
-    def _term_to_tptp(self, term: Term) -> str:
-        if isinstance(term, Function):
-            function_name = self.token_lists["functions"][term.index]
-            arguments = tuple(
-                self._term_to_tptp(argument) for argument in term.arguments
-            )
-            if arguments != tuple():
-                return f"{function_name}({','.join(arguments)})"
-            return function_name
-        return self.token_lists["variables"][term.index]
-
-    def _literal_to_tptp(self, literal: Literal) -> str:
+        return tuple(children)
+
+    def _term_to_tptp(
+        self, term: Term, variable_name: Callable[[int], str]
+    ) -> str:
+        parts: List[str] = []
+        stack: List[Any] = [term]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+            elif isinstance(item, Variable):
+                parts.append(variable_name(item.index))
+            else:
+                self._push_function(stack, item)
+        return "".join(parts)
+
+    def _push_function(self, stack: List[Any], function: Function) -> None:
+        """Put a function's parts on a stack in the reversed order."""
+        if function.arguments:
+            stack.append(")")
+            for argument in function.arguments[:0:-1]:
+                stack.extend((argument, ","))
+            stack.extend((function.arguments[0], "("))
+        stack.append(self.symbol_table.get_symbol("functions", function.index))
+
+    def _literal_to_tptp(
+        self, literal: Literal, variable_name: Callable[[int], str]
+    ) -> str:
         negation = "~" if literal.negated else ""
         arguments = tuple(
-            self._term_to_tptp(term) for term in literal.atom.arguments
+            self._term_to_tptp(term, variable_name)
+            for term in literal.atom.arguments
         )
         if literal.atom.index == EQUALITY_SYMBOL_ID:
             return f"{negation}{arguments[0]} {EQUALITY_SYMBOL} {arguments[1]}"
         if literal.atom.index == FALSEHOOD_SYMBOL_ID:
             return f"{negation}{FALSEHOOD_SYMBOL}()"
-        predicate_name = self.token_lists["predicates"][literal.atom.index]
+        predicate_name = self.symbol_table.get_symbol(
+            "predicates", literal.atom.index
+        )
         return f"{negation}{predicate_name}({', '.join(arguments)})"
 
+    def _variable_name_getter(self, clause: Clause) -> Callable[[int], str]:
+        if not self.normalize_variables:
+            return partial(self.symbol_table.get_symbol, "variables")
+        names = (
+            None
+            if self.variable_names is None
+            else self.variable_names.get(clause)
+        )
+        if names is not None:
+            return names.__getitem__
+        return "X{}".format
+
     def pretty_print(self, clause: Clause) -> str:
         """
         Print a logical formula back to TPTP language.
@@ -416,8 +687,9 @@ class CNFParser(Transformer):
         :returns: a TPTP string
         """
         res = f"cnf({clause.label}, {clause.role}, "
+        variable_name = self._variable_name_getter(clause)
         for literal in clause.literals:
-            res += self._literal_to_tptp(literal) + " | "
+            res += self._literal_to_tptp(literal, variable_name) + " | "
         if res[-2:] == "| ":
             res = res[:-3]
         if not clause.literals:
@@ -0,0 +1,273 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Corpus Store
+=============
+"""
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, Iterator, Mapping, Optional, Sequence, Tuple
+
+from tptp_lark_parser.grammar import Clause, InternTable
+from tptp_lark_parser.problem_cache import decode_problem, encode_problem
+from tptp_lark_parser.symbol_table import SymbolTable
+
+_MAGIC = b"TPTPCS\x00\x01"
+# an offset and a length of the index (symbols and problems)
+_INDEX = struct.Struct("<QQ")
+
+
+class CorpusWriter:
+    """
+    A writer of parsed problems into one file.
+
+    .. _corpus-writer:
+
+    Problems are encoded one by one (as by ``encode_problem``) and followed
+    by an index of their positions and by the symbol table. The file is
+    written under a temporary name and renamed when the writer is closed,
+    so a failed run leaves no half-written corpus.
+
+    >>> from tptp_lark_parser import TPTPParser
+    >>> tptp_parser = TPTPParser(extendable=True)
+    >>> problems = {
+    ...     "first": tptp_parser.parse("cnf(a, axiom, p(X) | ~q(f(X)))."),
+    ...     "empty": (),
+    ...     "second": tptp_parser.parse("cnf(b, axiom, X = c)."),
+    ... }
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> corpus_file = os.path.join(temp_folder, "corpus.bin")
+    >>> with CorpusWriter(
+    ...     corpus_file, tptp_parser.cnf_parser.symbol_table
+    ... ) as writer:
+    ...     for name, clauses in problems.items():
+    ...         writer.add(name, clauses)
+    >>> with CorpusWriter(corpus_file + "2", SymbolTable()) as writer:
+    ...     writer.add("first", problems["first"])
+    ...     writer.add("first", problems["first"])
+    Traceback (most recent call last):
+     ...
+    ValueError: the problem is already written: first
+    >>> os.listdir(temp_folder)
+    ['corpus.bin']
+    """
+
+    def __init__(self, filename: str, symbol_table: SymbolTable):
+        """
+        Start writing a corpus.
+
+        :param filename: a corpus file name
+        :param symbol_table: symbols used by the problems (they are written
+            as they are when the writer is closed)
+        """
+        self.filename = filename
+        self.symbol_table = symbol_table
+        # pylint: disable=consider-using-with
+        self._file = open(filename + ".tmp", "wb")
+        self._file.write(_MAGIC + _INDEX.pack(0, 0))
+        self._problems: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, name: str, clauses: Sequence[Clause]) -> None:
+        """
+        Write a problem.
+
+        :param name: a unique name of the problem
+        :param clauses: the problem's clauses
+        :raises ValueError: if a problem with this name is already written
+        """
+        if name in self._problems:
+            raise ValueError(f"the problem is already written: {name}")
+        data = encode_problem(clauses, (), {})
+        self._problems[name] = (self._file.tell(), len(data))
+        self._file.write(data)
+
+    def close(self) -> None:
+        """Write the index and the symbols and put the file in its place."""
+        index = json.dumps(
+            {
+                "symbols": self.symbol_table.to_dict(),
+                "problems": self._problems,
+            }
+        ).encode()
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.seek(len(_MAGIC))
+        self._file.write(_INDEX.pack(index_offset, len(index)))
+        self._file.close()
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def __enter__(self) -> "CorpusWriter":
+        """
+        Use the writer as a context manager.
+
+        :returns: the writer itself
+        """
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        """
+        Close the writer or discard the file after an exception.
+
+        :param exc_type: a type of the exception raised (if any)
+        :param exc_value: the exception raised
+        :param traceback: the exception's traceback
+        """
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self.filename + ".tmp")
+
+
+class CorpusReader(Mapping[str, Tuple[Clause, ...]]):
+    """
+    A read-only mapping from problem names to their clauses.
+
+    .. _corpus-reader:
+
+    The corpus file is memory-mapped, so processes reading the same file
+    share its pages, and only the problems asked for are decoded. The
+    index is read when the file is opened. A reader can't be pickled, so
+    each worker process should open its own one.
+
+    >>> from tptp_lark_parser import TPTPParser
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> corpus_file = os.path.join(temp_folder, "corpus.bin")
+    >>> tptp_parser = TPTPParser(extendable=True)
+    >>> clauses = tptp_parser.parse("cnf(a, axiom, p(X) | ~q(f(X))).")
+    >>> with CorpusWriter(
+    ...     corpus_file, tptp_parser.cnf_parser.symbol_table
+    ... ) as writer:
+    ...     writer.add("problem", clauses)
+    ...     writer.add("empty", ())
+    >>> with CorpusReader(corpus_file) as reader:
+    ...     print(len(reader), list(reader), "problem" in reader)
+    ...     print(reader["problem"] == clauses, reader["empty"])
+    ...     print(tptp_parser.cnf_parser.pretty_print(reader["problem"][0]))
+    ...     print(reader.symbol_table.to_dict() == (
+    ...         tptp_parser.cnf_parser.symbol_table.to_dict()
+    ...     ))
+    2 ['problem', 'empty'] True
+    True ()
+    cnf(a, axiom, p(X) | ~q(f(X))).
+    True
+
+    Clauses keep nested inference records among their parents
+
+    >>> nested = tptp_parser.parse(
+    ...     "cnf(n, axiom, p(X), "
+    ...     "inference(r, [], [b, inference(s, [], [d])]))."
+    ... )
+    >>> nested_file = os.path.join(temp_folder, "nested.bin")
+    >>> with CorpusWriter(
+    ...     nested_file, tptp_parser.cnf_parser.symbol_table
+    ... ) as writer:
+    ...     writer.add("nested", nested)
+    >>> with CorpusReader(nested_file) as reader:
+    ...     print(reader["nested"] == nested)
+    ...     print(reader["nested"][0].inference_parents)
+    True
+    ('b', {'inference_record': ('s', ('d',))})
+    >>> with open(corpus_file + "2", "wb") as not_corpus:
+    ...     _ = not_corpus.write(b"not a corpus")
+    >>> CorpusReader(corpus_file + "2")
+    Traceback (most recent call last):
+     ...
+    ValueError: not a corpus file: ...2
+    """
+
+    def __init__(
+        self, filename: str, intern_table: Optional[InternTable] = None
+    ):
+        """
+        Open a corpus file.
+
+        :param filename: a file written by ``CorpusWriter``
+        :param intern_table: a table for sharing equal terms, predicates and
+            literals of the problems read
+        :raises ValueError: if the file is not a corpus
+        """
+        with open(filename, "rb") as corpus_file:
+            self._data = mmap.mmap(
+                corpus_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        if self._data[: len(_MAGIC)] != _MAGIC:
+            self._data.close()
+            raise ValueError(f"not a corpus file: {filename}")
+        index = self._read_index()
+        self.symbol_table = SymbolTable(index["symbols"])
+        self._problems: Dict[str, Tuple[int, int]] = index["problems"]
+        self.intern_table = intern_table
+
+    def _read_index(self) -> Dict[str, Any]:
+        index_offset, index_length = _INDEX.unpack_from(
+            self._data, len(_MAGIC)
+        )
+        return json.loads(
+            self._data[index_offset : index_offset + index_length]
+        )
+
+    def __getitem__(self, name: str) -> Tuple[Clause, ...]:
+        """
+        Decode a problem.
+
+        :param name: a name of the problem
+        :returns: the problem's clauses
+        """
+        offset, length = self._problems[name]
+        return decode_problem(
+            self._data[offset : offset + length], self.intern_table
+        )[0]
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over problem names.
+
+        :returns: names in the order of writing
+        """
+        return iter(self._problems)
+
+    def __len__(self) -> int:
+        """
+        Count problems.
+
+        :returns: the number of problems in the corpus
+        """
+        return len(self._problems)
+
+    def close(self) -> None:
+        """Unmap the corpus file."""
+        self._data.close()
+
+    def __enter__(self) -> "CorpusReader":
+        """
+        Use the reader as a context manager.
+
+        :returns: the reader itself
+        """
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        """
+        Close the reader.
+
+        :param exc_type: a type of the exception raised (if any)
+        :param exc_value: the exception raised
+        :param traceback: the exception's traceback
+        """
+        self.close()
@@ -0,0 +1,490 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Fast CNF Parser
+================
+"""
+import re
+from random import Random
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tptp_lark_parser.cnf_parser import CNFParser
+from tptp_lark_parser.grammar import Clause, Include
+
+_TOKEN = re.compile(
+    r"(?P<skip>\s+|%[^\n]*|/\*.*?\*/)"
+    r"|(?P<variable>[A-Z][A-Za-z0-9_]*)"
+    r"|(?P<word>[a-z][A-Za-z0-9_]*|'(?:[ -&(-\[\]-~]|\\['\\])+')"
+    r"|(?P<defined_word>\$[a-z][A-Za-z0-9_]*)"
+    r"|(?P<number>0|[1-9][0-9]*)"
+    r"|(?P<distinct_object>\"(?:[ !#-\[\]-~]|\\[\"\\])*\")"
+    r"|(?P<punctuation>!=|[(),|~=.\[\]])"
+    r"|(?P<unknown>.)",
+    re.DOTALL,
+)
+# a reverse Polish notation of a clause: operations with their arguments
+_Program = List[Tuple[str, Any]]
+ParsedStatement = Tuple[Tuple[Clause, ...], Tuple[Include, ...]]
+
+
+class _Unsupported(Exception):
+    """A statement is not in the subset understood by ``FastCNFParser``."""
+
+
+def _tokenize(statement: str) -> List[Tuple[str, str]]:
+    tokens: List[Tuple[str, str]] = []
+    for match in _TOKEN.finditer(statement):
+        kind = match.lastgroup
+        if kind == "unknown":
+            raise _Unsupported(match.group())
+        if kind == "punctuation":
+            tokens.append((match.group(), match.group()))
+        elif kind != "skip":
+            tokens.append((str(kind), match.group()))
+    tokens.append(("", ""))
+    return tokens
+
+
+class _StatementReader:  # pylint: disable=too-few-public-methods
+    """
+    A recursive descent reader of a ``cnf`` statement or an ``include``.
+
+    It doesn't touch any symbols but writes a program (in the reverse Polish
+    notation) to build a clause. The depth of terms is not limited since
+    open functions are kept on an explicit stack.
+    """
+
+    def __init__(self, statement: str):
+        self.tokens = _tokenize(statement)
+        self.position = 0
+        self.program: _Program = []
+
+    def read(self) -> Optional[Tuple[str, ...]]:
+        """
+        Read a statement.
+
+        :returns: ``None`` if there is no statement, an included file name,
+            or a clause label and role (the clause is left in the program)
+        """
+        header = self._statement()
+        if header is not None:
+            self._take(".")
+        self._take("")
+        return header
+
+    def _peek(self) -> str:
+        return self.tokens[self.position][0]
+
+    def _take(self, *kinds: str) -> str:
+        kind, text = self.tokens[self.position]
+        if kind not in kinds:
+            raise _Unsupported(text)
+        self.position += 1
+        return text
+
+    def _term(self) -> str:
+        outer_kind = self._peek()
+        open_functions: List[List[Any]] = []
+        while True:
+            if not self._open_function(
+                open_functions
+            ) and not self._close_functions(open_functions):
+                return outer_kind
+
+    def _open_function(self, open_functions: List[List[Any]]) -> bool:
+        kind = self._peek()
+        if kind == "variable":
+            self.program.append(("variable", self._take(kind)))
+            return False
+        name = self._take("word", "defined_word", "number", "distinct_object")
+        if kind == "word" and self._peek() == "(":
+            self._take("(")
+            open_functions.append([name, 0])
+            return True
+        self.program.append(("function", (name, 0)))
+        return False
+
+    def _close_functions(self, open_functions: List[List[Any]]) -> bool:
+        while open_functions:
+            open_functions[-1][1] += 1
+            if self._take(",", ")") == ",":
+                return True
+            name, arity = open_functions.pop()
+            self.program.append(("function", (name, arity)))
+        return False
+
+    def _literal(self) -> None:
+        negated = self._peek() == "~"
+        if negated:
+            self._take("~")
+        self._atom(self._term(), negated)
+        self.program.append(("literal", negated))
+
+    def _atom(self, kind: str, negated: bool) -> None:
+        if self._peek() == "=" or self._peek() == "!=" and not negated:
+            self._infix()
+        elif kind == "word":
+            self.program.append(("atom", None))
+        elif kind == "defined_word":
+            self.program[-1] = ("defined_atom", self.program[-1][1][0])
+        else:
+            raise _Unsupported(kind)
+
+    def _infix(self) -> None:
+        symbol = self._take("=", "!=")
+        self._term()
+        self.program.append(("infix", symbol))
+
+    def _disjunction(self) -> None:
+        in_brackets = self._peek() == "("
+        if in_brackets:
+            self._take("(")
+        self.program.append(("disjunction", self._literals()))
+        if in_brackets:
+            self._take(")")
+
+    def _literals(self) -> int:
+        self._literal()
+        count = 1
+        while self._peek() == "|":
+            self._take("|")
+            self._literal()
+            count += 1
+        return count
+
+    def _names(self) -> Tuple[str, ...]:
+        self._take("[")
+        if self._peek() == "]":
+            self._take("]")
+            return ()
+        names = [self._take("word", "number")]
+        while self._take(",", "]") == ",":
+            names.append(self._take("word", "number"))
+        return tuple(names)
+
+    def _useful_info(self) -> None:
+        self._take("[")
+        if self._peek() == "]":
+            self._take("]")
+            return
+        self._general_function()
+        while self._take(",", "]") == ",":
+            self._general_function()
+
+    def _general_function(self) -> None:
+        self._take("word")
+        if self._peek() == "(":
+            self._take("(")
+            self._take("word", "variable", "number")
+            while self._take(",", ")") == ",":
+                self._take("word", "variable", "number")
+
+    def _source(self) -> Any:
+        name = self._take("word", "number")
+        if name == "inference" and self._peek() == "(":
+            return self._inference_record()
+        if name == "file" and self._peek() == "(":
+            self._take("(")
+            self._file_name()
+            if self._take(",", ")") == ",":
+                self._take("word", "number")
+                self._take(")")
+        return ()
+
+    def _inference_record(self) -> Any:
+        self._take("(")
+        rule = self._take("word")
+        self._take(",")
+        self._useful_info()
+        self._take(",")
+        parents = self._names()
+        self._take(")")
+        return [{"inference_record": (rule, parents)}]
+
+    def _annotations(self) -> Any:
+        if self._peek() != ",":
+            return ()
+        self._take(",")
+        annotations = self._source()
+        if self._peek() == ",":
+            self._take(",")
+            self._useful_info()
+        return annotations
+
+    def _file_name(self) -> str:
+        file_name = self._take("word")
+        if not file_name.startswith("'"):
+            raise _Unsupported(file_name)
+        return file_name
+
+    def _role(self) -> str:
+        role = self._take("word")
+        if role.startswith("'"):
+            raise _Unsupported(role)
+        return role
+
+    def _statement(self) -> Optional[Tuple[str, ...]]:
+        if self._peek() == "":
+            return None
+        keyword = self._take("word")
+        if keyword == "include":
+            self._take("(")
+            file_name = self._file_name()
+            self._take(")")
+            return (file_name,)
+        if keyword != "cnf":
+            raise _Unsupported(keyword)
+        return self._cnf_statement()
+
+    def _cnf_statement(self) -> Tuple[str, ...]:
+        self._take("(")
+        label = self._take("word", "number")
+        self._take(",")
+        role = self._role()
+        self._take(",")
+        self._disjunction()
+        self.program.append(("annotations", self._annotations()))
+        self._take(")")
+        return label, role
+
+
+class FastCNFParser:  # pylint: disable=too-few-public-methods
+    r"""
+    A hand-written parser for the most common kind of TPTP statements.
+
+    .. _FastCNFParser:
+
+    It understands ``include`` directives without formula selections and
+    ``cnf`` statements with (optionally negated) atoms, equalities and
+    inequalities of terms built from variables, functional symbols,
+    numbers and distinct objects, and annotations with either a file or an
+    inference record with plain parent names. It calls the same callbacks
+    of ``CNFParser`` as the Lark parser, so clauses and symbol IDs are the
+    same. For anything else, ``parse`` returns ``None``, and the statement
+    should be given to the Lark parser.
+
+    >>> from tptp_lark_parser.tptp_parser import TPTPParser
+    >>> tptp_parser = TPTPParser(extendable=True, tokens_filename=None)
+    >>> fast_parser = FastCNFParser(tptp_parser.cnf_parser)
+    >>> clauses, includes = fast_parser.parse(
+    ...     "% a comment\ncnf(a, axiom, (~p(X, f(Y)) | X != c), "
+    ...     "inference(r, [status(thm), x(Y, 1)], [b, c]))."
+    ... )
+    >>> print(tptp_parser.cnf_parser.pretty_print(clauses[0]))
+    cnf(a, axiom, ~p(X, f(Y)) | ~X = c, inference(r, [], [b, c])).
+    >>> print(tptp_parser.cnf_parser.pretty_print(fast_parser.parse(
+    ...     "cnf(a, axiom, p, inference(r, [], []), [description(a)])."
+    ... )[0][0]))
+    cnf(a, axiom, p(), inference(r, [], [])).
+    >>> fast_parser.parse("include('Axioms/TST001-0.ax').")
+    ((), (Include(file_name='Axioms/TST001-0.ax', formula_selection=None),))
+    >>> fast_parser.parse("% only a comment\n")
+    ((), ())
+    >>> for statement in (
+    ...     "fof(a, axiom, p).", "cnf(a, axiom, p(X) & q).",
+    ...     "cnf(a, axiom, p, inference(r, [], [b:[c]])).",
+    ...     "cnf(a, axiom, ~ a != b).", "cnf(a, axiom, X).",
+    ...     "include(a).", "cnf(a, 'axiom', p).",
+    ...     "cnf(a, axiom, p) cnf(b, axiom, q).", "cnf(a, axiom, p(1.5)).",
+    ...     "include('a.ax', [b]).",
+    ... ):
+    ...     print(fast_parser.parse(statement))
+    None
+    None
+    None
+    None
+    None
+    None
+    None
+    None
+    None
+    None
+    >>> print(FastCNFParser(TPTPParser().cnf_parser).parse(
+    ...     "cnf(a, axiom, unknown_symbol)."
+    ... ))
+    None
+
+    On the bundled ``TPTP-mock`` and on random clauses, the results are the
+    same as the Lark parser's ones
+
+    >>> import os
+    >>> tptp_folder = os.path.join(
+    ...     os.path.dirname(__file__), "resources", "TPTP-mock"
+    ... )
+    >>> def fast_and_lark(tptp_text):
+    ...     lark_parser = TPTPParser(tptp_folder, True, None)
+    ...     fast_parser = TPTPParser(tptp_folder, True, None, fast_cnf=True)
+    ...     return (
+    ...         fast_parser.parse(tptp_text) == lark_parser.parse(tptp_text)
+    ...         and fast_parser.cnf_parser.symbol_table.to_dict()
+    ...         == lark_parser.cnf_parser.symbol_table.to_dict()
+    ...     )
+    >>> with open(os.path.join(
+    ...     tptp_folder, "Problems", "TST", "TST001-1.p"
+    ... )) as problem_file:
+    ...     fast_and_lark(problem_file.read())
+    True
+    >>> random_generator = Random(0)
+    >>> all(
+    ...     fast_and_lark(_random_cnf(random_generator, 5))
+    ...     for _ in range(100)
+    ... )
+    True
+    """
+
+    def __init__(self, cnf_parser: CNFParser):
+        """
+        Create a parser.
+
+        :param cnf_parser: a transformer to build clauses with
+        """
+        self.cnf_parser = cnf_parser
+        self._operations: Dict[str, Callable[[List[Any], Any], None]] = {
+            "variable": self._variable,
+            "function": self._function,
+            "atom": self._atom,
+            "defined_atom": self._defined_atom,
+            "infix": self._infix,
+            "literal": self._literal,
+            "disjunction": self._disjunction,
+            "annotations": self._annotations,
+        }
+
+    def parse(self, statement: str) -> Optional[ParsedStatement]:
+        """
+        Parse one statement (with preceding comments).
+
+        :param statement: a TPTP statement, e.g. from ``iter_parse``
+        :returns: clauses and include directives like ``_parse_text`` of
+            ``TPTPParser`` or ``None`` if the statement is not supported
+        """
+        try:
+            reader = _StatementReader(statement)
+            header = reader.read()
+            if header is None:
+                return (), ()
+            if len(header) == 1:
+                return (), (Include(header[0].replace("'", "")),)
+            return (self._run(reader.program, header),), ()
+        except (_Unsupported, ValueError):
+            return None
+
+    def _run(self, program: _Program, header: Tuple[str, ...]) -> Clause:
+        self.cnf_parser.reset_variables()
+        values: List[Any] = []
+        for operation, argument in program:
+            self._operations[operation](values, argument)
+        return self.cnf_parser.cnf_annotated(
+            [header[0], header[1], values[0], values[1]]
+        )
+
+    def _variable(self, values: List[Any], name: str) -> None:
+        values.append(self.cnf_parser.variable([name]))
+
+    def _function(self, values: List[Any], function: Tuple[str, int]) -> None:
+        name, arity = function
+        if arity == 0:
+            values.append(self.cnf_parser.fof_plain_term([name]))
+        else:
+            arguments = tuple(values[-arity:])
+            del values[-arity:]
+            values.append(self.cnf_parser.fof_plain_term([name, arguments]))
+
+    def _atom(self, values: List[Any], _: None) -> None:
+        values.append(self.cnf_parser.fof_plain_atomic_formula([values.pop()]))
+
+    def _defined_atom(self, values: List[Any], name: str) -> None:
+        values.append(self.cnf_parser.fof_defined_plain_formula([name]))
+
+    def _infix(self, values: List[Any], symbol: str) -> None:
+        right = values.pop()
+        left = values.pop()
+        values.append(
+            self.cnf_parser.fof_defined_infix_formula([left, symbol, right])
+            if symbol == "="
+            else self.cnf_parser.fof_infix_unary([left, symbol, right])
+        )
+
+    def _literal(self, values: List[Any], negated: bool) -> None:
+        atom = values.pop()
+        values.append(
+            self.cnf_parser.literal(["~", atom] if negated else [atom])
+        )
+
+    def _disjunction(self, values: List[Any], count: int) -> None:
+        children: List[Any] = []
+        for literal in values[-count:]:
+            children.extend(("|", literal))
+        del values[-count:]
+        values.append(self.cnf_parser.disjunction(children[1:]))
+
+    @staticmethod
+    def _annotations(values: List[Any], annotations: Any) -> None:
+        values.append(annotations)
+
+
+def _random_cnf(random_generator: Random, clauses: int) -> str:
+    """
+    Generate random clauses of the subset understood by ``FastCNFParser``.
+
+    >>> print(_random_cnf(Random(0), 2))
+    cnf(c0, ...).
+    cnf(c1, ...).
+
+    :param random_generator: a source of randomness
+    :param clauses: a number of clauses
+    :returns: TPTP text
+    """
+    lines = []
+    for index in range(clauses):
+        literals = " | ".join(
+            _random_literal(random_generator)
+            for _ in range(random_generator.randint(1, 4))
+        )
+        annotations = random_generator.choice(
+            ("", ", file('a.p', b)", ", inference(r, [status(thm)], [c, 1])")
+        )
+        lines.append(f"cnf(c{index}, axiom, ({literals}){annotations}).")
+    return "\n".join(lines)
+
+
+def _random_literal(random_generator: Random) -> str:
+    negation = random_generator.choice(("", "~ "))
+    atom = random_generator.choice(("p", "q", "$false", "$true", "="))
+    if atom == "=":
+        return (
+            f"{negation}{_random_term(random_generator, 2)} "
+            f"{random_generator.choice(('=', '!=') if not negation else '=')}"
+            f" {_random_term(random_generator, 2)}"
+        )
+    if atom.startswith("$"):
+        return f"{negation}{atom}"
+    arguments = ", ".join(
+        _random_term(random_generator, 2)
+        for _ in range(random_generator.randint(0, 3))
+    )
+    return f"{negation}{atom}({arguments})" if arguments else negation + atom
+
+
+def _random_term(random_generator: Random, depth: int) -> str:
+    if depth == 0 or random_generator.random() < 0.3:
+        return random_generator.choice(
+            ("X", "Y", "Z", "c", "'d e'", "0", "12", '"o"', "$c")
+        )
+    name = random_generator.choice(("f", "g", "'h'"))
+    return f"{name}({_random_term(random_generator, depth - 1)}, " + (
+        f"{_random_term(random_generator, depth - 1)})"
+    )
@@ -0,0 +1,601 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+File Source
+============
+"""
+import io
+import os
+import posixpath
+import re
+import tarfile
+import zipfile
+import zlib
+from bisect import bisect_right
+from fnmatch import fnmatchcase
+from glob import glob
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+# a file name, a version (e.g. a modification time) and a size
+FileKey = Tuple[str, int, int]
+# a gzip header and a deflate stream
+_GZIP_WBITS = 16 + 15
+# a path to the folder containing ``Problems`` or ``Axioms`` in an archive
+_ROOT = re.compile(r"((?:[^/]*/)*?)(?:Problems|Axioms)/")
+
+
+def _normalize(name: str) -> str:
+    return posixpath.normpath(name.replace(os.sep, "/"))
+
+
+def _matches(name: str, pattern: str) -> bool:
+    # like in ``glob``, ``*`` doesn't match ``/``
+    parts, pattern_parts = name.split("/"), pattern.split("/")
+    return len(parts) == len(pattern_parts) and all(
+        map(fnmatchcase, parts, pattern_parts)
+    )
+
+
+class FileSource:
+    """
+    Files of a TPTP library kept in a folder.
+
+    .. _file-source:
+
+    Files are named by paths relative to the library's root with ``/`` as a
+    separator (e.g. ``Axioms/TST001-0.ax``). Subclasses read them from other
+    places (``TarSource`` and ``ZipSource`` read archives).
+
+    >>> import sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> tptp_folder = (
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> file_source = FileSource(tptp_folder)
+    >>> file_source.glob("*/*")
+    ['Axioms/TST001-0.ax']
+    >>> file_source.glob("Problems/*/*-*.p")
+    ['Problems/TST/TST001-1.p']
+    >>> file_source.read_text("Axioms/TST001-0.ax").splitlines()[1]
+    'cnf(test_axiom,axiom,'
+    >>> with file_source.open_text("Axioms/TST001-0.ax") as text_file:
+    ...     print(text_file.readline().strip())
+    %this is a test TPTP axioms file
+    >>> filename, _, size = file_source.file_key("Axioms/TST001-0.ax")
+    >>> os.path.basename(filename), size
+    ('TST001-0.ax', 150)
+    """
+
+    def __init__(self, path: Union[str, "os.PathLike[str]"]):
+        """
+        Read files from a folder.
+
+        :param path: a folder containing the TPTP library
+        """
+        self.path = path
+
+    def glob(self, pattern: str) -> List[str]:
+        """
+        Find files by a pattern.
+
+        :param pattern: a pattern (as in ``glob``) relative to the root
+        :returns: names of the files found in the order of reading them
+            (alphabetical for a folder)
+        """
+        return sorted(
+            _normalize(os.path.relpath(filename, self.path))
+            for filename in glob(os.path.join(self.path, *pattern.split("/")))
+            if os.path.isfile(filename)
+        )
+
+    def read_text(self, name: str) -> str:
+        """
+        Read a file.
+
+        :param name: a file name relative to the root
+        :returns: the file's content
+        """
+        with open(
+            os.path.join(self.path, name), "r", encoding="utf-8"
+        ) as text_file:
+            return text_file.read()
+
+    def open_text(self, name: str) -> TextIO:
+        """
+        Open a file to read it line by line.
+
+        :param name: a file name relative to the root
+        :returns: a text file object
+        """
+        # pylint: disable=consider-using-with
+        return open(os.path.join(self.path, name), "r", encoding="utf-8")
+
+    def file_key(self, name: str) -> FileKey:
+        """
+        Get a key changing together with a file's content.
+
+        :param name: a file name relative to the root
+        :returns: a full name of the file, its modification time and size
+        """
+        filename = os.path.realpath(os.path.join(self.path, name))
+        file_stat = os.stat(filename)
+        return filename, file_stat.st_mtime_ns, file_stat.st_size
+
+    def close(self) -> None:
+        """Do nothing (a folder needs no closing)."""
+
+
+def _reach(start: int, buffer: bytes, offset: int) -> int:
+    # a position up to which a state decompressed on the way to the offset
+    return min(start + len(buffer), offset) if start <= offset else -1
+
+
+class _ArchiveSource(FileSource):
+    def __init__(
+        self,
+        path: Union[str, "os.PathLike[str]"],
+        members: Iterable[Tuple[str, Any]],
+    ):
+        super().__init__(path)
+        named_members = dict(members)
+        prefix = next(
+            (
+                match.group(1)
+                for match in map(_ROOT.match, named_members)
+                if match is not None
+            ),
+            "",
+        )
+        self._members: Dict[str, Any] = {
+            _normalize(name[len(prefix) :]): member
+            for name, member in named_members.items()
+            if name.startswith(prefix)
+        }
+
+    def _member(self, name: str) -> Any:
+        member = self._members.get(_normalize(name))
+        if member is None:
+            raise FileNotFoundError(f"no such file in {self.path}: {name}")
+        return member
+
+    def glob(self, pattern: str) -> List[str]:
+        """
+        Find files by a pattern.
+
+        :param pattern: a pattern (as in ``glob``) relative to the root
+        :returns: names of the files found in the order of archive members
+        """
+        return [name for name in self._members if _matches(name, pattern)]
+
+
+class _IndexedGzip(
+    io.RawIOBase
+):  # pylint: disable=too-many-instance-attributes
+    r"""
+    A seekable stream of a gzip file's decompressed content.
+
+    A gzip file can be read only from the start, so while reading we save
+    decompressor's state every ``spacing`` bytes. Seeking in any direction
+    restores the nearest saved state and decompresses no more than
+    ``spacing`` bytes (except for the parts not yet read). The state left
+    by the last seek is kept too, so reading can continue from where it was
+    after a look elsewhere (e.g. at an included file).
+
+    >>> import gzip, random
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> data = bytes(random.Random(0).choices(b"ab\n", k=100000))
+    >>> with open(temp_folder / "data.gz", "wb") as gzip_file:
+    ...     _ = gzip_file.write(gzip.compress(data[:50000]))
+    ...     _ = gzip_file.write(gzip.compress(data[50000:]))
+    >>> stream = _IndexedGzip(str(temp_folder / "data.gz"), 1 << 12, 1 << 10)
+    >>> stream.read() == data, stream.read()
+    (True, b'')
+    >>> positions = random.Random(0).choices(range(100010), k=100)
+    >>> all(
+    ...     stream.seek(position) == position
+    ...     and stream.read(1000) == data[position : position + 1000]
+    ...     and stream.tell() == min(position + 1000, max(position, 100000))
+    ...     for position in positions
+    ... )
+    True
+    >>> len(stream._checkpoints) > 10
+    True
+    >>> stream.seek(200000), stream.read(), stream.tell()
+    (200000, b'', 200000)
+    >>> stream.readable(), stream.seekable()
+    (True, True)
+    >>> stream.seek(0, io.SEEK_END)
+    Traceback (most recent call last):
+     ...
+    io.UnsupportedOperation: only absolute positions are supported
+    >>> stream.close()
+    """
+
+    def __init__(self, filename: str, spacing: int, chunk_size: int = 1 << 16):
+        super().__init__()
+        # pylint: disable=consider-using-with
+        self._file = open(filename, "rb")
+        self._spacing = spacing
+        self._chunk_size = chunk_size
+        # decompressed and compressed positions and decompressor's states
+        self._checkpoints: List[Tuple[int, int, Any]] = [
+            (0, 0, zlib.decompressobj(_GZIP_WBITS))
+        ]
+        self._positions = [0]
+        # a state left by the last jump (to continue reading from it after
+        # reading something elsewhere)
+        self._parked: Optional[Tuple[int, int, Any, bytes]] = None
+        self._restore(self._checkpoints[0])
+
+    def _restore(self, checkpoint: Tuple[int, int, Any]) -> None:
+        self._start, compressed_position, decompressor = checkpoint
+        self._file.seek(compressed_position)
+        self._decompressor = decompressor.copy()
+        self._buffer = b""
+        self._offset = 0
+
+    def _decompress(self, compressed: bytes) -> bytes:
+        data = b""
+        while compressed:
+            if self._decompressor.eof:
+                # the next member of a multi-member file
+                self._decompressor = zlib.decompressobj(_GZIP_WBITS)
+            data += self._decompressor.decompress(compressed)
+            compressed = self._decompressor.unused_data
+        return data
+
+    def _next_chunk(self) -> bool:
+        end = self._start + len(self._buffer)
+        if end >= self._positions[-1] + self._spacing:
+            self._checkpoints.append(
+                (end, self._file.tell(), self._decompressor.copy())
+            )
+            self._positions.append(end)
+        compressed = self._file.read(self._chunk_size)
+        if not compressed:
+            return False
+        data = self._decompress(compressed)
+        self._offset -= len(self._buffer)
+        self._start, self._buffer = end, data
+        return True
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        count = 0
+        while count < len(buffer):
+            while self._offset >= len(self._buffer):
+                if not self._next_chunk():
+                    return count
+            size = min(len(buffer) - count, len(self._buffer) - self._offset)
+            buffer[count : count + size] = self._buffer[
+                self._offset : self._offset + size
+            ]
+            self._offset += size
+            count += size
+        return count
+
+    def _restore_parked(self) -> None:
+        self._start, position, self._decompressor, self._buffer = (
+            self._parked  # type: ignore
+        )
+        self._file.seek(position)
+
+    def _jump(self, offset: int) -> None:
+        # the live state, the parked one, or a checkpoint, whichever needs
+        # less decompression to reach the offset
+        checkpoint = self._checkpoints[
+            bisect_right(self._positions, offset) - 1
+        ]
+        parked_reach = (
+            -1
+            if self._parked is None
+            else _reach(self._parked[0], self._parked[3], offset)
+        )
+        if _reach(self._start, self._buffer, offset) >= max(
+            parked_reach, checkpoint[0]
+        ):
+            return
+        live = (
+            self._start,
+            self._file.tell(),
+            self._decompressor,
+            self._buffer,
+        )
+        if parked_reach >= checkpoint[0]:
+            self._restore_parked()
+        else:
+            self._restore(checkpoint)
+        self._parked = live
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence != io.SEEK_SET:
+            raise io.UnsupportedOperation(
+                "only absolute positions are supported"
+            )
+        self._jump(offset)
+        while self._start + len(self._buffer) < offset:
+            if not self._next_chunk():
+                break
+        self._offset = offset - self._start
+        return offset
+
+    def tell(self) -> int:
+        return self._start + self._offset
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+class TarSource(_ArchiveSource):
+    """
+    Files of a TPTP library kept in a tar archive.
+
+    .. _tar-source:
+
+    Members are listed when the archive is opened (so a compressed archive
+    is decompressed once). Then a gzip-compressed archive is read with the
+    decompressor's state saved every ``checkpoint_spacing`` bytes, so that
+    reading included files doesn't restart decompression from the start.
+    Reading files in the order given by ``glob`` streams the archive
+    sequentially. The root of the library (the folder containing
+    ``Problems`` or ``Axioms``) is found automatically.
+
+    >>> import sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> tptp_folder = (
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> for filename, mode in (("TPTP.tgz", "w:gz"), ("TPTP.tar", "w")):
+    ...     with tarfile.open(temp_folder / filename, mode) as archive:
+    ...         archive.add(tptp_folder, "TPTP-v0.0.0")
+    ...     tar_source = TarSource(str(temp_folder / filename))
+    ...     print(tar_source.glob("*/*/*"))
+    ...     print(tar_source.read_text("Problems/TST/TST001-1.p") == (
+    ...         FileSource(tptp_folder).read_text("Problems/TST/TST001-1.p")
+    ...     ))
+    ...     print(tar_source.file_key("Axioms/TST001-0.ax")[2])
+    ...     with tar_source.open_text("Axioms/TST001-0.ax") as text_file:
+    ...         print(text_file.readline().strip())
+    ...     tar_source.close()
+    ['Problems/TST/TST001-1.p']
+    True
+    150
+    %this is a test TPTP axioms file
+    ['Problems/TST/TST001-1.p']
+    True
+    150
+    %this is a test TPTP axioms file
+    >>> TarSource(str(temp_folder / "TPTP.tar")).read_text("Axioms/none.ax")
+    Traceback (most recent call last):
+     ...
+    FileNotFoundError: no such file in ...TPTP.tar: Axioms/none.ax
+    """
+
+    def __init__(self, path: str, checkpoint_spacing: int = 1 << 22):
+        """
+        Open an archive and list its members.
+
+        :param path: a tar archive (possibly, compressed)
+        :param checkpoint_spacing: how many decompressed bytes to read
+            between saving decompressor's state (for gzip)
+        """
+        with open(path, "rb") as archive:
+            gzipped = archive.read(2) == b"\x1f\x8b"
+        # pylint: disable=consider-using-with
+        self._tar = (
+            tarfile.open(
+                fileobj=_IndexedGzip(path, checkpoint_spacing),  # type: ignore
+                mode="r:",
+            )
+            if gzipped
+            else tarfile.open(path)
+        )
+        super().__init__(
+            path,
+            (
+                (member.name, member)
+                for member in self._tar.getmembers()
+                if member.isfile()
+            ),
+        )
+
+    def read_text(self, name: str) -> str:
+        """
+        Read a file.
+
+        :param name: a file name relative to the root
+        :returns: the file's content
+        """
+        text_file = self._tar.extractfile(self._member(name))
+        return text_file.read().decode("utf-8")  # type: ignore
+
+    def open_text(self, name: str) -> TextIO:
+        """
+        Open a file to read it line by line.
+
+        :param name: a file name relative to the root
+        :returns: a text file object
+        """
+        return io.TextIOWrapper(
+            self._tar.extractfile(self._member(name)),  # type: ignore
+            encoding="utf-8",
+        )
+
+    def file_key(self, name: str) -> FileKey:
+        """
+        Get a key changing together with a file's content.
+
+        :param name: a file name relative to the root
+        :returns: a full name of the file, its modification time and size
+        """
+        member = self._member(name)
+        return os.path.join(self.path, name), member.mtime, member.size
+
+    def close(self) -> None:
+        """Close the archive."""
+        self._tar.close()
+        if self._tar.fileobj is not None:
+            self._tar.fileobj.close()
+
+
+class ZipSource(_ArchiveSource):
+    """
+    Files of a TPTP library kept in a zip archive.
+
+    .. _zip-source:
+
+    Any member of a zip archive can be read without reading the others.
+    The root of the library (the folder containing ``Problems`` or
+    ``Axioms``) is found automatically.
+
+    >>> import sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> tptp_folder = (
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> file_source = FileSource(tptp_folder)
+    >>> with zipfile.ZipFile(temp_folder / "TPTP.zip", "w") as archive:
+    ...     for name in file_source.glob("*/*") + file_source.glob("*/*/*"):
+    ...         archive.write(os.path.join(tptp_folder, name), name)
+    ...     archive.writestr("README", "not a part of the library")
+    >>> zip_source = ZipSource(str(temp_folder / "TPTP.zip"))
+    >>> zip_source.glob("*")
+    ['README']
+    >>> zip_source.read_text("Axioms/TST001-0.ax") == (
+    ...     file_source.read_text("Axioms/TST001-0.ax")
+    ... )
+    True
+    >>> zip_source.file_key("Axioms/TST001-0.ax")[2]
+    150
+    >>> with zip_source.open_text("Axioms/TST001-0.ax") as text_file:
+    ...     print(text_file.readline().strip())
+    %this is a test TPTP axioms file
+    >>> zip_source.close()
+    """
+
+    def __init__(self, path: str):
+        """
+        Open an archive and list its members.
+
+        :param path: a zip archive
+        """
+        # pylint: disable=consider-using-with
+        self._zip = zipfile.ZipFile(path)
+        super().__init__(
+            path,
+            (
+                (member.filename, member)
+                for member in self._zip.infolist()
+                if not member.is_dir()
+            ),
+        )
+
+    def read_text(self, name: str) -> str:
+        """
+        Read a file.
+
+        :param name: a file name relative to the root
+        :returns: the file's content
+        """
+        return self._zip.read(self._member(name)).decode("utf-8")
+
+    def open_text(self, name: str) -> TextIO:
+        """
+        Open a file to read it line by line.
+
+        :param name: a file name relative to the root
+        :returns: a text file object
+        """
+        return io.TextIOWrapper(
+            self._zip.open(self._member(name)), encoding="utf-8"
+        )
+
+    def file_key(self, name: str) -> FileKey:
+        """
+        Get a key changing together with a file's content.
+
+        :param name: a file name relative to the root
+        :returns: a full name of the file, its checksum and size
+        """
+        member = self._member(name)
+        return os.path.join(self.path, name), member.CRC, member.file_size
+
+    def close(self) -> None:
+        """Close the archive."""
+        self._zip.close()
+
+
+def open_file_source(
+    path: Union[str, "os.PathLike[str]", FileSource],
+) -> FileSource:
+    """
+    Choose a source of files by a path.
+
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> file_source = open_file_source(temp_folder)
+    >>> type(file_source).__name__
+    'FileSource'
+    >>> open_file_source(file_source) is file_source
+    True
+    >>> with zipfile.ZipFile(temp_folder / "TPTP.zip", "w") as archive:
+    ...     archive.writestr("Axioms/A.ax", "")
+    >>> type(open_file_source(str(temp_folder / "TPTP.zip"))).__name__
+    'ZipSource'
+    >>> with tarfile.open(temp_folder / "TPTP.tgz", "w:gz") as archive:
+    ...     archive.add(temp_folder / "TPTP.zip", "TPTP.zip")
+    >>> type(open_file_source(str(temp_folder / "TPTP.tgz"))).__name__
+    'TarSource'
+
+    :param path: a folder, an archive (``.zip`` or ``.tar`` possibly
+        compressed), or a source to be returned as it is
+    :returns: a source of files
+    """
+    if isinstance(path, FileSource):
+        return path
+    if not os.path.isfile(path):
+        return FileSource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(str(path))
+    return TarSource(str(path))
@@ -17,9 +17,21 @@
 Grammar
 ********
 """
-from dataclasses import dataclass, field
-from typing import Optional, Tuple, Union
+from dataclasses import dataclass, fields
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
 from uuid import uuid1
+from weakref import WeakValueDictionary
 
 FALSEHOOD_SYMBOL = "$false"
 FALSEHOOD_SYMBOL_ID = 0
@@ -29,8 +41,157 @@ INEQUALITY_SYMBOL = "!="
 INEQUALITY_SYMBOL_ID = 2
 
 
+_LAZY_LABEL = cast(str, object())
+
+
+class _Compact:
+    """
+    A base for frozen dataclasses using ``__slots__`` and a cached hash.
+
+    Instances have no ``__dict__`` and can be weakly referenced. Hashes of
+    nested terms are computed bottom-up and cached, so hashing of a deep term
+    is linear in its size only for the first time. Neither hashing nor
+    comparison is recursive, so terms of any depth are fine.
+
+    >>> def deep_term(depth):
+    ...     term = Variable(0)
+    ...     for _ in range(depth):
+    ...         term = Function(0, (term,))
+    ...     return term
+    >>> hash(deep_term(5000)) == hash(deep_term(5000))
+    True
+    >>> deep_term(5000) == deep_term(5000), deep_term(5000) == deep_term(4999)
+    (True, False)
+    >>> Clause((Literal(False, Predicate(0, ())),), "a") == Clause((), "a")
+    False
+    >>> Variable(0) == Function(0, ()), Variable(0).__eq__(0)
+    (False, NotImplemented)
+    """
+
+    __slots__ = ()
+    _hash: int
+    _field_names: Tuple[str, ...]
+    _dataclass_hash: Callable[[], int]
+
+    def __hash__(self) -> int:
+        """Compute the hash only once."""
+        try:
+            return self._hash
+        except AttributeError:
+            _hash_bottom_up(self)
+            return self._hash
+
+    def __eq__(self, other: Any) -> bool:
+        """
+        Compare field values like a dataclass does but without recursion.
+
+        :param other: another object
+        :returns: whether the objects are equal
+        """
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        pairs: List[Tuple[Any, Any]] = [(self, other)]
+        while pairs:
+            nested_pairs = _nested_pairs(*pairs.pop())
+            if nested_pairs is None:
+                return False
+            pairs.extend(nested_pairs)
+        return True
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        """Get field values for pickling."""
+        return tuple(
+            getattr(self, field_name) for field_name in self._field_names
+        )
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        """Set field values after unpickling."""
+        for field_name, value in zip(self._field_names, state):
+            object.__setattr__(self, field_name, value)
+
+
+def _nested_pairs(
+    left: Any, right: Any
+) -> Optional[Iterable[Tuple[Any, Any]]]:
+    if left is right:
+        return ()
+    if isinstance(left, _Compact) and left.__class__ is right.__class__:
+        return zip(left.__getstate__(), right.__getstate__())
+    if (
+        isinstance(left, tuple)
+        and isinstance(right, tuple)
+        and len(left) == len(right)
+    ):
+        return zip(left, right)
+    return None if left != right else ()
+
+
+def _unhashed_children(item: _Compact) -> Iterator[_Compact]:
+    for value in item.__getstate__():
+        for child in value if isinstance(value, tuple) else (value,):
+            if isinstance(child, _Compact) and not hasattr(child, "_hash"):
+                yield child
+
+
+def _hash_bottom_up(item: _Compact) -> None:
+    stack = [(item, False)]
+    while stack:
+        current, children_hashed = stack.pop()
+        if children_hashed:
+            # pylint: disable=protected-access
+            object.__setattr__(current, "_hash", current._dataclass_hash())
+        else:
+            stack.append((current, True))
+            stack.extend(
+                (child, False) for child in _unhashed_children(current)
+            )
+
+
+def _compact(cls: type) -> type:
+    """
+    Recreate a frozen dataclass with ``__slots__`` for all its fields.
+
+    :param cls: a frozen dataclass derived from ``_Compact``
+    :returns: a slotted copy of the class
+    """
+    field_names = tuple(item_field.name for item_field in fields(cls))
+    class_dict = {
+        key: value
+        for key, value in cls.__dict__.items()
+        if key not in field_names + ("__dict__", "__weakref__")
+    }
+    class_dict["__slots__"] = field_names + ("_hash", "__weakref__")
+    class_dict["_field_names"] = field_names
+    class_dict["_dataclass_hash"] = class_dict["__hash__"]
+    class_dict["__hash__"] = _Compact.__hash__
+    class_dict["__eq__"] = _Compact.__eq__
+    slotted_class = type(cls)(cls.__name__, cls.__bases__, class_dict)
+    slotted_class.__qualname__ = cls.__qualname__
+    return slotted_class
+
+
+class _LazyLabel:
+    """A slot which gets a unique label when read before being set."""
+
+    def __init__(self, slot: Any):
+        self.slot = slot
+
+    def __get__(self, instance: Any, owner: Any) -> Any:
+        try:
+            return self.slot.__get__(instance, owner)
+        except AttributeError:
+            label = "x" + str(uuid1()).replace("-", "_")
+            self.slot.__set__(instance, label)
+            return label
+
+    def __set__(self, instance: Any, value: str) -> None:
+        if value is not _LAZY_LABEL:
+            self.slot.__set__(instance, value)
+
+
+@_compact
 @dataclass(frozen=True)
-class Variable:
+class Variable(_Compact):
     """
     A variable is characterised only by its name.
 
@@ -40,8 +201,9 @@ class Variable:
     index: int
 
 
+@_compact
 @dataclass(frozen=True)
-class Function:
+class Function(_Compact):
     """
     A functional symbol might be applied to a list of arguments.
 
@@ -60,8 +222,9 @@ Term is either a :ref:`Variable <Variable>` or a :ref:`Function <Function>`
 """
 
 
+@_compact
 @dataclass(frozen=True)
-class Predicate:
+class Predicate(_Compact):
     """
     A predicate symbol might be applied to a list of arguments.
 
@@ -80,8 +243,9 @@ Proposition is either a :ref:`Predicate <Predicate>` or a :ref:`Term <Term>`
 """
 
 
+@_compact
 @dataclass(frozen=True)
-class Literal:
+class Literal(_Compact):
     """
     Literal is an atom which can be negated or not.
 
@@ -92,8 +256,9 @@ class Literal:
     atom: Predicate
 
 
+@_compact
 @dataclass(frozen=True)
-class Clause:
+class Clause(_Compact):
     """
     Clause is a disjunction of literals.
 
@@ -112,14 +277,110 @@ class Clause:
          processed ones; in the beginning, everything is not processed
     :param birth_step: a number of the step when the clause appeared in the
          unprocessed set; clauses from the problem have ``birth_step`` zero
+
+    If no label is given, a unique one is generated when it's first read
+
+    >>> clause = Clause(literals=())
+    >>> clause.label.startswith("x")
+    True
+    >>> clause.label == clause.label
+    True
+    >>> clause == Clause(literals=())
+    False
+    >>> import pickle
+    >>> pickle.loads(pickle.dumps(clause)) == clause
+    True
+    >>> hash(clause) == hash(Clause((), label=clause.label))
+    True
+    >>> clause.__dict__
+    Traceback (most recent call last):
+     ...
+    AttributeError: 'Clause' object has no attribute '__dict__'...
     """
 
     literals: Tuple[Literal, ...]
-    label: str = field(
-        default_factory=lambda: "x" + str(uuid1()).replace("-", "_")
-    )
+    label: str = _LAZY_LABEL
     role: str = "lemma"
     inference_parents: Optional[Tuple[str, ...]] = None
     inference_rule: Optional[str] = None
     processed: Optional[bool] = None
     birth_step: Optional[int] = None
+
+
+setattr(Clause, "label", _LazyLabel(Clause.__dict__["label"]))
+
+
+@_compact
+@dataclass(frozen=True)
+class Include(_Compact):
+    """
+    An include directive of a TPTP file.
+
+    .. _Include:
+
+    :param file_name: a name of the included file relative to the TPTP folder
+    :param formula_selection: names of the annotated formulae to take from
+        the file (all of them if ``None``)
+    """
+
+    file_name: str
+    formula_selection: Optional[Tuple[str, ...]] = None
+
+
+_Interned = TypeVar("_Interned", Variable, Function, Predicate, Literal)
+
+
+class InternTable:
+    """
+    A table of shared variables, terms, predicates and literals.
+
+    .. _InternTable:
+
+    Equal structures are replaced with one instance (hash consing), so they
+    take memory only once and comparing them mostly comes to an identity
+    check. The table holds weak references, so it never keeps alive
+    anything not used elsewhere. One table can be shared by several parsers
+    (e.g. for a whole corpus).
+
+    The arguments of an interned structure are supposed to be interned by
+    the same table (as ``CNFParser`` does it bottom-up).
+
+    >>> intern_table = InternTable()
+    >>> constant = intern_table.intern(Function(0, ()))
+    >>> term = intern_table.intern(Function(1, (constant, constant)))
+    >>> intern_table.intern(Function(0, ())) is constant
+    True
+    >>> intern_table.intern(Function(1, (constant, constant))) is term
+    True
+    >>> len(intern_table)
+    2
+    >>> del term
+    >>> len(intern_table)
+    1
+    """
+
+    def __init__(self) -> None:
+        """Create an empty table."""
+        self._table: "WeakValueDictionary[Tuple[Any, ...], Any]" = (
+            WeakValueDictionary()
+        )
+
+    def __len__(self) -> int:
+        """
+        Count structures currently shared.
+
+        :returns: the number of live interned structures
+        """
+        return len(self._table)
+
+    def intern(self, item: _Interned) -> _Interned:
+        """
+        Get a shared instance equal to a given one.
+
+        :param item: a variable, a term, a predicate, or a literal
+        :returns: a previously interned equal instance or the item itself
+        """
+        key = (item.__class__,) + tuple(
+            getattr(item, item_field.name) for item_field in fields(item)
+        )
+        return self._table.setdefault(key, item)
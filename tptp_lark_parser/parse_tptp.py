@@ -16,18 +16,329 @@ import json
 import logging
 import os
 import sys
-from glob import glob
-from typing import Optional
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from tptp_lark_parser import TPTPParser
+from tptp_lark_parser.cnf_parser import CNFParser
+from tptp_lark_parser.file_source import FileSource
+from tptp_lark_parser.problem_header import HeaderFilter, select_problems
+from tptp_lark_parser.profiling import ParseStats
+from tptp_lark_parser.symbol_table import SymbolTable
 
+# a parser and its initial symbols in a worker process
+_WORKER_STATE: Dict[str, Any] = {}
+# a problem name (relative to the TPTP root), new symbols found (by kind),
+# an error message and parsing stats
+_Result = Tuple[
+    str, Optional[Dict[str, List[str]]], Optional[str], Optional[ParseStats]
+]
+# CNF problems except for the domains with very big ones
+DEFAULT_PROBLEM_FILTER = HeaderFilter(
+    languages=("cnf",),
+    excluded_domains=("CSR", "HWV", "KRS", "PLA", "SWV", "SYN", "SYO"),
+)
 
-def _read_and_parse_file(
-    tptp_parser: TPTPParser, problem_filename: str
+
+def _init_worker(
+    tptp_folder: str,
+    learn_new_tokens: bool,
+    tokens_filename: Optional[str],
+    profile: bool = False,
 ) -> None:
-    with open(problem_filename, "r", encoding="utf-8") as problem_file:
-        problem_text = problem_file.read()
-    tptp_parser.parse(problem_text)
+    # no include cache, so each problem's new symbols come from a clean start
+    tptp_parser = TPTPParser(
+        tptp_folder, learn_new_tokens, tokens_filename, include_cache_size=0
+    )
+    _WORKER_STATE["tptp_parser"] = tptp_parser
+    _WORKER_STATE["symbol_table"] = tptp_parser.cnf_parser.symbol_table
+    _WORKER_STATE["profile"] = profile
+
+
+def _parse_problem(problem_name: str) -> _Result:
+    """
+    Parse a problem in a worker process.
+
+    Every problem is parsed starting from the same initial symbols, so that
+    the new ones are listed in the order of their first occurrence in this
+    problem (and its includes) independently of other problems.
+
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> tptp_folder = str(
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> _init_worker(tptp_folder, True, None)
+    >>> problem_name = "Problems/TST/TST001-1.p"
+    >>> _, new_symbols, _, _ = _parse_problem(problem_name)
+    >>> new_symbols["functions"]
+    ['test_constant', 'this_is_a_test_case', 'test_constant_2', '0']
+    >>> _parse_problem(problem_name)[1] == new_symbols
+    True
+    >>> _init_worker(tptp_folder, False, None, True)
+    >>> _, _, error, stats = _parse_problem(problem_name)
+    >>> print(error)
+    VisitError(...unknown symbol: test_constant')
+    >>> list(stats.files)
+    ['Problems/TST/TST001-1.p']
+
+    :param problem_name: a TPTP problem file relative to the TPTP root
+    :returns: the problem name, new symbols found (by kind), an
+        error message (if any) and parsing stats (if profiling)
+    """
+    tptp_parser: TPTPParser = _WORKER_STATE["tptp_parser"]
+    symbol_table: SymbolTable = _WORKER_STATE["symbol_table"]
+    tptp_parser.cnf_parser.symbol_table = symbol_table.snapshot()
+    stats = tptp_parser.observer = (
+        ParseStats() if _WORKER_STATE["profile"] else None
+    )
+    try:
+        tptp_parser.parse_file(problem_name)
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        return problem_name, None, repr(error), stats
+    return (
+        problem_name,
+        tptp_parser.cnf_parser.symbol_table.new_symbols(symbol_table.counts()),
+        None,
+        stats,
+    )
+
+
+class _Checkpoint:
+    """
+    An append-only log of parsed problems and new symbols found in them.
+
+    Every line of the log is a JSON object with a list of problems (named
+    relative to the TPTP root, however the root is spelled) and the symbols
+    (by kind) which were new after parsing them. From time to time
+    the symbols are written to the output file, and the log is compacted to
+    one line listing all parsed problems. The problems failed to parse are
+    not logged (they are parsed again when resuming).
+    """
+
+    def __init__(self, output_file: str, compact_every: int, resume: bool):
+        """
+        Open the log next to the output file.
+
+        :param output_file: where to save tokens found
+        :param compact_every: how many problems to parse between compactions
+        :param resume: if ``False``, the previous log is removed
+        """
+        self.output_file = output_file
+        self.log_filename = output_file + ".log"
+        if not resume and os.path.exists(self.log_filename):
+            os.remove(self.log_filename)
+        self.compact_every = compact_every
+        self.done: Set[str] = set()
+        # error messages of the problems failed to parse during this run
+        self.failures: Dict[str, str] = {}
+        self._not_compacted = 0
+
+    def restore(self, cnf_parser: CNFParser) -> None:
+        """
+        Add symbols from the log to a parser and remember parsed problems.
+
+        A line broken by a crash ends the log.
+
+        :param cnf_parser: a parser to add symbols to
+        """
+        if not os.path.exists(self.log_filename):
+            return
+        with open(self.log_filename, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                cnf_parser.symbol_table.update(record["symbols"])
+                self.done.update(record["problems"])
+
+    def _write(
+        self,
+        problems: List[str],
+        symbols: Dict[str, List[str]],
+        log_filename: str,
+        mode: str,
+    ) -> None:
+        with open(log_filename, mode, encoding="utf-8") as log_file:
+            log_file.write(
+                json.dumps({"problems": problems, "symbols": symbols}) + "\n"
+            )
+
+    def append(
+        self,
+        problem: str,
+        symbols: Dict[str, List[str]],
+        cnf_parser: CNFParser,
+    ) -> None:
+        """
+        Log a parsed problem and compact the log if it's time.
+
+        :param problem: a parsed problem file
+        :param symbols: new symbols found in the problem
+        :param cnf_parser: a parser with all the symbols found so far
+        """
+        self._write([problem], symbols, self.log_filename, "a")
+        self.done.add(problem)
+        self._not_compacted += 1
+        if self._not_compacted >= self.compact_every:
+            self.compact(cnf_parser)
+
+    def compact(self, cnf_parser: CNFParser) -> None:
+        """
+        Save all symbols to the output file and shorten the log.
+
+        :param cnf_parser: a parser with all the symbols found so far
+        """
+        cnf_parser.symbol_table.save(self.output_file)
+        self._write(sorted(self.done), {}, self.log_filename + ".tmp", "w")
+        os.replace(self.log_filename + ".tmp", self.log_filename)
+        self._not_compacted = 0
+
+
+def _merge_stats(tptp_parser: TPTPParser, stats: Optional[ParseStats]) -> None:
+    if isinstance(tptp_parser.observer, ParseStats) and stats is not None:
+        tptp_parser.observer.merge(stats)
+
+
+def _skip_problem(
+    checkpoint: _Checkpoint, problem: str, error: Optional[str]
+) -> None:
+    logging.getLogger().error("%s failed: %s", problem, error)
+    checkpoint.failures[problem] = str(error)
+
+
+def _drop_symbols(tptp_parser: TPTPParser, counts: Dict[str, int]) -> None:
+    # like in a worker, symbols of a failed problem are dropped (and included
+    # files parsed with them)
+    tptp_parser.cnf_parser.symbol_table.truncate(counts)
+    tptp_parser.clear_include_cache()
+
+
+def _apply_result(
+    tptp_parser: TPTPParser,
+    checkpoint: _Checkpoint,
+    result: _Result,
+    progress: str,
+) -> None:
+    problem, new_symbols, error, stats = result
+    _merge_stats(tptp_parser, stats)
+    if new_symbols is None:
+        _skip_problem(checkpoint, problem, error)
+    else:
+        counts = tptp_parser.cnf_parser.symbol_table.counts()
+        tptp_parser.cnf_parser.symbol_table.update(new_symbols)
+        checkpoint.append(
+            problem,
+            tptp_parser.cnf_parser.symbol_table.new_symbols(counts),
+            tptp_parser.cnf_parser,
+        )
+        logging.getLogger().info("%s done (%s)", problem, progress)
+
+
+def _parse_in_parallel(
+    tptp_parser: TPTPParser,
+    cnf_problems: Dict[str, int],
+    checkpoint: _Checkpoint,
+    tokens_filename: Optional[str],
+    workers: int,
+) -> None:
+    in_order = list(cnf_problems)
+    results: Dict[str, _Result] = {}
+    done = 0
+    with Pool(
+        workers,
+        _init_worker,
+        (
+            tptp_parser.tptp_folder,
+            tptp_parser.cnf_parser.extendable,
+            tokens_filename,
+            tptp_parser.observer is not None,
+        ),
+    ) as pool:
+        # the largest problems are sent to workers first, but the results
+        # are applied in the original order, so symbol IDs are the same as
+        # in a sequential run
+        for result in pool.imap_unordered(
+            _parse_problem,
+            sorted(in_order, key=cnf_problems.__getitem__, reverse=True),
+        ):
+            results[result[0]] = result
+            while done < len(in_order) and in_order[done] in results:
+                done += 1
+                _apply_result(
+                    tptp_parser,
+                    checkpoint,
+                    results.pop(in_order[done - 1]),
+                    f"{done}/{len(in_order)}",
+                )
+
+
+def _parse_sequentially(
+    tptp_parser: TPTPParser,
+    cnf_problems: Dict[str, int],
+    checkpoint: _Checkpoint,
+) -> None:
+    for done, problem in enumerate(cnf_problems, 1):
+        counts = tptp_parser.cnf_parser.symbol_table.counts()
+        try:
+            tptp_parser.parse_file(problem)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _drop_symbols(tptp_parser, counts)
+            _skip_problem(checkpoint, problem, repr(error))
+        else:
+            checkpoint.append(
+                problem,
+                tptp_parser.cnf_parser.symbol_table.new_symbols(counts),
+                tptp_parser.cnf_parser,
+            )
+            logging.getLogger().info(
+                "%s done (%s)", problem, f"{done}/{len(cnf_problems)}"
+            )
+
+
+def _find_cnf_problems(
+    file_source: FileSource, done: Set[str], problem_filter: HeaderFilter
+) -> Dict[str, int]:
+    # sizes of problems in the order of reading (so an archive is read
+    # sequentially)
+    return {
+        header.name: header.size
+        for header in select_problems(
+            file_source,
+            (
+                name
+                for name in file_source.glob("Problems/*/*.p")
+                if name not in done
+            ),
+            problem_filter,
+        )
+    }
+
+
+def _parse_problems(
+    tptp_parser: TPTPParser,
+    checkpoint: _Checkpoint,
+    tokens_filename: Optional[str],
+    workers: int,
+    problem_filter: HeaderFilter,
+) -> Dict[str, str]:
+    cnf_problems = _find_cnf_problems(
+        tptp_parser.file_source, checkpoint.done, problem_filter
+    )
+    try:
+        if workers > 1:
+            _parse_in_parallel(
+                tptp_parser, cnf_problems, checkpoint, tokens_filename, workers
+            )
+        else:
+            _parse_sequentially(tptp_parser, cnf_problems, checkpoint)
+    finally:
+        checkpoint.compact(tptp_parser.cnf_parser)
+    return checkpoint.failures
 
 
 def _get_logger(level: int) -> logging.Logger:
@@ -38,16 +349,32 @@ def _get_logger(level: int) -> logging.Logger:
     return logger
 
 
+# pylint: disable=too-many-arguments
 def parse_tptp(
     tptp_folder: str,
     output_file: str,
     logging_level: int,
     tokens_filename: Optional[str],
     learn_new_tokens: bool,
-) -> None:
+    *,
+    workers: int = 1,
+    resume: bool = False,
+    compact_every: int = 1000,
+    problem_filter: HeaderFilter = DEFAULT_PROBLEM_FILTER,
+    stats: Optional[ParseStats] = None,
+) -> Dict[str, str]:
     """
     Parse all TPTP CNF problems and write all symbols encountered.
 
+    With several workers, problems are parsed in separate processes. Symbol
+    IDs are still the same as in a sequential run. In both cases, the
+    problems failed to parse are logged and skipped (with the symbols found
+    in them before the failure).
+
+    Parsed problems and new symbols are appended to a log
+    (``output_file`` with ``.log`` suffix). The output file is rewritten only
+    from time to time and at the end of the run (even a failed one).
+
     >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
     ...     from importlib.resources import files
     ... else:
@@ -61,42 +388,154 @@ def parse_tptp(
     >>> os.path.exists(output_file)
     False
     >>> parse_tptp(tptp_folder, output_file, logging.FATAL, None, True)
+    {}
     >>> parse_tptp(tptp_folder, output_file, logging.FATAL, output_file, False)
+    {}
+    >>> import shutil
+    >>> _ = shutil.copytree(tptp_folder, temp_folder / "TPTP")
+    >>> with open(temp_folder / "TPTP" / "Problems" / "TST" / "TST002-1.p",
+    ...           "w") as problem_file:
+    ...     _ = problem_file.write("cnf(a, axiom, new(X) | ~p(f(Y))).")
+    >>> with open(temp_folder / "TPTP" / "Problems" / "TST" / "TST003-1.p",
+    ...           "w") as problem_file:
+    ...     _ = problem_file.write("cnf(broken, axiom, p(X) |).")
+    >>> parallel_failures = parse_tptp(str(temp_folder / "TPTP"),
+    ...     output_file, logging.FATAL, None, True, workers=2)
+    >>> with open(output_file) as tokens_file:
+    ...     parallel_tokens = json.load(tokens_file)
+    >>> failures = parse_tptp(str(temp_folder / "TPTP"), output_file,
+    ...     logging.FATAL, None, True, compact_every=1)
+    >>> failures
+    {'Problems/TST/TST003-1.p': 'UnexpectedToken()'}
+    >>> failures == parallel_failures
+    True
+    >>> with open(output_file) as tokens_file:
+    ...     parallel_tokens == json.load(tokens_file)
+    True
+
+    A failed problem adds no symbols and is parsed again when resuming
+
+    >>> with open(temp_folder / "TPTP" / "Problems" / "TST" / "TST003-1.p",
+    ...           "w") as problem_file:
+    ...     _ = problem_file.write(
+    ...         "cnf(a, axiom, newest(X)). include('Axioms/missing.ax')."
+    ...     )
+    >>> for workers in (1, 2):
+    ...     failures = parse_tptp(str(temp_folder / "TPTP"), output_file,
+    ...         logging.FATAL, None, True, workers=workers)
+    ...     with open(output_file) as tokens_file:
+    ...         predicates = json.load(tokens_file)["predicates"]
+    ...     print(list(failures), "newest" in predicates)
+    ['Problems/TST/TST003-1.p'] False
+    ['Problems/TST/TST003-1.p'] False
+
+    After a crash, we can continue from where we stopped (even if the TPTP
+    folder is spelled differently)
 
-    :param tptp_folder: a folder with TPTP dump
+    >>> with open(temp_folder / "TPTP" / "Problems" / "TST" / "TST003-1.p",
+    ...           "w") as problem_file:
+    ...     _ = problem_file.write("cnf(fixed, axiom, newer(X)).")
+    >>> with open(output_file + ".log", "a") as log_file:
+    ...     _ = log_file.write('{"problems": ["TST00')
+    >>> from tptp_lark_parser.profiling import ParseStats
+    >>> resumed_stats = ParseStats()
+    >>> parse_tptp(os.path.relpath(temp_folder / "TPTP"), output_file,
+    ...     logging.FATAL, None, True, resume=True, stats=resumed_stats)
+    {}
+    >>> list(resumed_stats.files)
+    ['Problems/TST/TST003-1.p']
+    >>> with open(output_file) as tokens_file:
+    ...     resumed_tokens = json.load(tokens_file)
+    >>> parse_tptp(str(temp_folder / "TPTP"), output_file, logging.FATAL,
+    ...     None, True, workers=2)
+    {}
+    >>> with open(output_file) as tokens_file:
+    ...     resumed_tokens == json.load(tokens_file)
+    True
+    >>> resumed_tokens["predicates"][-3:]
+    ['new', 'p', 'newer']
+
+    Problems can be selected by their headers (before parsing them)
+
+    >>> from tptp_lark_parser.problem_header import HeaderFilter
+    >>> parse_tptp(str(temp_folder / "TPTP"), output_file, logging.FATAL,
+    ...     None, True, problem_filter=HeaderFilter(max_size=30))
+    {}
+    >>> with open(output_file) as tokens_file:
+    ...     predicates = json.load(tokens_file)["predicates"]
+    >>> "new" in predicates, "newer" in predicates
+    (False, True)
+
+    The time spent in each phase of parsing can be measured
+
+    >>> from tptp_lark_parser.profiling import ParseStats
+    >>> sequential_stats, parallel_stats = ParseStats(), ParseStats()
+    >>> parse_tptp(str(temp_folder / "TPTP"), output_file, logging.FATAL,
+    ...     None, True, stats=sequential_stats)
+    {}
+    >>> parse_tptp(str(temp_folder / "TPTP"), output_file, logging.FATAL,
+    ...     None, True, workers=2, stats=parallel_stats)
+    {}
+    >>> sorted(parallel_stats.files)
+    ['Axioms/TST001-0.ax', 'Problems/TST/TST001-1.p', ...]
+    >>> for stats in (sequential_stats, parallel_stats):
+    ...     print(stats.phases["transform"].clauses)
+    6
+    6
+
+    The TPTP library can be read from an archive without extracting it
+
+    >>> import tarfile
+    >>> with tarfile.open(temp_folder / "TPTP.tgz", "w:gz") as archive:
+    ...     archive.add(temp_folder / "TPTP", "TPTP-v0.0.0")
+    >>> parse_tptp(str(temp_folder / "TPTP.tgz"), output_file, logging.FATAL,
+    ...     None, True)
+    {}
+    >>> with open(output_file) as tokens_file:
+    ...     resumed_tokens == json.load(tokens_file)
+    True
+
+    :param tptp_folder: a folder with TPTP dump or an archive of it
+        (``.zip`` or ``.tar`` possibly compressed). Problems in an archive
+        are parsed in the order of its members
     :param output_file: where to save tokens found
     :param logging_level: what to log
     :param tokens_filename: a filename of known tokens storage
     :param learn_new_tokens: if ``False``, then parsing fails when encounters
         an unknown token
+    :param workers: a number of processes to parse problems in
+    :param resume: if ``True``, skip the problems parsed during the previous
+        run with the same ``output_file``, keeping the symbols found there
+    :param compact_every: how many problems to parse between rewrites of the
+        output file
+    :param problem_filter: which problems to parse (judging by their
+        headers). By default, CNF problems except for several domains with
+        very big ones
+    :param stats: where to collect the time and the amount of work spent in
+        each phase of parsing (by problem and in total). Its summary is
+        logged at the end of the run
+    :returns: error messages of the problems failed to parse (by problem
+        names relative to the TPTP root)
     """
-    logger = _get_logger(logging_level)
-    tptp_parser = TPTPParser(tptp_folder, learn_new_tokens, tokens_filename)
-    cnf_problems = sorted(
-        [
-            problem
-            for problem in glob(
-                os.path.join(tptp_folder, "Problems", "*", "*-*.p")
-            )
-            if "CSR" not in problem
-            and "HWV" not in problem
-            and "KRS" not in problem
-            and "PLA" not in problem
-            and "SWV" not in problem
-            and "SYN" not in problem
-            and "SYO" not in problem
-        ]
-    )
-    for problem in cnf_problems:
-        _read_and_parse_file(tptp_parser, problem)
-        # we save lists on every iteration because the next one may fail
-        tokens = {
-            key: list(value.keys())
-            for key, value in tptp_parser.cnf_parser.token_map.items()
-        }
-        with open(output_file, "w", encoding="utf-8") as tokens_file:
-            json.dump(tokens, tokens_file)
-        logger.info("%s done", problem)
+    _get_logger(logging_level)
+    checkpoint = _Checkpoint(output_file, compact_every, resume)
+    with TPTPParser(
+        tptp_folder,
+        learn_new_tokens,
+        (
+            output_file
+            if resume and os.path.exists(output_file)
+            else tokens_filename
+        ),
+        observer=stats,
+    ) as tptp_parser:
+        checkpoint.restore(tptp_parser.cnf_parser)
+        failures = _parse_problems(
+            tptp_parser, checkpoint, tokens_filename, workers, problem_filter
+        )
+    if stats is not None:
+        logging.getLogger().info(stats.summary())
+    return failures
 
 
 if __name__ == "__main__":
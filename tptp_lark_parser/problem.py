@@ -0,0 +1,147 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Problem
+========
+"""
+
+from typing import (
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+from tptp_lark_parser.grammar import Clause, Include
+
+# a text of a ``cnf`` statement, its name and role
+Statement = Tuple[str, str, str]
+
+
+class Problem(Sequence[Clause]):
+    """
+    Clauses of a problem parsed on demand.
+
+    .. _problem:
+
+    Statements are split and their names and roles are read when the
+    problem is created, but a clause is parsed only when it's accessed for
+    the first time (and kept for the next accesses). The text of a
+    statement is dropped once its clause is parsed.
+
+    >>> from tptp_lark_parser.grammar import Literal, Predicate
+    >>> def parse_statement(statement):
+    ...     print("parsing", statement)
+    ...     return Clause((Literal(False, Predicate(0, ())),), "a")
+    >>> problem = Problem(
+    ...     [("cnf(a, axiom, p).", "a", "axiom"),
+    ...      ("cnf(b, hypothesis, q).", "b", "hypothesis")],
+    ...     [Include("Axioms/A.ax")],
+    ...     parse_statement,
+    ... )
+    >>> len(problem), problem.labels, problem.roles, problem.parsed
+    (2, ('a', 'b'), ('axiom', 'hypothesis'), 0)
+    >>> problem.includes
+    (Include(file_name='Axioms/A.ax', formula_selection=None),)
+    >>> problem[-2] is problem[0]
+    parsing cnf(a, axiom, p).
+    True
+    >>> len(problem.materialize())
+    parsing cnf(b, hypothesis, q).
+    2
+    >>> problem[::-1] == problem.materialize()[::-1]
+    True
+    >>> problem.parsed
+    2
+    """
+
+    def __init__(
+        self,
+        statements: Sequence[Statement],
+        includes: Sequence[Include],
+        parse_statement: Callable[[str], Clause],
+    ):
+        """
+        Create a problem.
+
+        :param statements: texts of ``cnf`` statements (in the order of
+            clauses) with their names and roles
+        :param includes: include directives met in the problem and in the
+            files included by it
+        :param parse_statement: a function parsing a statement to a clause
+        """
+        self._statements = [statement for statement, _, _ in statements]
+        self.labels = tuple(label for _, label, _ in statements)
+        self.roles = tuple(role for _, _, role in statements)
+        self.includes = tuple(includes)
+        self._parse_statement = parse_statement
+        self._clauses: List[Optional[Clause]] = [None] * len(statements)
+
+    @overload
+    def __getitem__(self, index: int) -> Clause:  # noqa: D105
+        ...  # pragma: no cover
+
+    @overload
+    def __getitem__(self, index: slice) -> Tuple[Clause, ...]:  # noqa: D105
+        ...  # pragma: no cover
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Clause, Tuple[Clause, ...]]:
+        """
+        Get a clause (parsing it if needed).
+
+        :param index: a position of the clause or a slice of positions
+        :returns: the clause or a tuple of clauses
+        """
+        if isinstance(index, slice):
+            return tuple(
+                self[position] for position in range(*index.indices(len(self)))
+            )
+        clause = self._clauses[index]
+        if clause is None:
+            clause = self._parse_statement(self._statements[index])
+            self._clauses[index] = clause
+            self._statements[index] = ""
+        return clause
+
+    def __len__(self) -> int:
+        """
+        Count clauses without parsing them.
+
+        :returns: the number of clauses
+        """
+        return len(self._clauses)
+
+    @property
+    def parsed(self) -> int:
+        """
+        How many clauses are already parsed.
+
+        :returns: the number of clauses parsed
+        """
+        return sum(clause is not None for clause in self._clauses)
+
+    def materialize(self) -> Tuple[Clause, ...]:
+        """
+        Parse all the clauses not parsed yet.
+
+        :returns: all the clauses as ``TPTPParser.parse`` returns them
+        """
+        return self[:]
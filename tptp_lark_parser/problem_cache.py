@@ -0,0 +1,582 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Problem Cache
+==============
+"""
+import hashlib
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from contextlib import suppress
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from tptp_lark_parser.grammar import (
+    Clause,
+    Function,
+    Include,
+    InternTable,
+    Literal,
+    Predicate,
+    Term,
+    Variable,
+)
+from tptp_lark_parser.symbol_table import SYMBOL_TYPES
+
+# clauses, include directives and the symbols added while parsing them
+CachedProblem = Tuple[
+    Tuple[Clause, ...], Tuple[Include, ...], Dict[str, List[str]]
+]
+# a format version, a type of integer codes, numbers of codes and strings
+_HEADER = struct.Struct("<8scII")
+_MAGIC = b"TPTPLP\x00\x02"
+_ENTRY_SUFFIX = ".bin"
+_TEMP_SUFFIX = ".tmp"
+# temporary files older than that were left by crashed processes
+_STALE_TEMP_AGE_NS = 3600 * 10**9
+# tags of inference parents other than names (names are string IDs)
+_RECORD, _LIST = -2, -3
+# the lowest two bits of a code in a postfix program of literals
+_VARIABLE, _FUNCTION, _POSITIVE, _NEGATIVE = range(4)
+
+
+def content_key(*parts: str) -> str:
+    """
+    Hash several strings (e.g. a problem text and the parser's settings).
+
+    >>> content_key("ab", "c") == content_key("a", "bc")
+    False
+
+    :param parts: strings to hash in the given order
+    :returns: a hexadecimal digest
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode()
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def _string_id(strings: Dict[str, int], string: Optional[str]) -> int:
+    if string is None:
+        return -1
+    return strings.setdefault(string, len(strings))
+
+
+def _encode_strings(
+    codes: List[int], strings: Dict[str, int], items: Sequence[str]
+) -> None:
+    codes.append(len(items))
+    codes.extend(_string_id(strings, item) for item in items)
+
+
+def _encode_includes(
+    codes: List[int], strings: Dict[str, int], includes: Sequence[Include]
+) -> None:
+    codes.append(len(includes))
+    for include in includes:
+        codes.append(_string_id(strings, include.file_name))
+        if include.formula_selection is None:
+            codes.append(-1)
+        else:
+            _encode_strings(codes, strings, include.formula_selection)
+
+
+def _encode_parents(
+    codes: List[int], strings: Dict[str, int], parents: Sequence[Any]
+) -> None:
+    codes.append(len(parents))
+    for parent in parents:
+        _encode_parent(codes, strings, parent)
+
+
+def _encode_parent(
+    codes: List[int], strings: Dict[str, int], parent: Any
+) -> None:
+    # nested inference records and ``file`` sources are rare and shallow
+    if isinstance(parent, str):
+        codes.append(_string_id(strings, parent))
+    elif isinstance(parent, dict):
+        rule, record_parents = parent["inference_record"]
+        codes.extend((_RECORD, _string_id(strings, rule)))
+        _encode_parents(codes, strings, record_parents)
+    else:
+        codes.append(_LIST)
+        _encode_parents(codes, strings, parent)
+
+
+def _node(item: Any) -> Tuple[Tuple[int, ...], Tuple[Any, ...]]:
+    # reversed codes of a variable, a function or a literal and its arguments
+    if isinstance(item, Variable):
+        return (item.index << 2 | _VARIABLE,), ()
+    if isinstance(item, Function):
+        return (len(item.arguments), item.index << 2 | _FUNCTION), (
+            item.arguments
+        )
+    kind = _NEGATIVE if item.negated else _POSITIVE
+    return (len(item.atom.arguments), item.atom.index << 2 | kind), (
+        item.atom.arguments
+    )
+
+
+def _postfix(literals: Iterable[Literal]) -> List[int]:
+    # nodes are visited right to left, so the reversed codes come with the
+    # arguments before their functions and predicates
+    codes: List[int] = []
+    stack: List[Any] = list(literals)
+    while stack:
+        node_codes, arguments = _node(stack.pop())
+        codes.extend(node_codes)
+        stack.extend(arguments)
+    codes.reverse()
+    return codes
+
+
+def _encode_clause(
+    codes: List[int], strings: Dict[str, int], clause: Clause
+) -> None:
+    codes.extend(
+        _string_id(strings, string)
+        for string in (clause.label, clause.role, clause.inference_rule)
+    )
+    if clause.inference_parents is None:
+        codes.append(-1)
+    else:
+        _encode_parents(codes, strings, clause.inference_parents)
+    codes.append(len(clause.literals))
+    codes.extend(_postfix(clause.literals))
+
+
+def _pack(codes: List[int]) -> "array[int]":
+    # the smallest signed integers fitting all the codes
+    low, high = min(codes, default=0), max(codes, default=0)
+    for typecode in "bh":
+        limit = 1 << 8 * array(typecode).itemsize - 1
+        if -limit <= low and high < limit:
+            return array(typecode, codes)
+    return array("i", codes)
+
+
+def encode_problem(
+    clauses: Sequence[Clause],
+    includes: Sequence[Include],
+    new_symbols: Mapping[str, Sequence[str]],
+) -> bytes:
+    r"""
+    Encode a parsed problem in a compact binary format.
+
+    Strings are stored once. Terms are written as integers in postfix
+    order, so they are decoded without recursion. Clauses keep their
+    labels, roles and inference records (other fields are not set by the
+    parser). Inference parents can be nested inference records and ``file``
+    sources too.
+
+    >>> clause = Clause(
+    ...     (Literal(True, Predicate(1, (Function(0, (Variable(2),)),))),),
+    ...     "a", "axiom", ("b",), "resolution"
+    ... )
+    >>> includes = [Include("A.ax"), Include("B.ax", ("d", "'c'"))]
+    >>> data = encode_problem([clause], includes, {"variables": ["X"]})
+    >>> decoded_clauses, decoded_includes, new_symbols = decode_problem(data)
+    >>> decoded_clauses == (clause,), new_symbols
+    (True, {'variables': ['X']})
+    >>> decoded_includes
+    (Include(file_name='A.ax', formula_selection=None),
+     Include(file_name='B.ax', formula_selection=('d', "'c'")))
+    >>> nested = Clause((), "n", "plain", ("b", {"inference_record": (
+    ...     "s", ("d", {"inference_record": ("t", ())}, ["'a.p'", "c"])
+    ... )}), "r")
+    >>> decode_problem(encode_problem([nested], [], {}))[0][0] == nested
+    True
+    >>> for index in (1 << 4, 1 << 12, 1 << 28):
+    ...     clauses = (Clause((Literal(False, Predicate(index, ())),), "b"),)
+    ...     encoded = encode_problem(clauses, [], {})
+    ...     print(len(encoded), decode_problem(encoded)[0] == clauses)
+    36 True
+    48 True
+    72 True
+    >>> decode_problem(b"not a problem")
+    Traceback (most recent call last):
+     ...
+    ValueError: not an encoded problem
+    >>> decode_problem(data[:20])
+    Traceback (most recent call last):
+     ...
+    ValueError: not an encoded problem
+    >>> decode_problem(data[:8] + b"q" + data[9:])
+    Traceback (most recent call last):
+     ...
+    ValueError: not an encoded problem
+    >>> decode_problem(data[:-2])
+    Traceback (most recent call last):
+     ...
+    ValueError: not an encoded problem
+    >>> from itertools import product
+    >>> for encoded in (data, encode_problem([nested], [], {})):
+    ...     for index, value in product(
+    ...         range(len(encoded)), (0, 2, 5, 127, 253, 254, 255)
+    ...     ):
+    ...         with suppress(ValueError):
+    ...             _ = decode_problem(
+    ...                 encoded[:index] + bytes([value]) + encoded[index + 1 :]
+    ...             )
+
+    :param clauses: parsed clauses
+    :param includes: include directives
+    :param new_symbols: symbols added while parsing (by symbol type)
+    :returns: bytes to be read by ``decode_problem``
+    """
+    codes: List[int] = []
+    strings: Dict[str, int] = {}
+    for symbol_type in SYMBOL_TYPES:
+        _encode_strings(codes, strings, new_symbols.get(symbol_type, ()))
+    _encode_includes(codes, strings, includes)
+    codes.append(len(clauses))
+    for clause in clauses:
+        _encode_clause(codes, strings, clause)
+    packed_codes = _pack(codes)
+    if sys.byteorder == "big":  # pragma: no cover
+        packed_codes.byteswap()
+    return (
+        _HEADER.pack(
+            _MAGIC, packed_codes.typecode.encode(), len(codes), len(strings)
+        )
+        + packed_codes.tobytes()
+        + "\0".join(strings).encode()
+    )
+
+
+def _decode_include(values: Iterator[int], strings: List[str]) -> Include:
+    file_name = strings[next(values)]
+    selection_count = next(values)
+    return Include(
+        file_name,
+        (
+            None
+            if selection_count < 0
+            else tuple(strings[next(values)] for _ in range(selection_count))
+        ),
+    )
+
+
+def _decode_parents(
+    values: Iterator[int], strings: List[str], count: int
+) -> Tuple[Any, ...]:
+    return tuple(_decode_parent(values, strings) for _ in range(count))
+
+
+def _decode_parent(values: Iterator[int], strings: List[str]) -> Any:
+    code = next(values)
+    if code == _RECORD:
+        rule = strings[next(values)]
+        return {
+            "inference_record": (
+                rule,
+                _decode_parents(values, strings, next(values)),
+            )
+        }
+    if code == _LIST:
+        return list(_decode_parents(values, strings, next(values)))
+    return strings[code]
+
+
+def _pop_arguments(stack: List[Any], arity: int) -> Tuple[Any, ...]:
+    if arity == 0:
+        return ()
+    arguments = tuple(stack[-arity:])
+    del stack[-arity:]
+    return arguments
+
+
+def _literal(
+    code: int, arguments: Tuple[Term, ...], intern: Callable[[Any], Any]
+) -> Literal:
+    return intern(
+        Literal(code & 3 == _NEGATIVE, intern(Predicate(code >> 2, arguments)))
+    )
+
+
+def _decode_literals(
+    values: Iterator[int], count: int, intern: Callable[[Any], Any]
+) -> Tuple[Literal, ...]:
+    literals: List[Literal] = []
+    stack: List[Term] = []
+    while len(literals) < count:
+        code = next(values)
+        if code & 3 == _VARIABLE:
+            stack.append(intern(Variable(code >> 2)))
+        elif code & 3 == _FUNCTION:
+            stack.append(
+                intern(
+                    Function(code >> 2, _pop_arguments(stack, next(values)))
+                )
+            )
+        else:
+            literals.append(
+                _literal(code, _pop_arguments(stack, next(values)), intern)
+            )
+    return tuple(literals)
+
+
+def _decode_clause(
+    values: Iterator[int], strings: List[str], intern: Callable[[Any], Any]
+) -> Clause:
+    label, role, rule = (next(values) for _ in range(3))
+    parents_count = next(values)
+    parents = (
+        None
+        if parents_count < 0
+        else _decode_parents(values, strings, parents_count)
+    )
+    literals = _decode_literals(values, next(values), intern)
+    return Clause(
+        literals,
+        strings[label],
+        strings[role],
+        parents,
+        None if rule < 0 else strings[rule],
+    )
+
+
+def _read_header(data: bytes) -> Tuple[str, int, int]:
+    try:
+        magic, typecode, codes_count, strings_count = _HEADER.unpack_from(data)
+    except struct.error as error:
+        raise ValueError("not an encoded problem") from error
+    if magic != _MAGIC or typecode not in (b"b", b"h", b"i"):
+        raise ValueError("not an encoded problem")
+    codes_end = _HEADER.size + array(typecode.decode()).itemsize * codes_count
+    if len(data) < codes_end:
+        raise ValueError("not an encoded problem")
+    return typecode.decode(), codes_end, strings_count
+
+
+def _read_codes(data: bytes) -> Tuple["array[int]", List[str]]:
+    typecode, codes_end, strings_count = _read_header(data)
+    codes: "array[int]" = array(typecode, data[_HEADER.size : codes_end])
+    if sys.byteorder == "big":  # pragma: no cover
+        codes.byteswap()
+    strings = data[codes_end:].decode().split("\0") if strings_count else []
+    if len(strings) != strings_count:
+        raise ValueError("not an encoded problem")
+    return codes, strings
+
+
+def decode_problem(
+    data: bytes, intern_table: Optional[InternTable] = None
+) -> CachedProblem:
+    """
+    Decode a problem encoded by ``encode_problem``.
+
+    :param data: bytes from ``encode_problem``
+    :param intern_table: a table for sharing equal terms, predicates and
+        literals
+    :returns: clauses, include directives, and the symbols added
+        while parsing (for the symbol types having them)
+    :raises ValueError: if the data are not an encoded problem
+    """
+    codes, strings = _read_codes(data)
+    try:
+        return _decode_codes(
+            iter(codes.tolist()),
+            strings,
+            (
+                (lambda item: item)
+                if intern_table is None
+                else intern_table.intern
+            ),
+        )
+    # corrupted codes are out of range or end too early
+    except (IndexError, RuntimeError, StopIteration, TypeError) as error:
+        raise ValueError("not an encoded problem") from error
+
+
+def _decode_codes(
+    values: Iterator[int], strings: List[str], intern: Callable[[Any], Any]
+) -> CachedProblem:
+    new_symbols = {
+        symbol_type: [strings[next(values)] for _ in range(next(values))]
+        for symbol_type in SYMBOL_TYPES
+    }
+    includes = tuple(
+        _decode_include(values, strings) for _ in range(next(values))
+    )
+    clauses = tuple(
+        _decode_clause(values, strings, intern) for _ in range(next(values))
+    )
+    return (
+        clauses,
+        includes,
+        {
+            symbol_type: symbols
+            for symbol_type, symbols in new_symbols.items()
+            if symbols
+        },
+    )
+
+
+class ProblemCache:
+    """
+    A folder with parsed problems shared by processes.
+
+    .. _problem-cache:
+
+    An entry is first written to a temporary file and then renamed, so
+    other processes never see it half-written. When the entries take more
+    than ``max_size`` bytes, the least recently used of them are removed
+    until they take no more than 90% of it. The folder is scanned only then
+    (and temporary files left by crashed processes are removed too), the
+    total size is estimated in between.
+
+    >>> folder = getfixture("tmp_path") / "cache"  # noqa: F821
+    >>> problem_cache = ProblemCache(str(folder), max_size=10)
+    >>> print(problem_cache.get("a"))
+    None
+    >>> problem_cache.put("a", b"1234")
+    >>> problem_cache.put("b", b"1234")
+    >>> for mtime, key in enumerate("ab"):
+    ...     os.utime(os.path.join(folder, f"{key}.bin"), ns=(mtime, mtime))
+    >>> problem_cache.get("a")
+    b'1234'
+    >>> for name, mtime in (("stale.tmp", 0), ("fresh.tmp", time.time_ns())):
+    ...     _ = (folder / name).write_bytes(b"")
+    ...     os.utime(folder / name, ns=(mtime, mtime))
+    >>> problem_cache.put("c", b"1234")
+    >>> sorted(os.listdir(folder))
+    ['a.bin', 'c.bin', 'fresh.tmp']
+    >>> os.remove(folder / "fresh.tmp")
+    >>> ProblemCache(str(folder), max_size=10).put("b", b"1234")
+    >>> sorted(os.listdir(folder))
+    ['b.bin', 'c.bin']
+
+    An entry which can't be replaced is skipped
+
+    >>> os.mkdir(os.path.join(folder, "d.bin"))
+    >>> problem_cache.put("d", b"12345")
+    >>> sorted(os.listdir(folder))
+    ['b.bin', 'c.bin', 'd.bin']
+    """
+
+    def __init__(self, folder: str, max_size: int = 1 << 30):
+        """
+        Open a cache folder (it's created if needed).
+
+        :param folder: a folder to keep entries in
+        :param max_size: a maximal total size of entries in bytes
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_size = max_size
+        self._total_size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + _ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Read an entry and mark it as recently used.
+
+        :param key: a key of the entry (e.g. from ``content_key``)
+        :returns: the entry's bytes or ``None`` for a missing entry
+        """
+        try:
+            with open(self._path(key), "rb") as entry:
+                data = entry.read()
+        except FileNotFoundError:
+            return None
+        # another process could have evicted the entry already
+        with suppress(FileNotFoundError):
+            os.utime(self._path(key))
+        return data
+
+    def remove(self, key: str) -> None:
+        """
+        Remove an entry (e.g. a corrupted one) if it exists.
+
+        :param key: a key of the entry (e.g. from ``content_key``)
+        """
+        with suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Write an entry and evict the least recently used ones if needed.
+
+        :param key: a key of the entry (e.g. from ``content_key``)
+        :param data: the entry's bytes
+        """
+        handle, temp_path = tempfile.mkstemp(_TEMP_SUFFIX, key, self.folder)
+        with os.fdopen(handle, "wb") as entry:
+            entry.write(data)
+        try:
+            os.replace(temp_path, self._path(key))
+            # a replaced entry is still counted until the next eviction
+            self._total_size += len(data)
+        except OSError:
+            # e.g. the entry is open by another process on Windows
+            os.remove(temp_path)
+        self._evict()
+
+    def _entries(self) -> List[Tuple[int, int, str]]:
+        entries = []
+        stale_time = time.time_ns() - _STALE_TEMP_AGE_NS
+        with os.scandir(self.folder) as folder_entries:
+            for entry in folder_entries:
+                # another process could have removed the file already
+                with suppress(FileNotFoundError):
+                    entry_stat = entry.stat()
+                    if entry.name.endswith(_ENTRY_SUFFIX) and entry.is_file():
+                        entries.append(
+                            (
+                                entry_stat.st_mtime_ns,
+                                entry_stat.st_size,
+                                entry.path,
+                            )
+                        )
+                    elif (
+                        entry.name.endswith(_TEMP_SUFFIX)
+                        and entry_stat.st_mtime_ns < stale_time
+                    ):
+                        os.remove(entry.path)
+        return entries
+
+    def _evict(self) -> None:
+        if self._total_size <= self.max_size:
+            return
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size * 9 // 10:
+                break
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            total_size -= size
+        self._total_size = total_size
@@ -0,0 +1,405 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Problem Header
+===============
+"""
+import posixpath
+import re
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+from tptp_lark_parser.file_source import FileSource
+
+# a header field (e.g. ``% Status   : Unsatisfiable``)
+_FIELD = re.compile(r"% (\w[\w ]*?)\s*:\s?(.*)$")
+# a line continuing the previous field
+_CONTINUATION = re.compile(r"%\s{2,}(\S.*)$")
+# a number in the ``Syntax`` field (e.g. ``Number of clauses : 4 (...)``)
+_NUMBER = re.compile(r"\s*([^:]*?)\s*:\s*(\d+)")
+_STATEMENT = re.compile(r"\s*([a-z]\w*)\s*\(")
+_INCLUDE = re.compile(r"\s*include\s*\(\s*'([^']*)'")
+# TPTP problem names mark their language: ``ALG001-1``, ``ALG001+1`` etc.
+_LANGUAGES = {"-": "cnf", "+": "fof", "_": "tff", "^": "thf"}
+
+
+@dataclass
+class ProblemHeader:
+    """
+    What can be learnt about a problem without parsing it.
+
+    .. _problem-header:
+
+    >>> header = scan_header(
+    ...     '''
+    ... %--------------------------------------------------------------------
+    ... % File     : TST001-1 : TPTP v8.0.0. Released v1.0.0.
+    ... % Domain   : Testing
+    ... % Status   : Unsatisfiable
+    ... % Syntax   : Number of clauses     :    4 (   4 unt;   0 nHn)
+    ... %            Number of literals    :    5 (   4 equ;   0 neg)
+    ... %            Maximal term depth    :    3 (   2 avg)
+    ... % SPC      : CNF_UNS_RFO_PEQ_UEQ
+    ... %--------------------------------------------------------------------
+    ... %----Include the axioms
+    ... include('Axioms/TST001-0.ax').
+    ... include('Axioms/TST002-0.ax',[a,
+    ...     b]).
+    ... /* a block
+    ... comment */
+    ... cnf(a, axiom, p(X)).
+    ... fof(b, axiom, p(c)).
+    ... include('Axioms/not_read.ax').
+    ... '''.splitlines(keepends=True),
+    ...     "Problems/TST/TST001-1.p",
+    ... )
+    >>> header.domain, header.status, header.spc, header.keyword
+    ('TST', 'Unsatisfiable', 'CNF_UNS_RFO_PEQ_UEQ', 'cnf')
+    >>> header.clauses, header.atoms, header.max_term_depth
+    (4, 5, 3)
+    >>> header.includes
+    ('Axioms/TST001-0.ax', 'Axioms/TST002-0.ax')
+    >>> header.syntax
+    {'Number of clauses': 4, 'Number of literals': 5, 'Maximal term depth': 3}
+
+    Without formulae and header fields, we rely on TPTP naming conventions
+
+    >>> header = scan_header(["include('Axioms/TST001+0.ax')."], "TST001+1.p")
+    >>> header.keyword, header.language, header.clauses, header.status
+    (None, 'fof', None, None)
+    >>> scan_header([], "README").language is None
+    True
+    """
+
+    name: str
+    size: int = 0
+    fields: Dict[str, str] = field(default_factory=dict)
+    includes: Tuple[str, ...] = ()
+    keyword: Optional[str] = None
+
+    @property
+    def domain(self) -> str:
+        """
+        A domain of the problem.
+
+        :returns: the first three letters of the problem's name
+        """
+        return posixpath.basename(self.name)[:3]
+
+    @property
+    def language(self) -> Optional[str]:
+        """
+        A language of the problem (``cnf``, ``fof``, ``tff`` or ``thf``).
+
+        :returns: the keyword of the first formula or a guess by the name
+        """
+        if self.keyword is not None:
+            return self.keyword
+        return _LANGUAGES.get(posixpath.basename(self.name)[6:7])
+
+    @property
+    def status(self) -> Optional[str]:
+        """
+        An SZS status of the problem.
+
+        :returns: the ``Status`` field
+        """
+        return self.fields.get("Status")
+
+    @property
+    def spc(self) -> Optional[str]:
+        """
+        A Specialist Problem Class of the problem.
+
+        :returns: the ``SPC`` field
+        """
+        return self.fields.get("SPC")
+
+    @property
+    def syntax(self) -> Dict[str, int]:
+        """
+        Syntactic statistics of the problem.
+
+        :returns: numbers from the ``Syntax`` field by their labels
+        """
+        return {
+            match.group(1): int(match.group(2))
+            for match in map(
+                _NUMBER.match, self.fields.get("Syntax", "").splitlines()
+            )
+            if match is not None
+        }
+
+    def _number(self, *labels: str) -> Optional[int]:
+        syntax = self.syntax
+        return next(
+            (syntax[label] for label in labels if label in syntax), None
+        )
+
+    @property
+    def clauses(self) -> Optional[int]:
+        """
+        How many clauses or formulae the problem has.
+
+        :returns: a number from the ``Syntax`` field
+        """
+        return self._number("Number of clauses", "Number of formulae")
+
+    @property
+    def atoms(self) -> Optional[int]:
+        """
+        How many atoms or literals the problem has.
+
+        :returns: a number from the ``Syntax`` field
+        """
+        return self._number("Number of atoms", "Number of literals")
+
+    @property
+    def max_term_depth(self) -> Optional[int]:
+        """
+        A maximal depth of terms in the problem.
+
+        :returns: a number from the ``Syntax`` field
+        """
+        return self._number("Maximal term depth")
+
+
+def _add_field(
+    fields: Dict[str, str], last: Optional[str], line: str
+) -> Optional[str]:
+    # returns the name of the field the line belongs to (if any)
+    match = _FIELD.match(line)
+    if match is not None:
+        fields[match.group(1)] = match.group(2).strip()
+        return match.group(1)
+    match = _CONTINUATION.match(line)
+    if match is not None and last is not None:
+        fields[last] += "\n" + match.group(1).strip()
+        return last
+    return None
+
+
+def _kind(line: str) -> str:
+    if line.startswith("%"):
+        return "%"
+    match = _STATEMENT.match(line)
+    return "" if match is None else match.group(1)
+
+
+def _statements(lines: Iterable[str]) -> Iterable[Tuple[str, str]]:
+    # comment lines and the lines starting statements (with their keywords)
+    in_block_comment = False
+    for line in lines:
+        stripped = line.strip()
+        if in_block_comment or stripped.startswith("/*"):
+            in_block_comment = "*/" not in stripped
+            continue
+        kind = _kind(stripped)
+        if kind:
+            yield kind, stripped
+
+
+def scan_header(
+    lines: Iterable[str], name: str = "", size: int = 0
+) -> ProblemHeader:
+    """
+    Read header comments and include directives of a problem.
+
+    Lines are read up to the first formula, so a big problem costs as much
+    as a small one.
+
+    :param lines: lines of a problem file
+    :param name: the problem's file name
+    :param size: the problem's size in bytes
+    :returns: the problem's header
+    """
+    header = ProblemHeader(name, size)
+    last_field = None
+    for keyword, line in _statements(lines):
+        if keyword == "%":
+            last_field = _add_field(header.fields, last_field, line)
+        elif keyword == "include":
+            header.includes += tuple(_INCLUDE.findall(line))
+        else:
+            header.keyword = keyword
+            break
+    return header
+
+
+def read_header(file_source: FileSource, name: str) -> ProblemHeader:
+    """
+    Read a header of a problem file.
+
+    >>> import os, sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> file_source = FileSource(
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> read_header(file_source, "Problems/TST/TST001-1.p")
+    ProblemHeader(name='Problems/TST/TST001-1.p', size=320, fields={},
+        includes=('Axioms/TST001-0.ax',), keyword='cnf')
+
+    :param file_source: a source of TPTP files
+    :param name: a file name relative to the root
+    :returns: the file's header
+    """
+    with file_source.open_text(name) as text_file:
+        return scan_header(text_file, name, file_source.file_key(name)[2])
+
+
+def _allowed(value: Optional[str], allowed: Optional[Collection[str]]) -> bool:
+    return allowed is None or value in allowed
+
+
+def _at_most(value: Optional[int], limit: Optional[int]) -> bool:
+    # unknown values are not limited
+    return limit is None or value is None or value <= limit
+
+
+@dataclass(frozen=True)
+class HeaderFilter:  # pylint: disable=too-many-instance-attributes
+    """
+    A filter of problems by their headers.
+
+    .. _header-filter:
+
+    ``None`` means no restriction. Problems with unknown values (e.g.
+    without a ``Syntax`` field) pass the limits on them.
+
+    >>> header = scan_header(
+    ...     [
+    ...         "% Status   : Satisfiable",
+    ...         "% Syntax   : Number of clauses     :    4 (   4 unt)",
+    ...         "% SPC      : CNF_SAT_RFO_NEQ",
+    ...         "cnf(a, axiom, p).",
+    ...     ],
+    ...     "Problems/TST/TST001-1.p",
+    ...     100,
+    ... )
+    >>> HeaderFilter()(header), HeaderFilter(languages=("cnf",))(header)
+    (True, True)
+    >>> HeaderFilter(excluded_domains=("TST",))(header)
+    False
+    >>> HeaderFilter(statuses=("Unsatisfiable",))(header)
+    False
+    >>> HeaderFilter(spc="CNF_SAT_*")(header)
+    True
+    >>> HeaderFilter(spc="FOF_*")(header)
+    False
+    >>> HeaderFilter(max_clauses=4)(header)
+    True
+    >>> HeaderFilter(max_clauses=3)(header)
+    False
+    >>> HeaderFilter(max_atoms=1, max_term_depth=1)(header)
+    True
+    >>> HeaderFilter(max_size=99)(header)
+    False
+    """
+
+    languages: Optional[Collection[str]] = None
+    excluded_domains: Collection[str] = ()
+    statuses: Optional[Collection[str]] = None
+    spc: Optional[str] = None
+    max_clauses: Optional[int] = None
+    max_atoms: Optional[int] = None
+    max_term_depth: Optional[int] = None
+    max_size: Optional[int] = None
+
+    def accepts_name(self, name: str) -> bool:
+        """
+        Check what can be checked without reading a file.
+
+        :param name: a problem's file name
+        :returns: whether the problem's domain is not excluded
+        """
+        return ProblemHeader(name).domain not in self.excluded_domains
+
+    def __call__(self, header: ProblemHeader) -> bool:
+        """
+        Check a problem.
+
+        :param header: the problem's header
+        :returns: whether the problem passes the filter
+        """
+        return (
+            self.accepts_name(header.name)
+            and _allowed(header.language, self.languages)
+            and _allowed(header.status, self.statuses)
+            and (self.spc is None or fnmatchcase(header.spc or "", self.spc))
+            and _at_most(header.clauses, self.max_clauses)
+            and _at_most(header.atoms, self.max_atoms)
+            and _at_most(header.max_term_depth, self.max_term_depth)
+            and _at_most(header.size, self.max_size)
+        )
+
+
+def select_problems(
+    file_source: FileSource,
+    names: Iterable[str],
+    header_filter: HeaderFilter,
+    largest_first: bool = False,
+) -> List[ProblemHeader]:
+    """
+    Read headers of problems and keep those passing a filter.
+
+    Problems from excluded domains are skipped without reading.
+
+    >>> import os, sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> file_source = FileSource(
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> names = file_source.glob("*/*") + file_source.glob("*/*/*")
+    >>> [
+    ...     (header.name, header.size)
+    ...     for header in select_problems(
+    ...         file_source, names, HeaderFilter(), largest_first=True
+    ...     )
+    ... ]
+    [('Problems/TST/TST001-1.p', 320), ('Axioms/TST001-0.ax', 150)]
+    >>> select_problems(
+    ...     file_source, names, HeaderFilter(excluded_domains=("TST",))
+    ... )
+    []
+
+    :param file_source: a source of TPTP files
+    :param names: file names relative to the root
+    :param header_filter: a filter to apply
+    :param largest_first: if ``True``, the problems are sorted by size
+        (otherwise, they are in the order of ``names``)
+    :returns: headers of the problems passing the filter
+    """
+    headers = [
+        header
+        for header in (
+            read_header(file_source, name)
+            for name in names
+            if header_filter.accepts_name(name)
+        )
+        if header_filter(header)
+    ]
+    if largest_first:
+        headers.sort(key=lambda header: header.size, reverse=True)
+    return headers
@@ -0,0 +1,335 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Profiling
+==========
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, fields
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Mapping, Tuple
+
+from lark import Lark, Token, Tree
+
+from tptp_lark_parser.grammar import Clause, Function
+
+# phases measured by ``TPTPParser`` (they don't overlap in time)
+PHASES = {
+    "read": "reading files",
+    "select": "skipping formulae not selected by include directives",
+    "include": "resolving included files and looking them up in the cache",
+    "problem_cache": "looking problems up in the on-disk cache",
+    "lex": "splitting text into tokens by Lark",
+    "parse": "building parse trees by Lark",
+    "transform": "transforming parse trees to clauses by CNFParser",
+    "single_pass": "parsing with CNFParser callbacks called by Lark",
+    "fast_cnf": "parsing statements by FastCNFParser",
+}
+# what is counted in phases (besides calls and seconds)
+COUNTERS = (
+    "bytes",
+    "tokens",
+    "clauses",
+    "literals",
+    "terms",
+    "new_symbols",
+    "cache_hits",
+)
+
+
+@dataclass
+class PhaseStats:  # pylint: disable=too-many-instance-attributes
+    """
+    Cumulative cost of a parsing phase.
+
+    >>> stats = PhaseStats()
+    >>> stats.add(0.5, {"clauses": 2, "literals": 3})
+    >>> stats.add(0.25, {"clauses": 1})
+    >>> stats.merge(stats)
+    >>> stats.calls, stats.seconds, stats.clauses, stats.literals
+    (4, 1.5, 6, 6)
+    """
+
+    calls: int = 0
+    seconds: float = 0.0
+    bytes: int = 0
+    tokens: int = 0
+    clauses: int = 0
+    literals: int = 0
+    terms: int = 0
+    new_symbols: int = 0
+    cache_hits: int = 0
+
+    def add(self, seconds: float, counts: Mapping[str, int]) -> None:
+        """
+        Add a measurement.
+
+        :param seconds: how long the phase took
+        :param counts: what was processed (by ``COUNTERS`` names)
+        """
+        self.calls += 1
+        self.seconds += seconds
+        for counter, value in counts.items():
+            setattr(self, counter, getattr(self, counter) + value)
+
+    def merge(self, other: "PhaseStats") -> None:
+        """
+        Add measurements of the same phase made elsewhere.
+
+        :param other: measurements to add
+        """
+        for stats_field in fields(self):
+            setattr(
+                self,
+                stats_field.name,
+                getattr(self, stats_field.name)
+                + getattr(other, stats_field.name),
+            )
+
+
+class ParseObserver(ABC):  # pylint: disable=too-few-public-methods
+    """
+    A receiver of measurements made by ``TPTPParser``.
+
+    .. _parse-observer:
+
+    Pass an instance of a subclass as ``TPTPParser(observer=...)`` to get
+    a call after each phase of parsing (see ``PHASES``). Without an
+    observer, the parser makes no measurements.
+    """
+
+    @abstractmethod
+    def on_phase(
+        self,
+        phase: str,
+        file_name: str,
+        seconds: float,
+        counts: Mapping[str, int],
+    ) -> None:
+        """
+        Receive a measurement.
+
+        :param phase: one of ``PHASES``
+        :param file_name: a file being parsed relative to the TPTP folder
+            (an empty string for a text given to ``TPTPParser.parse``)
+        :param seconds: how long the phase took
+        :param counts: what was processed (by ``COUNTERS`` names)
+        """
+
+
+class ParseStats(ParseObserver):
+    """
+    Per-file and cumulative costs of parsing phases.
+
+    .. _parse-stats:
+
+    >>> stats = ParseStats()
+    >>> stats.on_phase("read", "a.p", 0.001, {"bytes": 2048})
+    >>> stats.on_phase("lex", "a.p", 0.004, {"tokens": 100})
+    >>> stats.on_phase("include", "a.p", 0.0001, {"cache_hits": 1})
+    >>> stats.on_phase("lex", "b.p", 0.002, {"tokens": 50})
+    >>> stats.phases["lex"].tokens, stats.files["a.p"]["lex"].tokens
+    (150, 100)
+    >>> stats.slowest(1)
+    [('a.p', 0.0051)]
+    >>> other = ParseStats()
+    >>> other.on_phase("transform", "c.p", 0.01, {"clauses": 7})
+    >>> stats.merge(other)
+    >>> print(stats.summary())
+    read                1 calls     0.001 s   5.8% bytes=2048
+    include             1 calls     0.000 s   0.6% cache_hits=1
+    lex                 2 calls     0.006 s  35.1% tokens=150
+    transform           1 calls     0.010 s  58.5% clauses=7
+    total               5 calls     0.017 s 100.0% bytes=2048 tokens=150 ...
+    slowest files:
+      c.p 0.010
+      a.p 0.005
+      b.p 0.002
+    """
+
+    def __init__(self) -> None:
+        """Start with no measurements."""
+        self.phases: Dict[str, PhaseStats] = {}
+        self.files: Dict[str, Dict[str, PhaseStats]] = {}
+
+    def on_phase(
+        self,
+        phase: str,
+        file_name: str,
+        seconds: float,
+        counts: Mapping[str, int],
+    ) -> None:
+        """
+        Add a measurement to the file's and the cumulative stats.
+
+        :param phase: one of ``PHASES``
+        :param file_name: a file being parsed
+        :param seconds: how long the phase took
+        :param counts: what was processed (by ``COUNTERS`` names)
+        """
+        self.phases.setdefault(phase, PhaseStats()).add(seconds, counts)
+        self.files.setdefault(file_name, {}).setdefault(
+            phase, PhaseStats()
+        ).add(seconds, counts)
+
+    def merge(self, other: "ParseStats") -> None:
+        """
+        Add measurements made elsewhere (e.g. in another process).
+
+        :param other: measurements to add
+        """
+        for phase, stats in other.phases.items():
+            self.phases.setdefault(phase, PhaseStats()).merge(stats)
+        for file_name, file_phases in other.files.items():
+            for phase, stats in file_phases.items():
+                self.files.setdefault(file_name, {}).setdefault(
+                    phase, PhaseStats()
+                ).merge(stats)
+
+    def slowest(self, count: int) -> List[Tuple[str, float]]:
+        """
+        Find the files which took the most time.
+
+        :param count: how many files to return
+        :returns: file names and their total time (the slowest first)
+        """
+        return sorted(
+            (
+                (
+                    file_name,
+                    sum(stats.seconds for stats in file_phases.values()),
+                )
+                for file_name, file_phases in self.files.items()
+            ),
+            key=lambda file_time: -file_time[1],
+        )[:count]
+
+    def summary(self, slowest: int = 5) -> str:
+        """
+        Format the cumulative stats as a table.
+
+        :param slowest: how many of the slowest files to list
+        :returns: a row per phase (in the order of ``PHASES``) with its
+            calls, time, share of the total time and non-zero counters, a
+            total row and the slowest files
+        """
+        total = PhaseStats()
+        for stats in self.phases.values():
+            total.merge(stats)
+        rows = [
+            (phase, self.phases[phase])
+            for phase in PHASES
+            if phase in self.phases
+        ]
+        return "\n".join(
+            [_format_row(phase, stats, total) for phase, stats in rows]
+            + [_format_row("total", total, total), "slowest files:"]
+            + [
+                f"  {file_name or '<text>'} {seconds:.3f}"
+                for file_name, seconds in self.slowest(slowest)
+            ]
+        )
+
+
+def _format_row(name: str, stats: PhaseStats, total: PhaseStats) -> str:
+    share = stats.seconds / total.seconds if total.seconds else 0.0
+    return (
+        f"{name:13} {stats.calls:7} calls {stats.seconds:9.3f} s {share:6.1%}"
+        + "".join(
+            f" {counter}={getattr(stats, counter)}"
+            for counter in COUNTERS
+            if getattr(stats, counter)
+        )
+    )
+
+
+def count_clauses(clauses: Iterable[Clause]) -> Dict[str, int]:
+    """
+    Count clauses, literals and terms.
+
+    >>> from tptp_lark_parser.grammar import Literal, Predicate, Variable
+    >>> count_clauses([Clause((
+    ...     Literal(False, Predicate(0, (Function(0, (Variable(0),)),))),
+    ...     Literal(True, Predicate(1, ())),
+    ... ))])
+    {'clauses': 1, 'literals': 2, 'terms': 2}
+
+    :param clauses: clauses to count
+    :returns: numbers of clauses, literals and terms (including subterms)
+    """
+    counts = {"clauses": 0, "literals": 0, "terms": 0}
+    for clause in clauses:
+        counts["clauses"] += 1
+        counts["literals"] += len(clause.literals)
+        terms = [
+            term
+            for literal in clause.literals
+            for term in literal.atom.arguments
+        ]
+        while terms:
+            counts["terms"] += 1
+            term = terms.pop()
+            if isinstance(term, Function):
+                terms.extend(term.arguments)
+    return counts
+
+
+class _TimedIterator:
+    def __init__(self, iterator: Iterator[Token]):
+        self.iterator = iterator
+        self.count = 0
+        self.seconds = 0.0
+
+    def __iter__(self) -> "_TimedIterator":
+        return self
+
+    def __next__(self) -> Token:
+        start = perf_counter()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.seconds += perf_counter() - start
+        self.count += 1
+        return item
+
+
+def lex_and_parse(parser: Lark, tptp_text: str) -> Tuple[Tree, int, float]:
+    """
+    Parse a text with a LALR parser timing the lexer separately.
+
+    The lexer and the parser of Lark work in turns (a token at a time), so
+    we feed the tokens to the parser ourselves.
+
+    >>> from tptp_lark_parser.tptp_parser import _get_lark_parser
+    >>> parser = _get_lark_parser(True)
+    >>> tree, tokens, seconds = lex_and_parse(parser, "cnf(a, axiom, p(X)).")
+    >>> tree == parser.parse("cnf(a, axiom, p(X)).")
+    True
+    >>> tokens, seconds > 0
+    (12, True)
+
+    :param parser: a Lark parser
+    :param tptp_text: a text to parse
+    :returns: a parse tree, the number of tokens and the lexer's time
+    """
+    interactive_parser = parser.parse_interactive(tptp_text)
+    tokens = _TimedIterator(
+        interactive_parser.lexer_state.lex(interactive_parser.parser_state)
+    )
+    token = None
+    for token in tokens:
+        interactive_parser.feed_token(token)
+    return interactive_parser.feed_eof(token), tokens.count, tokens.seconds
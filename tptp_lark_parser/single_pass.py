@@ -0,0 +1,161 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Single-Pass Transformer
+========================
+"""
+from typing import Any, Callable, List
+
+from lark import Token
+
+from tptp_lark_parser.cnf_parser import CNFParser
+from tptp_lark_parser.fast_cnf_parser import ParsedStatement
+from tptp_lark_parser.grammar import Clause, Include
+
+
+class SinglePassTransformer:
+    """
+    ``CNFParser`` callbacks to be called by Lark during LALR reductions.
+
+    Lark asks a transformer for a callback per grammar rule. We give it
+    ``CNFParser`` methods where they exist and ``CNFParser.__default__``
+    otherwise, so that parse tree nodes are never built.
+
+    >>> transformer = SinglePassTransformer(CNFParser())
+    >>> transformer.FUNCTOR
+    Traceback (most recent call last):
+     ...
+    AttributeError: FUNCTOR
+    >>> transformer.null([])
+    []
+
+    Like ``TPTPParser`` without ``single_pass``, it ignores the symbols of
+    ``fof`` formulae. Lark calls the callbacks named after the ``fof`` and
+    ``cnf`` keywords when it shifts them, so we know which formula the
+    following reductions belong to.
+
+    >>> from tptp_lark_parser.tptp_parser import TPTPParser
+    >>> text = "fof(a, axiom, p(g) => ~q(h)). cnf(b, axiom, r(f(X)))."
+    >>> parsers = [
+    ...     TPTPParser(extendable=True, tokens_filename=None, **kwargs)
+    ...     for kwargs in ({}, {"single_pass": True})
+    ... ]
+    >>> [
+    ...     (len(tptp_parser.parse(text)),
+    ...      tptp_parser.cnf_parser.symbol_table.to_dict()["functions"])
+    ...     for tptp_parser in parsers
+    ... ]
+    [(1, ['f', 'r']), (1, ['f', 'r'])]
+    >>> len(TPTPParser(tokens_filename=None, single_pass=True).parse(
+    ...     "fof(unknown_symbols, axiom, p(g)). cnf(b, axiom, $false)."
+    ... ))
+    1
+    """
+
+    def __init__(self, cnf_parser: CNFParser):
+        """
+        Wrap a CNF parser.
+
+        :param cnf_parser: a CNF parser to get callbacks from
+        """
+        self.cnf_parser = cnf_parser
+        self.in_cnf = True
+
+    # pylint: disable=invalid-name
+    def FOF(self, token: Token) -> Token:
+        """
+        Start a ``fof`` formula (its content is not transformed).
+
+        :param token: the ``fof`` keyword
+        :returns: the same token
+        """
+        self.in_cnf = False
+        return token
+
+    def CNF(self, token: Token) -> Token:
+        """
+        Start a ``cnf`` formula.
+
+        :param token: the ``cnf`` keyword
+        :returns: the same token
+        """
+        self.in_cnf = True
+        return token
+
+    def __getattr__(self, name: str) -> Callable[[List[Any]], Any]:
+        """
+        Get a callback for a grammar rule.
+
+        Terminals and the rules Lark inlines itself get no callbacks.
+
+        :param name: a name of a grammar rule or a terminal
+        :returns: a callback getting the list of rule's children
+        :raises AttributeError: for terminals and inlined rules
+        """
+        if name.startswith("_") or name.isupper():
+            raise AttributeError(name)
+        method = getattr(self.cnf_parser, name, None)
+
+        def callback(children: List[Any]) -> Any:
+            children = [
+                (
+                    self.cnf_parser.__default_token__(child)
+                    if isinstance(child, Token)
+                    else child
+                )
+                for child in children
+            ]
+            if method is None or not self.in_cnf:
+                return self.cnf_parser.__default__(name, children, None)
+            return method(children)
+
+        return callback
+
+    @staticmethod
+    def include(children: List[Any]) -> Include:
+        """
+        Include directive.
+
+        <include>              ::= include(<file_name><formula_selection>).
+
+        :param children: parsed rule's children (a selection is a name, a
+            list of them, or an empty list for ``<null>``)
+        :returns: the include directive
+        """
+        names = children[1]
+        return Include(
+            children[0].value.replace("'", ""),
+            (
+                None
+                if names == []
+                else tuple(names) if isinstance(names, list) else (names,)
+            ),
+        )
+
+    @staticmethod
+    def tptp_file(children: List[Any]) -> ParsedStatement:
+        """
+        Split a problem into clauses and include directives.
+
+        <TPTP_file>            ::= <TPTP_input>*
+
+        :param children: parsed rule's children
+        :returns: clauses and include directives
+        """
+        return (
+            tuple(child for child in children if isinstance(child, Clause)),
+            tuple(child for child in children if isinstance(child, Include)),
+        )
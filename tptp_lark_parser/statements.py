@@ -0,0 +1,137 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Statements
+===========
+"""
+import re
+from itertools import chain
+from typing import Iterable, Iterator, List, Tuple
+
+# pieces of TPTP text which can contain a statement-ending dot
+_STATEMENT_PART = re.compile(
+    r"[^()'\"%/.]+|'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\""
+    r"|%[^\n]*\n|/\*.*?\*/|/(?=[^*])|[().]",
+    re.DOTALL,
+)
+_BRACKET_DEPTH = {"(": 1, ")": -1}
+# a keyword, a name and a role of an annotated formula (after comments)
+_STATEMENT_START = re.compile(
+    r"(?:\s|%[^\n]*|/\*.*?\*/)*([a-z]+)\s*\("
+    r"\s*('(?:[^'\\]|\\.)*'|[^\s,()]*)(?:\s*,\s*([a-z_]+))?",
+    re.DOTALL,
+)
+
+
+def _statement_ends(
+    buffer: str, position: int, depth: int
+) -> Tuple[List[int], int, int]:
+    ends = []
+    match = _STATEMENT_PART.match(buffer, position)
+    while match is not None:
+        position = match.end()
+        depth += _BRACKET_DEPTH.get(match.group(), 0)
+        if depth == 0 and match.group() == ".":
+            ends.append(position)
+        match = _STATEMENT_PART.match(buffer, position)
+    return ends, position, depth
+
+
+def split_statements(chunks: Iterable[str]) -> Iterator[str]:
+    r"""
+    Split TPTP text into top-level statements (each ending with a dot).
+
+    Comments, quoted strings and nested brackets may cross chunk boundaries.
+
+    >>> for statement in split_statements([
+    ...     "% a comment. \n cnf(a, axiom, p('.', 1.", "5)). /", "* . */",
+    ...     "include('a.ax'", "). cnf(b, axiom, q). % end."
+    ... ]):
+    ...     print(repr(statement))
+    "% a comment. \n cnf(a, axiom, p('.', 1.5))."
+    " /* . */include('a.ax')."
+    ' cnf(b, axiom, q).'
+    ' % end.\n'
+
+    :param chunks: consecutive pieces of TPTP text
+    :returns: an iterator over statements (with preceding comments)
+    """
+    buffer, position, depth = "", 0, 0
+    for chunk in chain(chunks, ("\n",)):
+        buffer += chunk
+        ends, position, depth = _statement_ends(buffer, position, depth)
+        start = 0
+        for end in ends:
+            yield buffer[start:end]
+            start = end
+        buffer, position = buffer[start:], position - start
+    if buffer.strip():
+        yield buffer
+
+
+def statement_header(statement: str) -> Tuple[str, str, str]:
+    r"""
+    Read a keyword, a name and a role of a statement without parsing it.
+
+    >>> statement_header("% a comment\n/* b */ cnf('a b', axiom, p).")
+    ('cnf', "'a b'", 'axiom')
+    >>> statement_header("include('Axioms/A.ax').")
+    ('include', "'Axioms/A.ax'", '')
+    >>> statement_header("% only a comment\n")
+    ('', '', '')
+
+    :param statement: a statement with preceding comments
+    :returns: empty strings for what's not found
+    """
+    match = _STATEMENT_START.match(statement)
+    if match is None:
+        return "", "", ""
+    return match.group(1), match.group(2), match.group(3) or ""
+
+
+def _unquote(name: str) -> str:
+    if len(name) > 1 and name[0] == name[-1] == "'":
+        return name[1:-1]
+    return name
+
+
+def select_formulae(tptp_text: str, names: Iterable[str]) -> str:
+    r"""
+    Drop annotated formulae with names not in a formula selection.
+
+    Only the beginnings of statements are looked at, so the formulae
+    dropped are never parsed. Include directives (and anything not looking
+    like an annotated formula) are kept. A quoted name is the same as an
+    unquoted one.
+
+    >>> print(select_formulae(
+    ...     "% axioms\ncnf(a, axiom, p). /* b */ fof('b', axiom, q).\n"
+    ...     "include('c.ax'). cnf(c, axiom, r).", ("b", "'a'")
+    ... ))
+    % axioms
+    cnf(a, axiom, p). /* b */ fof('b', axiom, q). include('c.ax').
+
+    :param tptp_text: a text of a TPTP file
+    :param names: names of the formulae to keep
+    :returns: the text with the selected formulae only
+    """
+    selected = {_unquote(name) for name in names}
+    kept = []
+    for statement in split_statements((tptp_text,)):
+        keyword, name, _ = statement_header(statement)
+        if keyword in ("", "include") or _unquote(name) in selected:
+            kept.append(statement)
+    return "".join(kept)
@@ -0,0 +1,499 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Symbol Index
+=============
+"""
+import sqlite3
+from collections import Counter
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from tptp_lark_parser.file_source import FileKey
+from tptp_lark_parser.grammar import Clause, Function, Term
+from tptp_lark_parser.parse_tptp import DEFAULT_PROBLEM_FILTER
+from tptp_lark_parser.problem import Problem
+from tptp_lark_parser.problem_header import HeaderFilter, select_problems
+from tptp_lark_parser.profiling import count_clauses
+from tptp_lark_parser.symbol_table import SymbolTable
+from tptp_lark_parser.tptp_parser import TPTPParser
+
+_SCHEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS problems (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    bytes INTEGER NOT NULL,
+    clauses INTEGER NOT NULL,
+    literals INTEGER NOT NULL,
+    terms INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    problem INTEGER NOT NULL REFERENCES problems ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_problem ON files (problem);
+CREATE TABLE IF NOT EXISTS includes (
+    problem INTEGER NOT NULL REFERENCES problems ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS includes_by_name ON includes (name);
+CREATE TABLE IF NOT EXISTS roles (
+    problem INTEGER NOT NULL REFERENCES problems ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    clauses INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS roles_by_role ON roles (role);
+CREATE TABLE IF NOT EXISTS symbols (
+    problem INTEGER NOT NULL REFERENCES problems ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    arity INTEGER NOT NULL,
+    occurrences INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS symbols_by_name ON symbols (name, arity);
+CREATE INDEX IF NOT EXISTS symbols_by_problem ON symbols (problem, name);
+CREATE TEMP TABLE IF NOT EXISTS vocabulary (name TEXT PRIMARY KEY);
+"""
+# size statistics of a problem (with its included files)
+STATISTICS = ("bytes", "clauses", "literals", "terms")
+# a symbol type, a symbol, its arity
+_Symbol = Tuple[str, str, int]
+
+
+def count_symbols(
+    clauses: Iterable[Clause], symbol_table: SymbolTable
+) -> Dict[_Symbol, int]:
+    """
+    Count occurrences of functional and predicate symbols.
+
+    >>> tptp_parser = TPTPParser(extendable=True)
+    >>> count_symbols(
+    ...     tptp_parser.parse("cnf(a, axiom, p(f(X), f(c)) | X != c)."),
+    ...     tptp_parser.cnf_parser.symbol_table,
+    ... )
+    {('predicates', 'p', 2): 1, ('functions', 'f', 1): 2,
+        ('functions', 'c', 0): 2, ('predicates', '=', 2): 1}
+
+    :param clauses: clauses to look at
+    :param symbol_table: symbols of the clauses
+    :returns: numbers of occurrences of symbols (symbols with the same name
+        and different arities are counted separately)
+    """
+    symbols: Dict[_Symbol, int] = Counter()
+    for clause in clauses:
+        for literal in clause.literals:
+            symbols[
+                (
+                    "predicates",
+                    symbol_table.get_symbol("predicates", literal.atom.index),
+                    len(literal.atom.arguments),
+                )
+            ] += 1
+            terms: List[Term] = list(literal.atom.arguments)
+            while terms:
+                term = terms.pop()
+                if isinstance(term, Function):
+                    symbols[
+                        (
+                            "functions",
+                            symbol_table.get_symbol("functions", term.index),
+                            len(term.arguments),
+                        )
+                    ] += 1
+                    terms.extend(term.arguments)
+    return dict(symbols)
+
+
+def _conditions(
+    symbols: Iterable[Tuple[str, Optional[int]]],
+    includes: Iterable[str],
+    roles: Iterable[str],
+    max_clauses: Optional[int],
+    max_bytes: Optional[int],
+) -> Tuple[List[str], List[Any]]:
+    # SQL conditions on ``problems`` and their parameters
+    conditions: List[str] = []
+    parameters: List[Any] = []
+    for symbol, arity in symbols:
+        conditions.append(
+            "id IN (SELECT problem FROM symbols WHERE name = ?"
+            + ("" if arity is None else " AND arity = ?")
+            + ")"
+        )
+        parameters.extend([symbol] if arity is None else [symbol, arity])
+    for table, column, values in (
+        ("includes", "name", includes),
+        ("roles", "role", roles),
+    ):
+        for value in values:
+            conditions.append(
+                f"id IN (SELECT problem FROM {table} WHERE {column} = ?)"
+            )
+            parameters.append(value)
+    for column, limit in (("clauses", max_clauses), ("bytes", max_bytes)):
+        if limit is not None:
+            conditions.append(f"{column} <= ?")
+            parameters.append(limit)
+    return conditions, parameters
+
+
+class SymbolIndex:
+    """
+    An on-disk index of symbols, roles, includes and sizes of problems.
+
+    .. _symbol-index:
+
+    The index is an SQLite database. Each problem is parsed once (with the
+    files it includes), and then queries take milliseconds. ``update``
+    re-parses only the problems whose files changed since they were
+    indexed (as told by ``FileSource.file_key``).
+
+    >>> import os, sys, shutil
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> tptp_folder = str(shutil.copytree(
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock")),
+    ...     temp_folder / "TPTP",
+    ... ))
+    >>> problem_file = os.path.join(tptp_folder, "Problems", "TST", "T.p")
+    >>> with open(problem_file, "w") as tptp_file:
+    ...     _ = tptp_file.write("cnf(a, negated_conjecture, p(f(X), c)).")
+    >>> index_file = str(temp_folder / "index.sqlite")
+    >>> with SymbolIndex(index_file, TPTPParser(tptp_folder, True)) as index:
+    ...     index.update(["Problems/TST/TST001-1.p", "Problems/TST/T.p"])
+    ...     index.update(["Problems/TST/TST001-1.p", "Problems/TST/T.p"])
+    ['Problems/TST/TST001-1.p', 'Problems/TST/T.p']
+    []
+    >>> index = SymbolIndex(index_file, TPTPParser(tptp_folder, True))
+    >>> index.names()
+    ['Problems/TST/T.p', 'Problems/TST/TST001-1.p']
+    >>> index.statistics("Problems/TST/TST001-1.p")
+    {'bytes': 470, 'clauses': 4, 'literals': 4, 'terms': 6}
+    >>> index.query(symbols=[("test_constant", None)])
+    ['Problems/TST/TST001-1.p']
+    >>> index.query(symbols=[("p", 2)]), index.query(symbols=[("p", 1)])
+    (['Problems/TST/T.p'], [])
+    >>> index.query(includes=["Axioms/TST001-0.ax"], roles=["hypothesis"])
+    ['Problems/TST/TST001-1.p']
+    >>> index.query(vocabulary=["p", "f", "c", "="])
+    ['Problems/TST/T.p']
+    >>> index.query(max_clauses=2), index.query(max_bytes=1000)
+    (['Problems/TST/T.p'], ['Problems/TST/T.p', 'Problems/TST/TST001-1.p'])
+
+    Changed problems are parsed again, and removed ones are forgotten
+
+    >>> with open(problem_file, "w") as tptp_file:
+    ...     _ = tptp_file.write("cnf(a, axiom, q).")
+    >>> index.update(["Problems/TST/TST001-1.p", "Problems/TST/T.p"])
+    ['Problems/TST/T.p']
+    >>> index.query(symbols=[("p", None)]), index.query(symbols=[("q", 0)])
+    ([], ['Problems/TST/T.p'])
+    >>> index.remove(["Problems/TST/TST001-1.p"])
+    >>> index.query(), index.query(roles=["hypothesis"])
+    (['Problems/TST/T.p'], [])
+    >>> index.close()
+    """
+
+    def __init__(self, filename: str, tptp_parser: TPTPParser):
+        """
+        Open an index (creating it if needed).
+
+        :param filename: a database file name
+        :param tptp_parser: a parser for indexing problems (it should be
+            ``extendable`` to accept any symbols)
+        """
+        self.tptp_parser = tptp_parser
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript(_SCHEMA)
+
+    def _is_current(self, name: str) -> bool:
+        indexed = self._connection.execute(
+            "SELECT files.name, version, size FROM files"
+            " JOIN problems ON problems.id = problem WHERE problems.name = ?",
+            (name,),
+        ).fetchall()
+        file_source = self.tptp_parser.file_source
+        return bool(indexed) and all(
+            file_source.file_key(file_name)[1:] == (version, size)
+            for file_name, version, size in indexed
+        )
+
+    def _add(self, name: str) -> None:
+        file_source = self.tptp_parser.file_source
+        problem = self.tptp_parser.lazy_parse(file_source.read_text(name))
+        file_names = [name] + [
+            include.file_name for include in problem.includes
+        ]
+        file_keys = [
+            file_source.file_key(file_name) for file_name in file_names
+        ]
+        counts = count_clauses(problem.materialize())
+        problem_id = self._connection.execute(
+            "INSERT INTO problems (name, bytes, clauses, literals, terms)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                name,
+                sum(key[2] for key in file_keys),
+                counts["clauses"],
+                counts["literals"],
+                counts["terms"],
+            ),
+        ).lastrowid
+        self._insert_details(problem_id, problem, file_names, file_keys)
+
+    def _insert_details(
+        self,
+        problem_id: Any,
+        problem: Problem,
+        file_names: Sequence[str],
+        file_keys: Sequence[FileKey],
+    ) -> None:
+        self._connection.executemany(
+            "INSERT INTO files VALUES (?, ?, ?, ?)",
+            (
+                (problem_id, file_name, key[1], key[2])
+                for file_name, key in zip(file_names, file_keys)
+            ),
+        )
+        self._connection.executemany(
+            "INSERT INTO includes VALUES (?, ?)",
+            ((problem_id, file_name) for file_name in file_names[1:]),
+        )
+        self._connection.executemany(
+            "INSERT INTO roles VALUES (?, ?, ?)",
+            (
+                (problem_id, role, count)
+                for role, count in Counter(problem.roles).items()
+            ),
+        )
+        self._connection.executemany(
+            "INSERT INTO symbols VALUES (?, ?, ?, ?, ?)",
+            (
+                (problem_id,) + symbol + (count,)
+                for symbol, count in count_symbols(
+                    problem, self.tptp_parser.cnf_parser.symbol_table
+                ).items()
+            ),
+        )
+
+    def update(self, names: Iterable[str]) -> List[str]:
+        """
+        Index problems not indexed yet or changed since indexing.
+
+        Each problem is indexed in a separate transaction, so an error (e.g.
+        a syntax one) leaves the problems indexed before it in the index.
+
+        :param names: problem file names relative to the TPTP root
+        :returns: names of the problems (re-)indexed
+        """
+        updated = []
+        for name in names:
+            if not self._is_current(name):
+                with self._connection:
+                    self._delete(name)
+                    self._add(name)
+                updated.append(name)
+        return updated
+
+    def _delete(self, name: str) -> None:
+        self._connection.execute(
+            "DELETE FROM problems WHERE name = ?", (name,)
+        )
+
+    def remove(self, names: Iterable[str]) -> None:
+        """
+        Forget problems.
+
+        :param names: problem file names (those not indexed are ignored)
+        """
+        with self._connection:
+            for name in names:
+                self._delete(name)
+
+    def names(self) -> List[str]:
+        """
+        List indexed problems.
+
+        :returns: problem file names in alphabetical order
+        """
+        return [
+            name
+            for (name,) in self._connection.execute(
+                "SELECT name FROM problems ORDER BY name"
+            )
+        ]
+
+    def statistics(self, name: str) -> Dict[str, int]:
+        """
+        Get size statistics of a problem.
+
+        :param name: a problem file name
+        :returns: sizes by ``STATISTICS`` names (with included files)
+        """
+        return dict(
+            zip(
+                STATISTICS,
+                self._connection.execute(
+                    f"SELECT {', '.join(STATISTICS)} FROM problems"
+                    " WHERE name = ?",
+                    (name,),
+                ).fetchone(),
+            )
+        )
+
+    def _set_vocabulary(self, vocabulary: Iterable[str]) -> None:
+        self._connection.execute("DELETE FROM vocabulary")
+        self._connection.executemany(
+            "INSERT OR IGNORE INTO vocabulary VALUES (?)",
+            ((symbol,) for symbol in vocabulary),
+        )
+
+    # pylint: disable=too-many-arguments
+    def query(
+        self,
+        *,
+        symbols: Iterable[Tuple[str, Optional[int]]] = (),
+        includes: Iterable[str] = (),
+        roles: Iterable[str] = (),
+        vocabulary: Optional[Collection[str]] = None,
+        max_clauses: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Find problems satisfying all the conditions given.
+
+        :param symbols: symbols (with arities, or ``None`` for any arity)
+            each of which the problems use
+        :param includes: files each of which the problems include
+        :param roles: roles each of which some clauses of the problems have
+        :param vocabulary: functional and predicate symbols (including
+            ``=`` for both equalities and disequalities) which the problems
+            can use (they can't use any other)
+        :param max_clauses: a maximal number of clauses
+        :param max_bytes: a maximal size of the problems with included files
+        :returns: names of the problems found in alphabetical order
+        """
+        conditions, parameters = _conditions(
+            symbols, includes, roles, max_clauses, max_bytes
+        )
+        if vocabulary is not None:
+            self._set_vocabulary(vocabulary)
+            conditions.append(
+                "id NOT IN (SELECT problem FROM symbols"
+                " WHERE name NOT IN (SELECT name FROM vocabulary))"
+            )
+        return [
+            name
+            for (name,) in self._connection.execute(
+                "SELECT name FROM problems"
+                + "".join(
+                    (" WHERE " if position == 0 else " AND ") + condition
+                    for position, condition in enumerate(conditions)
+                )
+                + " ORDER BY name",
+                parameters,
+            )
+        ]
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def __enter__(self) -> "SymbolIndex":
+        """
+        Use the index as a context manager.
+
+        :returns: the index itself
+        """
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        """
+        Close the index.
+
+        :param exc_type: a type of the exception raised (if any)
+        :param exc_value: the exception raised
+        :param traceback: the exception's traceback
+        """
+        self.close()
+
+
+def update_symbol_index(
+    tptp_folder: str,
+    filename: str,
+    problem_filter: HeaderFilter = DEFAULT_PROBLEM_FILTER,
+) -> List[str]:
+    """
+    Index all problems of a TPTP library passing a filter.
+
+    Problems indexed before are parsed again only if their files changed,
+    and those no longer passing the filter (or removed) are forgotten.
+
+    >>> import os, sys
+    >>> if sys.version_info.major == 3 and sys.version_info.minor >= 9:
+    ...     from importlib.resources import files
+    ... else:
+    ...     from importlib_resources import files
+    >>> tptp_folder = (
+    ...     files("tptp_lark_parser")
+    ...     .joinpath(os.path.join("resources", "TPTP-mock"))
+    ... )
+    >>> index_file = str(getfixture("tmp_path") / "index.sqlite")  # noqa: F821
+    >>> update_symbol_index(tptp_folder, index_file)
+    ['Problems/TST/TST001-1.p']
+    >>> update_symbol_index(tptp_folder, index_file)
+    []
+    >>> update_symbol_index(
+    ...     tptp_folder, index_file, HeaderFilter(languages=("fof",))
+    ... )
+    []
+    >>> with SymbolIndex(index_file, TPTPParser(tptp_folder, True)) as index:
+    ...     index.names()
+    []
+
+    :param tptp_folder: a TPTP folder (or an archive)
+    :param filename: an index file name
+    :param problem_filter: which problems to index (by their headers)
+    :returns: names of the problems (re-)indexed
+    """
+    # shared axiom files are parsed once thanks to the include cache
+    with TPTPParser(tptp_folder, True, None) as tptp_parser:
+        names = [
+            header.name
+            for header in select_problems(
+                tptp_parser.file_source,
+                tptp_parser.file_source.glob("Problems/*/*.p"),
+                problem_filter,
+            )
+        ]
+        with SymbolIndex(filename, tptp_parser) as index:
+            index.remove(set(index.names()).difference(names))
+            return index.update(names)
@@ -0,0 +1,280 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Symbol Table
+=============
+"""
+import hashlib
+import json
+import os
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+SYMBOL_TYPES = ("functions", "predicates", "variables")
+
+
+class SymbolTable:
+    """
+    Functional and predicate symbols and variable names with integer IDs.
+
+    .. _symbol-table:
+
+    IDs of each symbol type are consecutive integers starting from zero, so
+    both adding a symbol and looking it up (by name or by ID) take constant
+    time.
+
+    >>> symbol_table = SymbolTable({"functions": ["f"]})
+    >>> symbol_table.add("functions", "g")
+    1
+    >>> symbol_table.get_id("functions", "g")
+    1
+    >>> print(symbol_table.get_id("functions", "h"))
+    None
+    >>> symbol_table.get_symbol("functions", 0)
+    'f'
+    >>> symbol_table.counts()
+    {'functions': 2, 'predicates': 0, 'variables': 0}
+    >>> snapshot = symbol_table.snapshot()
+    >>> symbol_table.freeze()
+    >>> symbol_table.add("functions", "h")
+    Traceback (most recent call last):
+     ...
+    ValueError: the symbol table is frozen: h
+    >>> snapshot.add("functions", "h")
+    2
+    >>> snapshot.new_symbols(symbol_table.counts())
+    {'functions': ['h']}
+    >>> snapshot.update({"functions": ["f", "i"], "variables": ["X"]})
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> snapshot.save(os.path.join(temp_folder, "tokens.json"))
+    >>> SymbolTable.load(os.path.join(temp_folder, "tokens.json")).to_dict()
+    {'functions': ['f', 'g', 'h', 'i'], 'predicates': [], 'variables': ['X']}
+    >>> snapshot.digest() == SymbolTable(snapshot.to_dict()).digest()
+    True
+    >>> counts = snapshot.counts()
+    >>> snapshot.update({"functions": ["j"], "predicates": ["p"]})
+    >>> _ = snapshot.digest()
+    >>> snapshot.truncate(counts)
+    >>> snapshot.to_dict(), snapshot.get_id("functions", "j")
+    ({'functions': ['f', 'g', 'h', 'i'], 'predicates': [], 'variables': ['X']},
+     None)
+    >>> snapshot.digest() == SymbolTable(snapshot.to_dict()).digest()
+    True
+    >>> SymbolTable({"functions": ["f"]}).digest() == SymbolTable(
+    ...     {"predicates": ["f"]}
+    ... ).digest()
+    False
+
+    Every symbol has only one ID, so duplicates are an error
+
+    >>> SymbolTable({"functions": ["f", "g", "f"]})
+    Traceback (most recent call last):
+     ...
+    ValueError: duplicate functions: ['f']
+    """
+
+    def __init__(self, symbols: Optional[Mapping[str, Iterable[str]]] = None):
+        """
+        Create a symbol table.
+
+        :param symbols: initial symbols (by symbol type) in the order of IDs
+        :raises ValueError: if some symbols are duplicated
+        """
+        self._symbols: Dict[str, List[str]] = {
+            symbol_type: list((symbols or {}).get(symbol_type, ()))
+            for symbol_type in SYMBOL_TYPES
+        }
+        self._ids: Dict[str, Dict[str, int]] = {
+            symbol_type: {
+                symbol: index for index, symbol in enumerate(symbol_list)
+            }
+            for symbol_type, symbol_list in self._symbols.items()
+        }
+        for symbol_type, symbol_list in self._symbols.items():
+            if len(symbol_list) != len(self._ids[symbol_type]):
+                raise ValueError(
+                    f"duplicate {symbol_type}: "
+                    + str(
+                        sorted(
+                            symbol
+                            for symbol, count in Counter(symbol_list).items()
+                            if count > 1
+                        )
+                    )
+                )
+        # how many symbols of each type are hashed and their chained digest
+        self._digests: Dict[str, Tuple[int, bytes]] = {
+            symbol_type: (0, bytes(32)) for symbol_type in SYMBOL_TYPES
+        }
+        self.frozen = False
+
+    @classmethod
+    def load(cls, filename: str) -> "SymbolTable":
+        """
+        Load a symbol table from a JSON file.
+
+        :param filename: a JSON file with lists of symbols (by symbol type)
+        :returns: a new symbol table
+        """
+        with open(filename, "r", encoding="utf-8") as tokens_file:
+            return cls(json.load(tokens_file))
+
+    def save(self, filename: str) -> None:
+        """
+        Save a symbol table to a JSON file.
+
+        The file is replaced at once, so it's never left half-written.
+
+        :param filename: where to save the symbol table
+        """
+        with open(filename + ".tmp", "w", encoding="utf-8") as tokens_file:
+            json.dump(self._symbols, tokens_file)
+        os.replace(filename + ".tmp", filename)
+
+    def get_id(self, symbol_type: str, symbol: str) -> Optional[int]:
+        """
+        Get an ID of a symbol.
+
+        :param symbol_type: a type of the symbol (variables, functions, or
+            predicates)
+        :param symbol: a predicate or functional symbol, or a variable name
+        :returns: an integer ID or ``None`` for unknown symbols
+        """
+        return self._ids[symbol_type].get(symbol)
+
+    def get_symbol(self, symbol_type: str, index: int) -> str:
+        """
+        Get a symbol by its ID.
+
+        :param symbol_type: a type of the symbol (variables, functions, or
+            predicates)
+        :param index: an integer ID
+        :returns: a predicate or functional symbol, or a variable name
+        """
+        return self._symbols[symbol_type][index]
+
+    def add(self, symbol_type: str, symbol: str) -> int:
+        """
+        Add a symbol (if it's not known yet).
+
+        :param symbol_type: a type of the symbol (variables, functions, or
+            predicates)
+        :param symbol: a predicate or functional symbol, or a variable name
+        :returns: an integer ID
+        :raises ValueError: if the symbol is new and the table is frozen
+        """
+        symbol_ids = self._ids[symbol_type]
+        if symbol not in symbol_ids:
+            if self.frozen:
+                raise ValueError(f"the symbol table is frozen: {symbol}")
+            symbols = self._symbols[symbol_type]
+            symbol_ids[symbol] = len(symbols)
+            symbols.append(symbol)
+        return symbol_ids[symbol]
+
+    def update(self, symbols: Mapping[str, Iterable[str]]) -> None:
+        """
+        Add symbols (those not known yet) in the given order.
+
+        :param symbols: symbols by symbol type
+        """
+        for symbol_type, new_symbols in symbols.items():
+            for symbol in new_symbols:
+                self.add(symbol_type, symbol)
+
+    def freeze(self) -> None:
+        """Forbid adding new symbols."""
+        self.frozen = True
+
+    def digest(self) -> str:
+        """
+        Hash all symbols in the order of their IDs.
+
+        Symbols are rarely removed, so only those added since the previous
+        call are hashed (unless some were removed).
+
+        :returns: a hexadecimal digest, the same for tables with the same
+            symbols
+        """
+        combined = hashlib.sha256()
+        for symbol_type, symbols in self._symbols.items():
+            count, digest = self._digests[symbol_type]
+            for symbol in symbols[count:]:
+                digest = hashlib.sha256(digest + symbol.encode()).digest()
+            self._digests[symbol_type] = len(symbols), digest
+            combined.update(digest)
+        return combined.hexdigest()
+
+    def snapshot(self) -> "SymbolTable":
+        """
+        Copy a symbol table.
+
+        :returns: a new (not frozen) table with the same symbols
+        """
+        symbol_table = SymbolTable(self._symbols)
+        # pylint: disable=protected-access
+        symbol_table._digests = dict(self._digests)
+        return symbol_table
+
+    def truncate(self, counts: Mapping[str, int]) -> None:
+        """
+        Remove symbols added after the table had given sizes.
+
+        :param counts: numbers of symbols by symbol type as returned by
+            ``counts``
+        """
+        for symbol_type, symbols in self._symbols.items():
+            for symbol in symbols[counts[symbol_type] :]:
+                del self._ids[symbol_type][symbol]
+            del symbols[counts[symbol_type] :]
+            if self._digests[symbol_type][0] > len(symbols):
+                self._digests[symbol_type] = (0, bytes(32))
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Count symbols of each type.
+
+        :returns: numbers of symbols by symbol type
+        """
+        return {
+            symbol_type: len(symbols)
+            for symbol_type, symbols in self._symbols.items()
+        }
+
+    def new_symbols(self, counts: Mapping[str, int]) -> Dict[str, List[str]]:
+        """
+        List symbols added after the table had given sizes.
+
+        :param counts: numbers of symbols by symbol type as returned by
+            ``counts``
+        :returns: new symbols for the symbol types having them
+        """
+        return {
+            symbol_type: symbols[counts[symbol_type] :]
+            for symbol_type, symbols in self._symbols.items()
+            if len(symbols) > counts[symbol_type]
+        }
+
+    def to_dict(self) -> Dict[str, List[str]]:
+        """
+        Get all symbols.
+
+        :returns: lists of symbols (by symbol type) in the order of IDs
+        """
+        return {
+            symbol_type: list(symbols)
+            for symbol_type, symbols in self._symbols.items()
+        }
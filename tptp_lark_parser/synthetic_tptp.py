@@ -0,0 +1,187 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Synthetic TPTP
+===============
+"""
+import os
+import random
+from dataclasses import dataclass
+from typing import List
+
+
+@dataclass(frozen=True)
+class SyntheticSettings:  # pylint: disable=too-many-instance-attributes
+    """
+    A shape of synthetic CNF problems.
+
+    .. _synthetic-settings:
+
+    Functions and predicates (except for equality) have ``arity`` arguments.
+    The first argument of a function at depth ``term_depth`` is a variable
+    or a constant, so the deepest terms reach this depth. With a positive
+    ``annotation_size``, clauses are annotated as inferred from this many
+    parents (the clauses preceding them). A problem includes ``includes``
+    axiom files of the same shape.
+
+    >>> settings = SyntheticSettings(
+    ...     clauses=3, literals=2, term_depth=1, arity=1
+    ... )
+    >>> print(synthetic_clauses(settings))
+    cnf(c0, axiom, f17(X0) = f11(c14) | f16(X3) = f6(c14)).
+    cnf(c1, axiom, f11(X1) = f5(c19) | f10(c4) != f16(X3)).
+    cnf(c2, axiom, p16(f10(X2)) | ~p1(f10(c15))).
+    >>> print(synthetic_clauses(SyntheticSettings(
+    ...     clauses=2, literals=1, term_depth=0, arity=1, annotation_size=2
+    ... ), "a"))
+    cnf(a0, axiom, ~p10(c0)).
+    cnf(a1, plain, ~p10(X0), inference(resolution, [status(thm)], [a0])).
+    >>> from tptp_lark_parser import TPTPParser
+    >>> len(TPTPParser(extendable=True).parse(synthetic_clauses(
+    ...     SyntheticSettings(annotation_size=3)
+    ... )))
+    100
+    """
+
+    clauses: int = 100
+    literals: int = 3
+    term_depth: int = 2
+    arity: int = 2
+    annotation_size: int = 0
+    includes: int = 0
+    symbols: int = 20
+    variables: int = 4
+    seed: int = 0
+
+
+class _Generator:  # pylint: disable=too-few-public-methods
+    def __init__(self, settings: SyntheticSettings, seed: str):
+        self.settings = settings
+        self.random = random.Random(seed)
+
+    def _leaf(self) -> str:
+        if self.random.random() < 0.5:
+            return f"X{self.random.randrange(self.settings.variables)}"
+        return f"c{self.random.randrange(self.settings.symbols)}"
+
+    def _term(self, depth: int) -> str:
+        if depth == 0:
+            return self._leaf()
+        arguments = [self._term(depth - 1)] + [
+            self._term(self.random.randrange(depth))
+            for _ in range(self.settings.arity - 1)
+        ]
+        return (
+            f"f{self.random.randrange(self.settings.symbols)}"
+            f"({', '.join(arguments)})"
+        )
+
+    def _literal(self) -> str:
+        if self.random.random() < 0.25:
+            sign = self.random.choice(("=", "!="))
+            return (
+                f"{self._term(self.settings.term_depth)} {sign} "
+                f"{self._term(self.settings.term_depth)}"
+            )
+        arguments = ", ".join(
+            self._term(self.settings.term_depth)
+            for _ in range(self.settings.arity)
+        )
+        return (
+            ("~" if self.random.random() < 0.5 else "")
+            + f"p{self.random.randrange(self.settings.symbols)}"
+            + (f"({arguments})" if arguments else "")
+        )
+
+    def clause(self, prefix: str, index: int) -> str:
+        """
+        Generate a clause.
+
+        :param prefix: a prefix of clause labels
+        :param index: a number of the clause
+        :returns: a clause in TPTP syntax
+        """
+        literals = " | ".join(
+            self._literal() for _ in range(self.settings.literals)
+        )
+        parents = [
+            f"{prefix}{parent}"
+            for parent in range(
+                max(0, index - self.settings.annotation_size), index
+            )
+        ]
+        if not parents:
+            return f"cnf({prefix}{index}, axiom, {literals})."
+        return (
+            f"cnf({prefix}{index}, plain, {literals}, inference(resolution,"
+            f" [status(thm)], [{', '.join(parents)}]))."
+        )
+
+
+def synthetic_clauses(settings: SyntheticSettings, prefix: str = "c") -> str:
+    """
+    Generate clauses of a given shape.
+
+    :param settings: a shape of the clauses
+    :param prefix: a prefix of clause labels (it's also a part of the random
+        seed, so different prefixes give different clauses)
+    :returns: a text of ``settings.clauses`` clauses one per line
+    """
+    generator = _Generator(settings, f"{settings.seed} {prefix}")
+    return "\n".join(
+        generator.clause(prefix, index) for index in range(settings.clauses)
+    )
+
+
+def write_synthetic_problem(
+    folder: str, settings: SyntheticSettings, name: str = "SYN000-1"
+) -> List[str]:
+    """
+    Write a synthetic problem and its axiom files in TPTP folder layout.
+
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> write_synthetic_problem(
+    ...     str(temp_folder), SyntheticSettings(clauses=1, includes=2)
+    ... )
+    ['Problems/SYN/SYN000-1.p', 'Axioms/SYN000-1-0.ax', 'Axioms/SYN000-1-1.ax']
+    >>> print((temp_folder / "Problems" / "SYN" / "SYN000-1.p").read_text())
+    include('Axioms/SYN000-1-0.ax').
+    include('Axioms/SYN000-1-1.ax').
+    cnf(c0, axiom, ...).
+
+    :param folder: a root folder
+    :param settings: a shape of the problem and its axioms
+    :param name: a problem name (its first three letters are the domain)
+    :returns: names of the written files relative to the root (the problem
+        first)
+    """
+    axioms = [
+        f"Axioms/{name}-{index}.ax" for index in range(settings.includes)
+    ]
+    texts = [
+        "".join(f"include('{axiom}').\n" for axiom in axioms)
+        + synthetic_clauses(settings)
+    ] + [
+        synthetic_clauses(settings, f"a{index}_")
+        for index in range(settings.includes)
+    ]
+    names = [f"Problems/{name[:3]}/{name}.p"] + axioms
+    for file_name, text in zip(names, texts):
+        path = os.path.join(folder, *file_name.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as tptp_file:
+            tptp_file.write(text + "\n")
+    return names
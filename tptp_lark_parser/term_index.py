@@ -0,0 +1,417 @@
+# Copyright 2022-2023 Boris Shminke
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# noqa D205, D400
+"""
+Term Index
+===========
+"""
+from typing import (
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from tptp_lark_parser.grammar import Function, Literal, Term, Variable
+
+# a symbol and its arity (``None`` for a variable); the first key of a
+# literal is its sign, its predicate and the predicate's arity
+_Key = Optional[Tuple[int, ...]]
+_Value = TypeVar("_Value", bound=Hashable)
+# a term and a side it comes from (variables of the sides are different)
+_Bound = Tuple[Term, int]
+_UNIFIABLE, _GENERALIZATIONS, _INSTANCES = range(3)
+
+
+def _flatten(literal: Literal) -> List[_Key]:
+    keys: List[_Key] = [
+        (
+            int(literal.negated),
+            literal.atom.index,
+            len(literal.atom.arguments),
+        )
+    ]
+    terms: List[Term] = list(reversed(literal.atom.arguments))
+    while terms:
+        term = terms.pop()
+        if isinstance(term, Variable):
+            keys.append(None)
+        else:
+            keys.append((term.index, len(term.arguments)))
+            terms.extend(reversed(term.arguments))
+    return keys
+
+
+def _arity(key: _Key) -> int:
+    return 0 if key is None else key[-1]
+
+
+def _subterm_ends(keys: List[_Key]) -> List[int]:
+    # a position after the subterm starting at each position
+    ends = [0] * len(keys)
+    for position in reversed(range(len(keys))):
+        end = position + 1
+        for _ in range(_arity(keys[position])):
+            end = ends[end]
+        ends[position] = end
+    return ends
+
+
+class _Node:  # pylint: disable=too-few-public-methods
+    __slots__ = ("children", "values")
+
+    def __init__(self) -> None:
+        self.children: Dict[_Key, _Node] = {}
+        self.values: Dict[Hashable, None] = {}
+
+
+def _skip_term(node: _Node) -> Iterator[_Node]:
+    # nodes reached from the node by any one term
+    stack = [(node, 1)]
+    while stack:
+        node, pending = stack.pop()
+        if pending == 0:
+            yield node
+        else:
+            stack.extend(
+                (child, pending - 1 + _arity(key))
+                for key, child in node.children.items()
+            )
+
+
+def _next_states(
+    node: _Node,
+    position: int,
+    keys: List[_Key],
+    ends: List[int],
+    mode: int,
+) -> Iterator[Tuple[_Node, int]]:
+    key = keys[position]
+    if key is None and mode != _GENERALIZATIONS:
+        # a query variable stands for any stored term
+        for skipped in _skip_term(node):
+            yield skipped, position + 1
+        return
+    child = node.children.get(key)
+    if child is not None:
+        yield child, position + 1
+    wildcard = node.children.get(None)
+    if key is not None and mode != _INSTANCES and wildcard is not None:
+        # a stored variable stands for the query's subterm
+        yield wildcard, ends[position]
+
+
+class LiteralIndex(Generic[_Value]):
+    """
+    A discrimination tree of literals.
+
+    .. _literal-index:
+
+    A literal is stored as a path of its sign, predicate and functional
+    symbols (with arities) in the pre-order, with variables replaced by a
+    wildcard. Retrieval walks the paths compatible with a query literal of
+    the same sign, so it skips the literals which differ from the query in
+    a symbol at some position. Variables are not told apart, so results are
+    candidates: they include all the literals unifiable with the query
+    (generalizing it or being its instances), but can include also those
+    which are not because of repeated variables (check them with
+    ``unifiable`` or ``generalizes``). For resolution partners, query a
+    literal with the opposite sign. Equality is not treated specially (its
+    arguments are not swapped).
+
+    >>> from tptp_lark_parser import TPTPParser
+    >>> tptp_parser = TPTPParser(extendable=True)
+    >>> clauses = tptp_parser.parse('''
+    ...     cnf(a, axiom, p(X, X)).
+    ...     cnf(b, axiom, p(f(Y), c) | ~p(Y, Y)).
+    ...     cnf(c, axiom, p(f(c), c) | p(c, f(Y))).
+    ... ''')
+    >>> index = LiteralIndex()
+    >>> for clause in clauses:
+    ...     for position, literal in enumerate(clause.literals):
+    ...         index.insert(literal, (clause.label, position))
+    >>> len(index)
+    5
+    >>> query = tptp_parser.parse("cnf(q, axiom, p(f(c), Z)).")[0].literals[0]
+    >>> sorted(index.unifiable(query))
+    [('a', 0), ('b', 0), ('c', 0)]
+    >>> sorted(index.generalizations(query)), index.instances(query)
+    ([('a', 0)], [('c', 0)])
+    >>> generalizes(clauses[0].literals[0], query)
+    False
+    >>> index.delete(clauses[0].literals[0], ("a", 0))
+    >>> index.unifiable(query), len(index)
+    ([('b', 0), ('c', 0)], 4)
+    >>> index.delete(clauses[0].literals[0], ("a", 0))
+    Traceback (most recent call last):
+     ...
+    KeyError: ('a', 0)
+    >>> for clause in clauses[1:]:
+    ...     for position, literal in enumerate(clause.literals):
+    ...         index.delete(literal, (clause.label, position))
+    >>> len(index), index.unifiable(query)
+    (0, [])
+    """
+
+    def __init__(self) -> None:
+        """Create an empty index."""
+        self._root = _Node()
+        self._size = 0
+
+    def insert(self, literal: Literal, value: _Value) -> None:
+        """
+        Add a literal.
+
+        :param literal: a literal to store
+        :param value: what to return when the literal is retrieved (e.g. a
+            clause and a position of the literal in it)
+        """
+        node = self._root
+        for key in _flatten(literal):
+            node = node.children.setdefault(key, _Node())
+        if value not in node.values:
+            node.values[value] = None
+            self._size += 1
+
+    def _path(self, keys: List[_Key], value: _Value) -> List[_Node]:
+        path = [self._root]
+        for key in keys:
+            child = path[-1].children.get(key)
+            if child is None:
+                raise KeyError(value)
+            path.append(child)
+        return path
+
+    def delete(self, literal: Literal, value: _Value) -> None:
+        """
+        Remove a literal (and the nodes left empty).
+
+        :param literal: a literal stored before
+        :param value: a value stored with it
+        :raises KeyError: if the literal is not stored with the value
+        """
+        keys = _flatten(literal)
+        path = self._path(keys, value)
+        del path[-1].values[value]
+        self._size -= 1
+        for parent, key, child in zip(
+            reversed(path[:-1]), reversed(keys), reversed(path[1:])
+        ):
+            if child.children or child.values:
+                break
+            del parent.children[key]
+
+    def _retrieve(self, literal: Literal, mode: int) -> List[_Value]:
+        keys = _flatten(literal)
+        ends = _subterm_ends(keys)
+        values: List[_Value] = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, position = stack.pop()
+            if position == len(keys):
+                values.extend(node.values)  # type: ignore
+            else:
+                stack.extend(_next_states(node, position, keys, ends, mode))
+        return values
+
+    def unifiable(self, literal: Literal) -> List[_Value]:
+        """
+        Find candidates for literals unifiable with a query.
+
+        :param literal: a query literal
+        :returns: values of the literals with the same sign which can be
+            unifiable with the query
+        """
+        return self._retrieve(literal, _UNIFIABLE)
+
+    def generalizations(self, literal: Literal) -> List[_Value]:
+        """
+        Find candidates for literals more general than a query.
+
+        :param literal: a query literal
+        :returns: values of the literals with the same sign which can have
+            the query as an instance
+        """
+        return self._retrieve(literal, _GENERALIZATIONS)
+
+    def instances(self, literal: Literal) -> List[_Value]:
+        """
+        Find candidates for instances of a query.
+
+        :param literal: a query literal
+        :returns: values of the literals with the same sign which can be
+            instances of the query
+        """
+        return self._retrieve(literal, _INSTANCES)
+
+    def __len__(self) -> int:
+        """
+        Count stored literals.
+
+        :returns: the number of literal and value pairs
+        """
+        return self._size
+
+
+def _resolve(bound: _Bound, bindings: Dict[Tuple[int, int], _Bound]) -> _Bound:
+    term, side = bound
+    while isinstance(term, Variable) and (side, term.index) in bindings:
+        term, side = bindings[side, term.index]
+    return term, side
+
+
+def _occurs(
+    variable: Tuple[int, int],
+    bound: _Bound,
+    bindings: Dict[Tuple[int, int], _Bound],
+) -> bool:
+    stack = [bound]
+    while stack:
+        term, side = _resolve(stack.pop(), bindings)
+        if isinstance(term, Function):
+            stack.extend((argument, side) for argument in term.arguments)
+        elif (side, term.index) == variable:
+            return True
+    return False
+
+
+def _bind(
+    variable: _Bound, bound: _Bound, bindings: Dict[Tuple[int, int], _Bound]
+) -> bool:
+    # the variable is resolved (not bound yet)
+    key = (variable[1], variable[0].index)
+    if bound == variable:
+        return True
+    if _occurs(key, bound, bindings):
+        return False
+    bindings[key] = bound
+    return True
+
+
+def _unify_pair(
+    left: _Bound,
+    right: _Bound,
+    bindings: Dict[Tuple[int, int], _Bound],
+    stack: List[Tuple[_Bound, _Bound]],
+) -> bool:
+    left, right = _resolve(left, bindings), _resolve(right, bindings)
+    if isinstance(left[0], Variable):
+        return _bind(left, right, bindings)
+    if isinstance(right[0], Variable):
+        return _bind(right, left, bindings)
+    if left[0].index != right[0].index or len(left[0].arguments) != len(
+        right[0].arguments
+    ):
+        return False
+    stack.extend(
+        ((first, left[1]), (second, right[1]))
+        for first, second in zip(left[0].arguments, right[0].arguments)
+    )
+    return True
+
+
+def _same_shape(first: Literal, second: Literal) -> bool:
+    return (
+        first.negated == second.negated
+        and first.atom.index == second.atom.index
+        and len(first.atom.arguments) == len(second.atom.arguments)
+    )
+
+
+def unifiable(first: Literal, second: Literal) -> bool:
+    """
+    Check whether two literals of the same sign have a common instance.
+
+    Variables of the literals are different even if they have the same
+    indices (as in literals of different clauses).
+
+    >>> from tptp_lark_parser import TPTPParser
+    >>> literals = [
+    ...     clause.literals[0]
+    ...     for clause in TPTPParser(extendable=True).parse('''
+    ...         cnf(a, axiom, p(X, f(X))).
+    ...         cnf(b, axiom, p(Y, Y)).
+    ...         cnf(c, axiom, p(f(Y), X)).
+    ...         cnf(d, axiom, ~p(f(Y), X)).
+    ...     ''')
+    ... ]
+    >>> [unifiable(literals[0], literal) for literal in literals]
+    [True, False, True, False]
+
+    :param first: a literal
+    :param second: another literal
+    :returns: whether there is a substitution making them equal
+    """
+    bindings: Dict[Tuple[int, int], _Bound] = {}
+    stack: List[Tuple[_Bound, _Bound]] = [
+        ((left, 0), (right, 1))
+        for left, right in zip(first.atom.arguments, second.atom.arguments)
+    ]
+    while stack:
+        if not _unify_pair(*stack.pop(), bindings, stack):
+            return False
+    return _same_shape(first, second)
+
+
+def generalizes(general: Literal, specific: Literal) -> bool:
+    """
+    Check whether a literal is an instance of another one.
+
+    >>> from tptp_lark_parser import TPTPParser
+    >>> general, specific, other = [
+    ...     clause.literals[0]
+    ...     for clause in TPTPParser(extendable=True).parse('''
+    ...         cnf(a, axiom, p(X, X)).
+    ...         cnf(b, axiom, p(f(Y), f(Y))).
+    ...         cnf(c, axiom, p(f(Y), Y)).
+    ...     ''')
+    ... ]
+    >>> generalizes(general, specific), generalizes(specific, general)
+    (True, False)
+    >>> [generalizes(general, other), generalizes(specific, other),
+    ...  generalizes(other, specific)]
+    [False, False, False]
+    >>> generalizes(general, general)
+    True
+
+    :param general: a literal
+    :param specific: another literal (of the same sign)
+    :returns: whether a substitution to the variables of ``general`` makes
+        it equal to ``specific``
+    """
+    substitution: Dict[int, Term] = {}
+    stack: List[Tuple[Term, Term]] = list(
+        zip(general.atom.arguments, specific.atom.arguments)
+    )
+    while stack:
+        pattern, term = stack.pop()
+        if isinstance(pattern, Variable):
+            if substitution.setdefault(pattern.index, term) != term:
+                return False
+        elif isinstance(term, Function) and _same_symbol(pattern, term):
+            stack.extend(zip(pattern.arguments, term.arguments))
+        else:
+            return False
+    return _same_shape(general, specific)
+
+
+def _same_symbol(first: Function, second: Function) -> bool:
+    return first.index == second.index and len(first.arguments) == len(
+        second.arguments
+    )
@@ -18,13 +18,49 @@ TPTP Parser
 ============
 """
 import os
+import re
 import sys
-from typing import Optional, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import chain
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+    cast,
+)
 
-from lark import Lark, Token
+from lark import Lark, Token, Tree
 
 from tptp_lark_parser.cnf_parser import CNFParser
-from tptp_lark_parser.grammar import Clause
+from tptp_lark_parser.fast_cnf_parser import FastCNFParser, ParsedStatement
+from tptp_lark_parser.file_source import FileSource, open_file_source
+from tptp_lark_parser.grammar import Clause, Include, InternTable
+from tptp_lark_parser.problem import Problem, Statement
+from tptp_lark_parser.problem_cache import (
+    ProblemCache,
+    content_key,
+    decode_problem,
+    encode_problem,
+)
+from tptp_lark_parser.profiling import (
+    ParseObserver,
+    count_clauses,
+    lex_and_parse,
+)
+from tptp_lark_parser.single_pass import SinglePassTransformer
+from tptp_lark_parser.statements import (
+    select_formulae,
+    split_statements,
+    statement_header,
+)
 
 if sys.version_info.major == 3 and sys.version_info.minor >= 9:
     # pylint: disable=no-name-in-module, import-error
@@ -32,9 +68,140 @@ if sys.version_info.major == 3 and sys.version_info.minor >= 9:
 else:  # pragma: no cover
     from importlib_resources import files  # pylint: disable=import-error
 
+# rules replaced in the full TPTP grammar by each grammar profile
+GRAMMAR_PROFILES: Dict[str, Dict[str, str]] = {
+    "full": {},
+    # only ``cnf`` statements and includes; the content of general lists
+    # (useful info, optional info, parent details) is skipped
+    "cnf": {
+        "annotated_formula": "cnf_annotated",
+        "general_list": '"[" _general_item* "]"',
+        "_general_item": (
+            '_GENERAL_TEXT | "[" _general_item* "]" | "(" _general_item* ")"'
+        ),
+        "_GENERAL_TEXT": (
+            r"""/([^\[\]()'"%]|'([^'\\]|\\.)*'|"([^"\\]|\\.)*")+/"""
+        ),
+    },
+}
+# a resolved file path, its modification time, size, and a formula
+# selection of an include directive
+_IncludeKey = Tuple[str, int, int, Optional[Tuple[str, ...]]]
+
+
+def _include(include: Tree) -> Include:
+    file_name, formula_selection = include.children
+    names = tuple(
+        str(name)
+        for name in cast(Tree, formula_selection).scan_values(
+            lambda value: isinstance(value, Token)
+        )
+    )
+    return Include(str(file_name).replace("'", ""), names or None)
+
+
+def _grammar_text(grammar: str) -> str:
+    r"""
+    Get the text of a grammar profile.
+
+    Profiles are derived from the full TPTP grammar by replacing some rules
+    (Lark drops the rules and terminals not reachable any more).
+
+    >>> print("\n".join(_grammar_text("cnf").splitlines()[-4:-2]))
+    annotated_formula : cnf_annotated
+    general_list : "[" _general_item* "]"
+    >>> _grammar_text("fof")
+    Traceback (most recent call last):
+     ...
+    ValueError: unknown grammar profile: fof
+
+    :param grammar: a name of a profile (one of ``GRAMMAR_PROFILES``)
+    :returns: the grammar in the Lark format
+    :raises ValueError: if the profile is unknown
+    """
+    if grammar not in GRAMMAR_PROFILES:
+        raise ValueError(f"unknown grammar profile: {grammar}")
+    # pylint: disable=unspecified-encoding
+    grammar_text = (
+        files("tptp_lark_parser")
+        .joinpath(os.path.join("resources", "TPTP.lark"))
+        .read_text()
+    )
+    for rule_name, rule in GRAMMAR_PROFILES[grammar].items():
+        grammar_text = re.sub(
+            rf"^{rule_name}\s*:.*$", "", grammar_text, flags=re.MULTILINE
+        )
+        grammar_text += f"\n{rule_name} : {rule}"
+    return grammar_text
+
+
+def _profile_cache(cache: Union[bool, str], grammar: str) -> Union[bool, str]:
+    """
+    Get a cache filename for a grammar profile.
+
+    Lark keeps one grammar in a cache file, so profiles sharing a file
+    would recompile and overwrite each other.
+
+    >>> cache = str(getfixture("tmp_path") / "parser.cache")  # noqa: F821
+    >>> for grammar in GRAMMAR_PROFILES:
+    ...     _ = _create_lark_parser(cache, grammar=grammar)
+    >>> sorted(os.listdir(os.path.dirname(cache)))
+    ['parser.cache', 'parser.cnf.cache']
+    >>> _profile_cache(True, "cnf")
+    True
+
+    :param cache: a value of the ``cache`` argument of ``TPTPParser``
+    :param grammar: a name of a grammar profile
+    :returns: the same value, but with the profile name added to a
+        filename for profiles other than the full one
+    """
+    if isinstance(cache, bool) or grammar == "full":
+        return cache
+    root, extension = os.path.splitext(cache)
+    return f"{root}.{grammar}{extension}"
+
+
+def _create_lark_parser(
+    cache: Union[bool, str],
+    transformer: Optional[Any] = None,
+    grammar: str = "full",
+) -> Lark:
+    """
+    Create a Lark parser for the TPTP grammar.
+
+    :param cache: ``True`` to keep the compiled parser in a temporary folder,
+        a filename to keep it there, ``False`` to compile it from scratch
+    :param transformer: callbacks to apply during LALR reductions
+    :param grammar: a name of a grammar profile
+    :returns: a LALR parser for the TPTP grammar
+    """
+    return Lark(
+        _grammar_text(grammar),
+        start="tptp_file",
+        parser="lalr",
+        cache=_profile_cache(cache, grammar),
+        transformer=transformer,
+    )
+
+
+@lru_cache(maxsize=None)
+def _get_lark_parser(cache: Union[bool, str], grammar: str = "full") -> Lark:
+    """
+    Get a Lark parser for the TPTP grammar shared by the whole process.
+
+    >>> _get_lark_parser(True) is _get_lark_parser(True)
+    True
+
+    :param cache: ``True`` to keep the compiled parser in a temporary folder,
+        a filename to keep it there, ``False`` to compile it from scratch
+    :param grammar: a name of a grammar profile
+    :returns: a LALR parser for the TPTP grammar
+    """
+    return _create_lark_parser(cache, grammar=grammar)
+
 
 # pylint: disable=too-few-public-methods
-class TPTPParser:
+class TPTPParser:  # pylint: disable=too-many-instance-attributes
     r"""
     TPTP parser.
 
@@ -77,41 +244,720 @@ class TPTPParser:
     cnf(this_is_a_test_case_2, hypothesis, ~this_is_a_test_case(test_constant)).
     cnf(test_axiom, axiom, test_constant = test_constant_2).
     cnf(test_axiom_2, axiom, ~test_constant = 0).
+    >>> TPTPParser(tptp_folder).parser is tptp_parser.parser
+    True
+    >>> single_pass_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, single_pass=True
+    ... )
+    >>> (
+    ...     list(map(single_pass_parser.cnf_parser.pretty_print,
+    ...         single_pass_parser.parse(tptp_text)))
+    ...     == list(map(tptp_parser.cnf_parser.pretty_print, parsed_clauses))
+    ... )
+    True
+    >>> local_parser = TPTPParser(
+    ...     extendable=True, single_pass=True, normalize_variables=True
+    ... )
+    >>> print(local_parser.cnf_parser.pretty_print(local_parser.parse(
+    ...     "fof(a, axiom, p(X)). cnf(b, axiom, p(Y) | q(Z, Y))."
+    ... )[0]))
+    cnf(b, axiom, p(X0) | q(X1, X0)).
+    >>> local_parser.cnf_parser.extendable = False
+    >>> local_parser.parse("cnf(c, axiom, p(A, B, unknown_symbol)).")
+    Traceback (most recent call last):
+     ...
+    ValueError: unknown symbol: unknown_symbol
+    >>> local_parser.parse("cnf(d, axiom, p(X)).")[0].literals[0].atom
+    Predicate(index=..., arguments=(Variable(index=0),))
+
+    Long lists of literals or arguments don't make the parse tree deep
+
+    >>> long_clause = tptp_parser.parse(
+    ...     "cnf(long, axiom, " + " | ".join(["p(X)"] * 5000) + ")."
+    ... )[0]
+    >>> len(long_clause.literals)
+    5000
+
+    and deep terms don't hit the recursion limit
+
+    >>> deep_term = "s(" * 5000 + "X" + ")" * 5000
+    >>> deep_clause = tptp_parser.parse(f"cnf(deep, axiom, p({deep_term})).")
+    >>> tptp_parser.cnf_parser.pretty_print(deep_clause[0]) == (
+    ...     f"cnf(deep, axiom, p({deep_term}))."
+    ... )
+    True
+
+    Plain clauses can be read by a faster hand-written parser (the rest is
+    left to Lark)
+
+    >>> fast_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, fast_cnf=True
+    ... )
+    >>> for clause in fast_parser.parse(
+    ...     "fof(a, axiom, p). cnf(b, axiom, p(1.5)). " + tptp_text
+    ... ):
+    ...     print(fast_parser.cnf_parser.pretty_print(clause))
+    cnf(b, axiom, p(1.5)).
+    cnf(this_is_a_test_case_1, hypothesis, this_is_a_test_case(test_constant), inference(resolution, [], [one, two])).
+    cnf(this_is_a_test_case_2, hypothesis, ~this_is_a_test_case(test_constant)).
+    cnf(test_axiom, axiom, test_constant = test_constant_2).
+    cnf(test_axiom_2, axiom, ~test_constant = 0).
+
+    A smaller grammar is enough for problems in CNF
+
+    >>> cnf_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, grammar="cnf"
+    ... )
+    >>> for clause in cnf_parser.parse(
+    ...     "cnf(a, axiom, p(X), inference(r, [status(thm), x([1])], [b, c]))."
+    ...     + tptp_text
+    ... ):
+    ...     print(cnf_parser.cnf_parser.pretty_print(clause))
+    cnf(a, axiom, p(X), inference(r, [], [b, c])).
+    cnf(this_is_a_test_case_1, hypothesis, this_is_a_test_case(test_constant), inference(resolution, [], [one, two])).
+    cnf(this_is_a_test_case_2, hypothesis, ~this_is_a_test_case(test_constant)).
+    cnf(test_axiom, axiom, test_constant = test_constant_2).
+    cnf(test_axiom_2, axiom, ~test_constant = 0).
+    >>> cnf_parser.parse("fof(a, axiom, p).")
+    Traceback (most recent call last):
+     ...
+    lark.exceptions.UnexpectedToken: Unexpected token Token(..., 'fof') ...
+
+    Equal terms, predicates and literals can be shared
+
+    >>> from tptp_lark_parser.grammar import InternTable
+    >>> sharing_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, intern_table=InternTable()
+    ... )
+    >>> first, second = sharing_parser.parse(tptp_text)[:2]
+    >>> first.literals[0].atom is second.literals[0].atom
+    True
+
+    Included files are parsed only once per parser (while they don't change)
+
+    >>> tptp_parser.parse(tptp_text)[2] is parsed_clauses[2]
+    True
+    >>> temp_folder = getfixture("tmp_path")  # noqa: F821
+    >>> for i in range(3):
+    ...     _ = (temp_folder / f"{i}.ax").write_text(
+    ...         f"cnf(a{i}, axiom, p(X)). cnf(b{i}, axiom, q(X))."
+    ...     )
+    >>> small_cache_parser = TPTPParser(
+    ...     str(temp_folder), True, include_cache_size=4
+    ... )
+    >>> clauses = small_cache_parser.parse(
+    ...     "include('0.ax'). include('1.ax'). include('2.ax')."
+    ... )
+    >>> [clause.label for clause in clauses]
+    ['a0', 'b0', 'a1', 'b1', 'a2', 'b2']
+    >>> [
+    ...     os.path.basename(key[0])
+    ...     for key in small_cache_parser._include_cache.keys()
+    ... ]
+    ['1.ax', '2.ax']
+    >>> len(TPTPParser(
+    ...     str(temp_folder), True, include_cache_size=1
+    ... ).parse("include('0.ax').")) == 2
+    True
+
+    Only the formulae selected by an include directive are taken from the
+    included file, and the others are not even parsed
+
+    >>> _ = (temp_folder / "3.ax").write_text(
+    ...     "cnf(good, axiom, p(X)). cnf(broken, axiom, p(X) |)."
+    ... )
+    >>> selection = (
+    ...     "include('0.ax', [b0]). include('1.ax', ['a1', b1]). "
+    ...     "include('3.ax', [good]). include('0.ax')."
+    ... )
+    >>> for options in (
+    ...     {}, {"single_pass": True}, {"fast_cnf": True}, {"grammar": "cnf"}
+    ... ):
+    ...     selecting_parser = TPTPParser(str(temp_folder), True, **options)
+    ...     print([
+    ...         clause.label for clause in selecting_parser.parse(selection)
+    ...     ])
+    ['b0', 'a1', 'b1', 'good', 'a0', 'b0']
+    ['b0', 'a1', 'b1', 'good', 'a0', 'b0']
+    ['b0', 'a1', 'b1', 'good', 'a0', 'b0']
+    ['b0', 'a1', 'b1', 'good', 'a0', 'b0']
+
+    Parsed problems can be kept on disk and shared by processes
+
+    >>> from tptp_lark_parser.problem_cache import ProblemCache
+    >>> problem_cache = ProblemCache(str(temp_folder / "cache"))
+    >>> first_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, problem_cache=problem_cache
+    ... )
+    >>> clauses = first_parser.parse(tptp_text)
+    >>> len(os.listdir(temp_folder / "cache"))
+    2
+    >>> from unittest.mock import patch
+    >>> cached_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, problem_cache=problem_cache
+    ... )
+    >>> with patch.object(TPTPParser, "_parse_text", side_effect=Exception):
+    ...     cached_parser.parse(tptp_text) == clauses
+    True
+    >>> _ = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, problem_cache=problem_cache,
+    ...     fast_cnf=True,
+    ... ).parse(tptp_text)
+    >>> len(os.listdir(temp_folder / "cache"))
+    4
+    >>> (
+    ...     cached_parser.cnf_parser.symbol_table.to_dict()
+    ...     == first_parser.cnf_parser.symbol_table.to_dict()
+    ... )
+    True
+    >>> for entry in (temp_folder / "cache").iterdir():
+    ...     _ = entry.write_bytes(b"broken")
+    >>> with patch.object(ProblemCache, "put"):
+    ...     TPTPParser(
+    ...         tptp_folder, True, tokens_filename, problem_cache=problem_cache
+    ...     ).parse(tptp_text) == clauses
+    True
+    >>> len(os.listdir(temp_folder / "cache"))
+    2
+    >>> _ = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, problem_cache=problem_cache
+    ... ).parse(tptp_text)
+    >>> nested_text = (
+    ...     "cnf(n, axiom, p(X), "
+    ...     "inference(r, [], [b, inference(s, [], [d])]))."
+    ... )
+    >>> nested = first_parser.parse(nested_text)
+    >>> with patch.object(TPTPParser, "_parse_text", side_effect=Exception):
+    ...     cached_parser.parse(nested_text) == nested
+    True
+    >>> nested[0].inference_parents
+    ('b', {'inference_record': ('s', ('d',))})
+
+    Problems and included files can be read from an archive without
+    extracting it. The parser closes an archive it opened
+
+    >>> import tarfile
+    >>> with tarfile.open(temp_folder / "TPTP.tgz", "w:gz") as archive:
+    ...     archive.add(tptp_folder, "TPTP-v0.0.0")
+    >>> with TPTPParser(
+    ...     str(temp_folder / "TPTP.tgz"), True, tokens_filename
+    ... ) as archive_parser:
+    ...     list(map(archive_parser.cnf_parser.pretty_print,
+    ...         archive_parser.parse_file("Problems/TST/TST001-1.p")
+    ...     )) == list(map(tptp_parser.cnf_parser.pretty_print,
+    ...         parsed_clauses))
+    True
+    >>> archive_parser.file_source.glob("Problems/*/*.p")
+    ['Problems/TST/TST001-1.p']
+    >>> archive_parser.file_source.read_text("Problems/TST/TST001-1.p")
+    Traceback (most recent call last):
+     ...
+    OSError: TarFile is closed
+
+    but not a file source given to it
+
+    >>> from tptp_lark_parser.file_source import open_file_source
+    >>> file_source = open_file_source(str(temp_folder / "TPTP.tgz"))
+    >>> with TPTPParser(file_source, True, tokens_filename) as archive_parser:
+    ...     clauses = archive_parser.parse_file("Problems/TST/TST001-1.p")
+    >>> file_source.read_text("Problems/TST/TST001-1.p").startswith("%")
+    True
+    >>> file_source.close()
+
+    Time and work spent in each phase of parsing can be measured
+
+    >>> from tptp_lark_parser.profiling import ParseStats
+    >>> stats = ParseStats()
+    >>> profiled_parser = TPTPParser(
+    ...     tptp_folder, True, tokens_filename, observer=stats
+    ... )
+    >>> for _ in range(2):
+    ...     clauses = profiled_parser.parse_file("Problems/TST/TST001-1.p")
+    >>> for phase, phase_stats in stats.phases.items():
+    ...     print(phase, phase_stats.calls, phase_stats.bytes,
+    ...         phase_stats.tokens, phase_stats.clauses, phase_stats.terms,
+    ...         phase_stats.new_symbols, phase_stats.cache_hits)
+    read 3 790 0 0 0 0 0
+    lex 3 0 122 0 0 0 0
+    parse 3 0 0 0 0 0 0
+    transform 3 0 0 6 8 5 0
+    include 2 0 0 0 0 0 1
+    >>> stats.files["Axioms/TST001-0.ax"]["transform"].clauses
+    2
+    >>> for options in (
+    ...     {"single_pass": True},
+    ...     {"fast_cnf": True},
+    ...     {"problem_cache": problem_cache},
+    ... ):
+    ...     stats = ParseStats()
+    ...     _ = TPTPParser(
+    ...         tptp_folder, True, tokens_filename, observer=stats, **options
+    ...     ).parse_file("Problems/TST/TST001-1.p")
+    ...     print(list(stats.phases))
+    ['read', 'single_pass', 'include']
+    ['read', 'fast_cnf', 'include']
+    ['read', 'problem_cache', 'include']
+
+    Clauses can be parsed only when they are needed
+
+    >>> problem = tptp_parser.lazy_parse(tptp_text)
+    >>> len(problem), problem.parsed
+    (4, 0)
+    >>> problem.labels
+    ('this_is_a_test_case_1', 'this_is_a_test_case_2', 'test_axiom', 'test_axiom_2')
+    >>> problem.roles, problem.includes
+    (('hypothesis', 'hypothesis', 'axiom', 'axiom'),
+     (Include(file_name='Axioms/TST001-0.ax', formula_selection=None),))
+    >>> print(tptp_parser.cnf_parser.pretty_print(problem[2]))
+    cnf(test_axiom, axiom, test_constant = test_constant_2).
+    >>> problem.parsed
+    1
+    >>> problem.materialize() == tptp_parser.parse(tptp_text)
+    True
+    >>> selected = TPTPParser(str(temp_folder), True).lazy_parse(selection)
+    >>> selected.labels, selected.parsed
+    (('b0', 'a1', 'b1', 'good', 'a0', 'b0'), 0)
+
+    Big files can be read statement by statement
+
+    >>> for item in tptp_parser.iter_parse(
+    ...     os.path.join(tptp_folder, "Problems", "TST", "TST001-1.p"),
+    ...     chunk_size=16
+    ... ):
+    ...     print(
+    ...         item if isinstance(item, Include)
+    ...         else tptp_parser.cnf_parser.pretty_print(item)
+    ...     )
+    Include(file_name='Axioms/TST001-0.ax', formula_selection=None)
+    cnf(this_is_a_test_case_1, hypothesis, this_is_a_test_case(test_constant), inference(resolution, [], [one, two])).
+    cnf(this_is_a_test_case_2, hypothesis, ~this_is_a_test_case(test_constant)).
+    >>> from io import StringIO
+    >>> list(tptp_parser.iter_parse(StringIO("cnf(a, axiom, $false).")))
+    [Clause(literals=(), label='a', role='axiom', ...)]
     """
 
+    # a file being parsed (reported to the observer)
+    _file_name = ""
+    # a total number of clauses in the include cache
+    _include_cache_clauses = 0
+    # whether the parser opened its file source (and so closes it)
+    _owns_file_source = False
     _tokens_from_resources = str(
         files("tptp_lark_parser").joinpath(
             os.path.join("resources", "tptp_tokens.json")
         )
     )
 
+    # pylint: disable=too-many-arguments
     def __init__(
         self,
-        tptp_folder: str = ".",
+        tptp_folder: Union[str, "os.PathLike[str]", FileSource] = ".",
         extendable: bool = False,
         tokens_filename: Optional[str] = _tokens_from_resources,
+        *,
+        cache: Union[bool, str] = True,
+        single_pass: bool = False,
+        include_cache_size: Optional[int] = None,
+        normalize_variables: bool = False,
+        intern_table: Optional[InternTable] = None,
+        fast_cnf: bool = False,
+        grammar: str = "full",
+        problem_cache: Optional[ProblemCache] = None,
+        observer: Optional[ParseObserver] = None,
     ):
         """
         Create a parser.
 
-        We create a Lark parser based on the grammar file from package's
-        resources.
+        We use a Lark parser based on the grammar file from package's
+        resources. The compiled parser is stored on disk (keyed on the
+        grammar, Lark and Python versions) and shared by all ``TPTPParser``
+        instances of a process, so only the first one pays for building it.
 
-        :param tptp_folder: a folder containing TPTP database
+        :param tptp_folder: a folder containing TPTP database, an archive
+            of it (``.zip`` or ``.tar`` possibly compressed), or a
+            ``FileSource`` to read problems and included files from
         :param extendable: when set to ``False``, the parser fails
             when encounters new symbols
         :param tokens_filename: a filename of known tokens storage
+        :param cache: ``True`` to keep the compiled parser in a temporary
+            folder, a filename to keep it there (with the profile name added
+            for profiles other than the full one), ``False`` to compile it
+            from the grammar without touching the disk
+        :param single_pass: when set to ``True``, ``CNFParser`` callbacks are
+            called during parsing, so no intermediate parse tree is built.
+            In this mode symbols from ``fof`` formulae are also looked up and
+            unknown symbols raise ``ValueError`` instead of ``VisitError``
+        :param include_cache_size: a maximal total number of clauses from
+            included files to keep for reuse (the least recently used files
+            are forgotten first). ``None`` means no limit, ``0`` disables the
+            cache
+        :param normalize_variables: when set to ``True``, variables are
+            numbered in each clause separately (see ``CNFParser``)
+        :param intern_table: a table for sharing equal terms, predicates and
+            literals (one table can be used by several parsers)
+        :param fast_cnf: when set to ``True``, statements are parsed one by
+            one, and ``FastCNFParser`` is tried first for each of them
+            (falling back to the Lark parser for what it doesn't support)
+        :param grammar: ``"full"`` for the whole TPTP grammar or ``"cnf"``
+            for a smaller one, which accepts only ``cnf`` statements and
+            includes and skips the content of general lists in annotations
+        :param problem_cache: a folder to keep parsed problems (and included
+            files) in. Entries are keyed by the text, the grammar, the
+            parser's settings and the symbols known before parsing. They are
+            not used when ``CNFParser.variable_names`` are collected
+        :param observer: an object to notify of the time and the amount of
+            work spent in each phase of parsing (see ``ParseStats``). Without
+            it, nothing is measured
+        """
+        self.parser = _get_lark_parser(cache, grammar)
+        self.file_source = self._open_file_source(tptp_folder)
+        self.cnf_parser = CNFParser(
+            tokens_filename,
+            extendable,
+            normalize_variables=normalize_variables,
+            intern_table=intern_table,
+        )
+        self.single_pass_parser = (
+            _create_lark_parser(
+                cache, SinglePassTransformer(self.cnf_parser), grammar
+            )
+            if single_pass
+            else None
+        )
+        self.fast_cnf_parser = (
+            FastCNFParser(self.cnf_parser) if fast_cnf else None
+        )
+        self.include_cache_size = include_cache_size
+        self._include_cache: "OrderedDict[_IncludeKey, Tuple[Clause, ...]]" = (
+            OrderedDict()
+        )
+        self.problem_cache = problem_cache
+        self.observer = observer
+
+    @property
+    def tptp_folder(self) -> Union[str, "os.PathLike[str]"]:
+        """
+        A folder or an archive containing TPTP database.
+
+        :returns: the path of the parser's file source
+        """
+        return self.file_source.path
+
+    def _open_file_source(
+        self, tptp_folder: Union[str, "os.PathLike[str]", FileSource]
+    ) -> FileSource:
+        # a file source given by the caller is closed by the caller
+        self._owns_file_source = not isinstance(tptp_folder, FileSource)
+        return open_file_source(tptp_folder)
+
+    def close(self) -> None:
+        """Close an archive the parser opened (if any)."""
+        if self._owns_file_source:
+            self.file_source.close()
+
+    def __enter__(self) -> "TPTPParser":
+        """
+        Use the parser as a context manager.
+
+        :returns: the parser itself
         """
-        # pylint: disable=unspecified-encoding
-        self.parser = Lark(
-            files("tptp_lark_parser")
-            .joinpath(os.path.join("resources", "TPTP.lark"))
-            .read_text(),
-            start="tptp_file",
-            parser="lalr",
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        """
+        Close the parser.
+
+        :param exc_type: a type of the exception raised (if any)
+        :param exc_value: the exception raised
+        :param traceback: the exception's traceback
+        """
+        self.close()
+
+    def _cache_key(self, tptp_text: str) -> str:
+        return content_key(
+            self.parser.source_grammar,
+            f"{self.cnf_parser.extendable} "
+            f"{self.cnf_parser.normalize_variables} "
+            f"{self.single_pass_parser is not None} "
+            f"{self.fast_cnf_parser is not None}",
+            self.cnf_parser.symbol_table.digest(),
+            tptp_text,
+        )
+
+    def _load_cached(
+        self, problem_cache: ProblemCache, key: str
+    ) -> Optional[ParsedStatement]:
+        data = problem_cache.get(key)
+        if data is None:
+            return None
+        try:
+            clauses, includes, new_symbols = decode_problem(
+                data, self.cnf_parser.intern_table
+            )
+        except ValueError:
+            problem_cache.remove(key)
+            return None
+        self.cnf_parser.symbol_table.update(new_symbols)
+        return clauses, includes
+
+    def _notify(self, phase: str, seconds: float, **counts: int) -> None:
+        if self.observer is not None:
+            self.observer.on_phase(phase, self._file_name, seconds, counts)
+
+    def _observe_clauses(
+        self, phase: str, parse: Callable[[Any], Any], argument: Any
+    ) -> Any:
+        symbol_counts = self.cnf_parser.symbol_table.counts()
+        start = perf_counter()
+        parsed = parse(argument)
+        seconds = perf_counter() - start
+        if parsed is not None:
+            counts = count_clauses(parsed[0])
+            counts["new_symbols"] = sum(
+                self.cnf_parser.symbol_table.counts().values()
+            ) - sum(symbol_counts.values())
+            self._notify(phase, seconds, **counts)
+        return parsed
+
+    def _parse_cached(self, tptp_text: str) -> ParsedStatement:
+        if (
+            self.problem_cache is None
+            or self.cnf_parser.variable_names is not None
+        ):
+            return self._parse_text(tptp_text)
+        key = self._cache_key(tptp_text)
+        start = perf_counter()
+        parsed = self._load_cached(self.problem_cache, key)
+        self._notify(
+            "problem_cache",
+            perf_counter() - start,
+            cache_hits=int(parsed is not None),
         )
-        self.tptp_folder = tptp_folder
-        self.cnf_parser = CNFParser(tokens_filename, extendable)
+        if parsed is None:
+            parsed = self._parse_and_store(self.problem_cache, key, tptp_text)
+        return parsed
+
+    def _parse_and_store(
+        self, problem_cache: ProblemCache, key: str, tptp_text: str
+    ) -> ParsedStatement:
+        counts = self.cnf_parser.symbol_table.counts()
+        parsed = self._parse_text(tptp_text)
+        problem_cache.put(
+            key,
+            encode_problem(
+                *parsed, self.cnf_parser.symbol_table.new_symbols(counts)
+            ),
+        )
+        return parsed
+
+    def _parse_text(self, tptp_text: str) -> ParsedStatement:
+        if self.fast_cnf_parser is None:
+            return self._parse_with_lark(tptp_text)
+        clauses: List[Clause] = []
+        includes: List[Include] = []
+        for statement in split_statements((tptp_text,)):
+            parsed = (
+                self.fast_cnf_parser.parse(statement)
+                if self.observer is None
+                else self._observe_clauses(
+                    "fast_cnf", self.fast_cnf_parser.parse, statement
+                )
+            )
+            if parsed is None:
+                parsed = self._parse_with_lark(statement)
+            clauses.extend(parsed[0])
+            includes.extend(parsed[1])
+        return tuple(clauses), tuple(includes)
+
+    def _parse_with_lark(self, tptp_text: str) -> ParsedStatement:
+        if self.single_pass_parser is not None:
+            # a failed parse can leave variables of an unfinished clause
+            self.cnf_parser.reset_variables()
+            if self.observer is None:
+                return self.single_pass_parser.parse(tptp_text)  # type: ignore
+            return self._observe_clauses(
+                "single_pass", self.single_pass_parser.parse, tptp_text
+            )
+        if self.observer is None:
+            return self._transform(self.parser.parse(tptp_text))
+        return self._observe_clauses(
+            "transform", self._transform, self._lex_and_parse(tptp_text)
+        )
+
+    def _lex_and_parse(self, tptp_text: str) -> Tree:
+        start = perf_counter()
+        problem_tree, tokens, lex_seconds = lex_and_parse(
+            self.parser, tptp_text
+        )
+        seconds = perf_counter() - start
+        self._notify("lex", lex_seconds, tokens=tokens)
+        self._notify("parse", seconds - lex_seconds)
+        return problem_tree
+
+    def _transform(self, problem_tree: Tree) -> ParsedStatement:
+        return tuple(
+            self.cnf_parser.transform(cnf_formula)
+            for cnf_formula in problem_tree.find_data("cnf_annotated")
+        ), tuple(
+            _include(include)
+            for include in problem_tree.find_data("include")
+            if isinstance(include.children[0], Token)
+        )
+
+    def _cache_include(
+        self, key: _IncludeKey, clauses: Tuple[Clause, ...]
+    ) -> None:
+        if (
+            self.include_cache_size is not None
+            and len(clauses) > self.include_cache_size
+        ):
+            return
+        self._include_cache[key] = clauses
+        self._include_cache_clauses += len(clauses)
+        while (
+            self.include_cache_size is not None
+            and self._include_cache_clauses > self.include_cache_size
+        ):
+            _, evicted = self._include_cache.popitem(last=False)
+            self._include_cache_clauses -= len(evicted)
+
+    def clear_include_cache(self) -> None:
+        """Forget included files parsed (e.g. when their symbols are gone)."""
+        self._include_cache.clear()
+        self._include_cache_clauses = 0
+
+    def _find_include(
+        self, include: Include
+    ) -> Tuple[_IncludeKey, Optional[Tuple[Clause, ...]]]:
+        start = perf_counter()
+        key = self.file_source.file_key(include.file_name) + (
+            include.formula_selection,
+        )
+        clauses = self._include_cache.get(key)
+        self._notify(
+            "include",
+            perf_counter() - start,
+            cache_hits=int(clauses is not None),
+        )
+        return key, clauses
+
+    def _parse_include(self, include: Include) -> Tuple[Clause, ...]:
+        key, clauses = self._find_include(include)
+        if clauses is not None:
+            self._include_cache.move_to_end(key)
+            return clauses
+        clauses = self.parse_file(include.file_name, include.formula_selection)
+        self._cache_include(key, clauses)
+        return clauses
+
+    def iter_parse(
+        self,
+        tptp_file: Union[str, "os.PathLike[str]", TextIO],
+        chunk_size: int = 1 << 16,
+    ) -> Iterator[Union[Clause, Include]]:
+        """
+        Parse a TPTP file statement by statement.
+
+        Only one statement at a time is kept in memory. Included files are
+        not parsed but reported to the caller.
+
+        :param tptp_file: a TPTP file name or a file object to read from
+        :param chunk_size: how many characters to read at once
+        :returns: an iterator over clauses and include directives in the
+            order of their appearance
+        """
+        if isinstance(tptp_file, (str, os.PathLike)):
+            with open(tptp_file, "r", encoding="utf-8") as opened_file:
+                yield from self.iter_parse(opened_file, chunk_size)
+            return
+        for statement in split_statements(
+            iter(lambda: tptp_file.read(chunk_size), "")  # type: ignore
+        ):
+            clauses, includes = self._parse_text(statement)
+            yield from clauses
+            yield from includes
+
+    def _read_file(
+        self, file_name: str, formula_selection: Optional[Tuple[str, ...]]
+    ) -> str:
+        start = perf_counter()
+        tptp_text = self.file_source.read_text(file_name)
+        if self.observer is not None:
+            self._notify(
+                "read", perf_counter() - start, bytes=len(tptp_text.encode())
+            )
+        if formula_selection is None:
+            return tptp_text
+        start = perf_counter()
+        selected_text = select_formulae(tptp_text, formula_selection)
+        self._notify("select", perf_counter() - start)
+        return selected_text
+
+    def parse_file(
+        self,
+        file_name: str,
+        formula_selection: Optional[Tuple[str, ...]] = None,
+    ) -> Tuple[Clause, ...]:
+        """
+        Read and recursively parse a TPTP problem (or axioms) file.
+
+        :param file_name: a file name relative to the TPTP folder
+        :param formula_selection: names of the annotated formulae to parse
+            (as in an include directive). The others are skipped without
+            parsing them. Include directives of the file are always followed
+            (with their own selections)
+        :returns: a list of clauses (including those of the axioms)
+        """
+        outer_file_name, self._file_name = self._file_name, file_name
+        try:
+            return self.parse(self._read_file(file_name, formula_selection))
+        finally:
+            self._file_name = outer_file_name
+
+    def _parse_statement(self, statement: str) -> Clause:
+        return self._parse_text(statement)[0][0]
+
+    def _collect_statements(
+        self,
+        tptp_text: str,
+        statements: List[Statement],
+        includes: List[Include],
+    ) -> None:
+        file_includes: List[Include] = []
+        for statement in split_statements((tptp_text,)):
+            keyword, name, role = statement_header(statement)
+            if keyword == "cnf":
+                statements.append((statement, name, role))
+            elif keyword == "include":
+                file_includes.extend(self._parse_text(statement)[1])
+        includes.extend(file_includes)
+        for include in file_includes:
+            self._collect_statements(
+                self._read_file(include.file_name, include.formula_selection),
+                statements,
+                includes,
+            )
+
+    def lazy_parse(self, tptp_text: str) -> Problem:
+        """
+        Split a TPTP problem into clauses to be parsed on demand.
+
+        The problem and the included files are read and split into
+        statements at once, but only include directives are parsed. A
+        clause is parsed when it's accessed, so its syntax errors and
+        unknown symbols are found only then, and new symbols get their IDs
+        in the order of access (``Problem.materialize`` gives the same
+        clauses as ``parse``). Statements other than ``cnf`` and includes
+        are skipped. The caches of parsed problems and included files are
+        not used.
+
+        :param tptp_text: a text of a problem (or axioms) file
+        :returns: a sequence of clauses (including those of the axioms)
+        """
+        statements: List[Statement] = []
+        includes: List[Include] = []
+        self._collect_statements(tptp_text, statements, includes)
+        return Problem(statements, includes, self._parse_statement)
 
     def parse(self, tptp_text: str) -> Tuple[Clause, ...]:
         """
@@ -120,20 +966,9 @@ class TPTPParser:
         :param tptp_text: a name of a problem (or axioms) file
         :returns: a list of clauses (including those of the axioms)
         """
-        problem_tree = self.parser.parse(tptp_text)
-        clauses = tuple(
-            self.cnf_parser.transform(cnf_formula)
-            for cnf_formula in problem_tree.find_data("cnf_annotated")
+        clauses, includes = self._parse_cached(tptp_text)
+        if not includes:
+            return clauses
+        return clauses + tuple(
+            chain.from_iterable(map(self._parse_include, includes))
         )
-        for include in problem_tree.find_data("include"):
-            token = include.children[0]
-            if isinstance(token, Token):
-                with open(
-                    os.path.join(
-                        self.tptp_folder, token.value.replace("'", "")
-                    ),
-                    "r",
-                    encoding="utf-8",
-                ) as included_file:
-                    clauses = clauses + self.parse(included_file.read())
-        return clauses